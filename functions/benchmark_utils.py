@@ -0,0 +1,477 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from networkclass import NetworkManager, NetworkEngine, NestedAverage
+from functions.exploration_utils import regionSearch, regionGrowing, regionGrowingReference
+from functions.contours_utils import contour_intersect, contour_intersect_reference
+from functions.phantom_utils import make_phantom, score_network
+from functions.profiling_utils import EngineProfiler
+
+# Best wall time of repeat calls of function, outputs printed by the function are dropped
+def time_function(function,repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            best = min(best,time.perf_counter()-start)
+    return best,result
+
+# Network of branch_count tubes going down the volume with a random walk, areas are contours found on drawn circles
+def make_synthetic_network(shape,branch_count=8,radius_range=(4,12),seed=0):
+    rng = np.random.default_rng(seed)
+    depth, height, width = shape
+    network_manager = NetworkManager(depth)
+    canvas = np.zeros((height,width),dtype=np.uint8)
+    for branch in range(branch_count):
+        branch_id = branch if branch == 0 else network_manager.get_new_branch(0)
+        x, y = rng.integers(radius_range[1],width-radius_range[1]), rng.integers(radius_range[1],height-radius_range[1])
+        radius = rng.integers(*radius_range)
+        start = depth-1 if branch == 0 else rng.integers(depth//2,depth)
+        for z in range(start,-1,-1):
+            x = int(np.clip(x+rng.integers(-1,2),radius,width-radius-1))
+            y = int(np.clip(y+rng.integers(-1,2),radius,height-radius-1))
+            canvas[:] = 0
+            cv2.circle(canvas,(x,y),int(radius),255,-1)
+            contours, _ = cv2.findContours(canvas,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)
+            network_manager.append_to_network(z,branch_id,contours[0],False)
+    return network_manager
+
+# Compare generate3DImages with the point by point reference on a synthetic network
+def benchmark_generate3DImages(shape=(400,256,256),branch_count=8,repeat=3,seed=0):
+    network_manager = make_synthetic_network(shape,branch_count,seed=seed)
+    reference_seconds,reference = time_function(lambda: network_manager.generate3DImagesReference(shape),repeat)
+    seconds,images = time_function(lambda: network_manager.generate3DImages(shape),repeat)
+    filled_seconds,_ = time_function(lambda: network_manager.generate3DImages(shape,filled=True),repeat)
+    return {
+        "shape": list(shape),
+        "branch_count": branch_count,
+        "areas": len(network_manager.store),
+        "reference_seconds": reference_seconds,
+        "seconds": seconds,
+        "filled_seconds": filled_seconds,
+        "speedup": reference_seconds/seconds,
+        "identical": all(np.array_equal(a,b) for a,b in zip(images,reference)),
+    }
+
+# Time per call of regionGrowing and of the pixel by pixel regionGrowingReference on a noisy slice holding one vessel of each radius
+def benchmark_regionGrowing(slice_size=512,radii=(4,10,25),repeat=3,seed=0):
+    rng = np.random.default_rng(seed)
+    results = list()
+    for radius in radii:
+        zslice = np.clip(20+8*rng.standard_normal((slice_size,slice_size)),0,255).astype(np.uint8)
+        center = (slice_size//2,slice_size//2)
+        cv2.circle(zslice,center,radius,170,-1)
+        nested_intensity = NestedAverage([170],10,170,1)
+        reference_seconds,reference = time_function(lambda: regionGrowingReference(zslice,center,nested_intensity,radius,0.6),repeat)
+        seconds,result = time_function(lambda: regionGrowing(zslice,center,nested_intensity,radius,0.6),repeat)
+        results.append({
+            "radius": radius,
+            "reference_seconds": reference_seconds,
+            "seconds": seconds,
+            "speedup": reference_seconds/seconds,
+            "identical": result[1] == reference[1] and np.array_equal(result[0],reference[0]),
+        })
+    return {"slice_size": slice_size,"results": results}
+
+# Closed contour of point_count points on a circle, points are about one pixel apart as in the contours of regionGrowing
+def circle_contour(center,point_count):
+    radius = point_count/(2*np.pi)
+    angles = np.linspace(0,2*np.pi,point_count,endpoint=False)
+    points = np.stack([center[0]+radius*np.cos(angles),center[1]+radius*np.sin(angles)],axis=1)
+    return np.round(points).astype(np.int32).reshape(-1,1,2)
+
+# Time per call of contour_intersect and of the point by point contour_intersect_reference on circle contours of each size, for
+# disjoint circles (rejected by the bounding boxes), crossing circles and circles whose borders are more than 1 pixel apart
+# but whose bounding boxes overlap (every segment test is done)
+def benchmark_contour_intersect(point_counts=(50,100,200,400),repeat=3):
+    results = list()
+    for point_count in point_counts:
+        radius = point_count/(2*np.pi)
+        # Coordinates stay below 256, contour_intersect casts the first query point to uint8 for its inclusion test
+        center = radius+2
+        cnt_ref = circle_contour((center,center),point_count)
+        queries = {
+            "disjoint": circle_contour((center,center+2.5*radius),point_count),
+            "crossing": circle_contour((center+radius,center),point_count),
+            "close": circle_contour((center+1.6*radius,center+1.6*radius),point_count),
+        }
+        for case,cnt_query in queries.items():
+            reference_seconds,reference = time_function(lambda: contour_intersect_reference(cnt_ref,cnt_query),repeat)
+            seconds,result = time_function(lambda: contour_intersect(cnt_ref,cnt_query),repeat)
+            results.append({
+                "points": point_count,
+                "case": case,
+                "reference_seconds": reference_seconds,
+                "seconds": seconds,
+                "speedup": reference_seconds/seconds,
+                "identical": result == reference,
+            })
+    return {"results": results}
+
+# Network of branch_count branches with one small circle area per slice on a random continuous range of depths, some areas are
+# predicted. The contours are not realistic, it is only used to time the branch lookups of NetworkManager
+def make_index_network(depth=2000,branch_count=300,seed=0):
+    rng = np.random.default_rng(seed)
+    network_manager = NetworkManager(depth)
+    contour = circle_contour((20,20),50)
+    for branch in range(branch_count):
+        branch_id = branch if branch == 0 else network_manager.get_new_branch(0)
+        start = depth-1 if branch == 0 else int(rng.integers(depth//4,depth))
+        stop = 0 if branch == 0 else int(rng.integers(0,start+1))
+        for z in range(start,stop-1,-1):
+            network_manager.append_to_network(z,branch_id,contour,bool(rng.random() < 0.1))
+    return network_manager
+
+# Areas of a branch found by scanning the network lists from the top, the lookup NetworkManager did before its branch index
+def scan_branch(network_manager,branch_id):
+    branch = list()
+    offset = 0
+    for i in reversed(range(len(network_manager.network))):
+        area = next((area for area in network_manager.network[i] if area.branch_id == branch_id),None)
+        if len(branch) == 0:
+            offset = i
+        if area is not None:
+            branch.append(area)
+        elif len(branch) > 0:
+            break
+    return branch,offset
+
+# Time the branch lookups of NetworkManager (get_branch, get_last_from_branch and get_predicted_percentage of every branch) against
+# the network scan they replaced, then the removal of half of the branches
+def benchmark_branch_index(depth=2000,branch_count=300,repeat=3,seed=0):
+    network_manager = make_index_network(depth,branch_count,seed)
+    branch_ids = list(network_manager.branch_list)
+    def lookups():
+        return [(network_manager.get_branch(branch_id),network_manager.get_last_from_branch(branch_id),
+                 network_manager.get_predicted_percentage(branch_id)) for branch_id in branch_ids]
+    seconds,results = time_function(lookups,repeat)
+    # The scan takes seconds per call, it is timed once
+    scan_seconds,scanned = time_function(lambda: [scan_branch(network_manager,branch_id) for branch_id in branch_ids],1)
+    def remove_half():
+        copied = copy.deepcopy(network_manager)
+        start = time.perf_counter()
+        for branch_id in branch_ids[1::2]:
+            copied.remove_branch(branch_id)
+        return time.perf_counter()-start
+    remove_seconds = min(remove_half() for _ in range(repeat))
+    return {
+        "depth": depth,
+        "branch_count": len(branch_ids),
+        "areas": len(network_manager.store),
+        "lookup_seconds": seconds,
+        "scan_seconds": scan_seconds,
+        "speedup": scan_seconds/seconds,
+        "identical": all([area.index for area in result[0][0]] == [area.index for area in scan[0]] and result[0][1] == scan[1]
+                         for result,scan in zip(results,scanned)),
+        "remove_half_seconds": remove_seconds,
+    }
+
+# Volume shapes of the benchmark suite, full_body is the size of a lower body angiography
+BENCHMARK_SCALES = {
+    "small": (200,128,128),
+    "medium": (400,256,256),
+    "large": (800,512,512),
+    "full_body": (1600,512,512),
+}
+
+# NetworkEngine started on the aorta of a phantom as in network_construction.ipynb, explored down to the last slice
+def make_phantom_engine(image,truth,workers=1):
+    network_engine = NetworkEngine(image,len(image)-1)
+    network_engine.stop_depth = 0
+    network_engine.workers = workers
+    target = truth['aorta']
+    network_engine.network_manager.set_branch_target(0,target)
+    network_engine.network_manager.get_nested_intensity(0).add_number(image[len(image)-1,target[1],target[0]])
+    network_engine.network_manager.get_mean_radius(0).add_number(truth['aorta_radius'])
+    return network_engine
+
+# Inputs of regionSearch/regionGrowing calls taken on the centrelines : (slice,point shifted by a few pixels,center,radius,intensity)
+def sample_centreline_calls(image,truth,count,rng):
+    rows = np.concatenate(list(truth['centrelines'].values()))
+    calls = list()
+    for z,x,y,radius in rows[rng.choice(len(rows),size=min(count,len(rows)),replace=False)]:
+        center = (int(round(x)),int(round(y)))
+        shifted = (int(np.clip(center[0]+rng.integers(-int(radius)-3,int(radius)+4),0,image.shape[2]-1)),
+                   int(np.clip(center[1]+rng.integers(-int(radius)-3,int(radius)+4),0,image.shape[1]-1)))
+        calls.append((image[int(z)],shifted,center,radius,image[int(z),center[1],center[0]]))
+    return calls
+
+# Consecutive areas of each branch of a network, the pairs contour_intersect is called on by merging
+def sample_contour_pairs(network_manager,count):
+    pairs = list()
+    for branch_id in network_manager.branch_list:
+        branch,_ = network_manager.get_branch(branch_id)
+        pairs.extend((a.contour,b.contour) for a,b in zip(branch[:-1],branch[1:]))
+    return pairs[:count]
+
+# Time the hot functions and the network construction steps on a phantom of the given shape, with the accuracy of the network
+# against the phantom centrelines. Seconds are the best of repeat runs
+def benchmark_phantom(shape,repeat=3,seed=0,calls=500,workers=1):
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    image,truth = make_phantom(shape,seed=seed)
+    result = {"shape": list(shape),"seed": seed,"phantom_seconds": time.perf_counter()-start}
+
+    samples = sample_centreline_calls(image,truth,calls,rng)
+    seconds,_ = time_function(lambda: [regionSearch(zslice,point,radius,value*0.6) for zslice,point,_,radius,value in samples],repeat)
+    result["regionSearch"] = {"calls": len(samples),"seconds": seconds}
+    seconds,_ = time_function(lambda: [regionGrowing(zslice,center,NestedAverage([value],10,value,1),radius,0.6)
+                                       for zslice,_,center,radius,value in samples],repeat)
+    result["regionGrowing"] = {"calls": len(samples),"seconds": seconds}
+
+    def run():
+        network_engine = make_phantom_engine(image,truth,workers)
+        network_engine.run()
+        return network_engine
+    seconds,network_engine = time_function(run,repeat)
+    result["run"] = {"seconds": seconds,"branches": len(network_engine.network_manager.branch_list),
+                     "areas": len(network_engine.network_manager.store)}
+    result["accuracy"] = score_network(network_engine.network_manager,truth)
+
+    pairs = sample_contour_pairs(network_engine.network_manager,calls)
+    seconds,_ = time_function(lambda: [contour_intersect(a,b) for a,b in pairs],repeat)
+    result["contour_intersect"] = {"calls": len(pairs),"seconds": seconds}
+
+    network_engine.network_manager.sanitize()
+    seconds,merged_network_manager = time_function(lambda: network_engine.merge_network(network_engine.network_manager),repeat)
+    result["merge_network"] = {"seconds": seconds,"branches": len(merged_network_manager.branch_list)}
+    seconds,segmented_network_manager = time_function(lambda: network_engine.segmentize(merged_network_manager),repeat)
+    result["segmentize"] = {"seconds": seconds,"branches": len(segmented_network_manager.branch_list)}
+    result["segmented_accuracy"] = score_network(segmented_network_manager,truth)
+    seconds,_ = time_function(lambda: segmented_network_manager.generate3DImages(image.shape),repeat)
+    result["generate3DImages"] = {"seconds": seconds}
+    return result
+
+# Run NetworkEngine on a phantom with several worker counts (NetworkEngine.workers), every network is compared with the
+# first one, which should be the serial run (workers=1). The phantom is given to the workers as a .npy memory map in directory
+# (a shared memory copy of the volume otherwise)
+def benchmark_scaling(shape,worker_counts=(1,2,4),speculation_depth=32,seed=0,directory=None):
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        image,truth = make_phantom(shape,seed=seed,out=Path(temporary_directory) / "phantom.npy")
+        results = list()
+        reference = None
+        for workers in worker_counts:
+            network_engine = make_phantom_engine(image,truth,workers)
+            network_engine.speculation_depth = speculation_depth
+            start = time.perf_counter()
+            network_engine.run()
+            seconds = time.perf_counter()-start
+            network = [[(area.branch_id,area.predicted,area.contour.tobytes()) for area in areas] for areas in network_engine.network_manager.network]
+            if reference is None:
+                reference = (network,seconds)
+            results.append({
+                "workers": workers,
+                "seconds": seconds,
+                "speedup": reference[1]/seconds if seconds > 0 else float("nan"),
+                "identical": network == reference[0],
+            })
+    return {"shape": list(shape),"seed": seed,"cpu_count": os.cpu_count(),"results": results}
+
+# Agreement of a network with a reference network of the same volume : dice of the filled areas of all slices and mean distance
+# from the center of each area to the nearest center of the reference areas of its depth
+def network_agreement(reference_manager,network_manager,slice_shape):
+    reference_canvas = np.zeros(slice_shape,dtype=np.uint8)
+    canvas = np.zeros(slice_shape,dtype=np.uint8)
+    overlap = total = 0
+    distances = list()
+    for reference_areas,areas in zip(reference_manager.network,network_manager.network):
+        if len(reference_areas) == 0 and len(areas) == 0:
+            continue
+        reference_canvas[:] = 0
+        canvas[:] = 0
+        cv2.drawContours(reference_canvas,[area.contour for area in reference_areas],-1,1,-1)
+        cv2.drawContours(canvas,[area.contour for area in areas],-1,1,-1)
+        overlap += int(np.count_nonzero(reference_canvas & canvas))
+        total += int(np.count_nonzero(reference_canvas))+int(np.count_nonzero(canvas))
+        if len(reference_areas) > 0:
+            reference_centers = np.array([cv2.minEnclosingCircle(area.contour)[0] for area in reference_areas])
+            for area in areas:
+                center,_ = cv2.minEnclosingCircle(area.contour)
+                distances.append(float(np.min(np.hypot(*(reference_centers-center).T))))
+    return {
+        'dice': 2*overlap/total if total > 0 else 1.0,
+        'center_distance': float(np.mean(distances)) if distances else None,
+        'max_center_distance': float(np.max(distances)) if distances else None,
+    }
+
+# Coarse to fine tracking (NetworkEngine.skip_step) against full resolution tracking on a phantom : regionGrowing calls, run time,
+# accuracy against the centrelines and agreement with the full resolution network (skip step 1)
+def benchmark_skip_tracking(shape,skip_steps=(1,2,4,8),seed=0,skip_tolerance=0.15):
+    image,truth = make_phantom(shape,seed=seed)
+    results = list()
+    reference = None
+    for skip_step in skip_steps:
+        network_engine = make_phantom_engine(image,truth)
+        network_engine.skip_step = skip_step
+        network_engine.skip_tolerance = skip_tolerance
+        network_engine.profiler = EngineProfiler()
+        start = time.perf_counter()
+        network_engine.run()
+        seconds = time.perf_counter()-start
+        calls = network_engine.profiler.summary()['calls']
+        if reference is None:
+            reference = network_engine.network_manager
+        results.append({
+            "skip_step": skip_step,
+            "seconds": seconds,
+            "regionGrowing": int(calls.get("regionGrowing",0)),
+            "skipped": int(calls.get("skip",0)),
+            "accuracy": score_network(network_engine.network_manager,truth),
+            "agreement": network_agreement(reference,network_engine.network_manager,image.shape[1:]),
+        })
+    return {"shape": list(shape),"seed": seed,"skip_tolerance": skip_tolerance,"results": results}
+
+# NetworkEngine.run on a dense branch phantom (below the knee, arteries split bifurcation_levels-2 more times, 2**bifurcation_levels
+# arteries at the bottom). The run is checkpointed at the first depth with dense_branches branches pushed on the stack and the dense
+# part is timed from the checkpoint, the cost of a depth and of one branch step there is compared with the whole run
+def benchmark_dense_branches(shape=(800,512,512),bifurcation_levels=5,side_branches=2,dense_branches=20,repeat=3,seed=0,directory=None):
+    image,truth = make_phantom(shape,seed=seed,bifurcation_levels=bifurcation_levels,side_branches=side_branches)
+    def run():
+        network_engine = make_phantom_engine(image,truth)
+        network_engine.run()
+        return network_engine
+    seconds,network_engine = time_function(run,repeat)
+    result = {"shape": list(shape),"seed": seed,"bifurcation_levels": bifurcation_levels,"side_branches": side_branches,
+              "accuracy": score_network(network_engine.network_manager,truth)}
+    network_engine = make_phantom_engine(image,truth)
+    network_engine.profiler = EngineProfiler()
+    network_engine.run()
+    trace = network_engine.profiler.to_dataframe()
+    branches = trace[trace['function'] == 'push'].groupby('depth')['branch_id'].nunique()
+    result["run"] = {"seconds": seconds,"depths": len(branches),"mean_branches": float(branches.mean()),
+                     "depth_milliseconds": 1000*seconds/len(branches),"branch_milliseconds": 1000*seconds/int(branches.sum())}
+    dense_depths = branches[branches >= dense_branches].index
+    if len(dense_depths) == 0:
+        result["max_branches"] = int(branches.max())
+        return result
+    dense_start = int(dense_depths.max())
+    branches = branches[branches.index <= dense_start]
+
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        path = Path(temporary_directory) / "engine.pkl"
+        network_engine = make_phantom_engine(image,truth)
+        network_engine.checkpoint_path = path
+        network_engine.checkpoint_interval = network_engine.current_depth-dense_start
+        network_engine.run()
+        def resume():
+            network_engine = NetworkEngine.resume(path,image)
+            network_engine.checkpoint_path = None
+            network_engine.run()
+            return network_engine
+        seconds,_ = time_function(resume,repeat)
+        network_engine = NetworkEngine.resume(path,image)
+        network_engine.checkpoint_path = None
+    network_engine.profiler = EngineProfiler()
+    network_engine.run()
+    summary = network_engine.profiler.summary()
+    result["dense"] = {"start": dense_start,"seconds": seconds,"depths": len(branches),"mean_branches": float(branches.mean()),
+                       "max_branches": int(branches.max()),"depth_milliseconds": 1000*seconds/len(branches),
+                       "branch_milliseconds": 1000*seconds/int(branches.sum()),
+                       "regionGrowing": int(summary['calls'].get("regionGrowing",0)),
+                       "regionGrowing_pixels": int(summary['pixels'].get("regionGrowing",0))}
+    return result
+
+# Versions and commit of the benchmarked code, to compare results across versions
+def benchmark_environment():
+    try:
+        commit = subprocess.run(["git","rev-parse","HEAD"],cwd=Path(__file__).parent,capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+# Run benchmark_phantom on several scales (names of BENCHMARK_SCALES or shapes), results are written as json in output
+def benchmark_suite(scales=("small","medium"),repeat=3,seed=0,calls=500,workers=1,output=None):
+    report = {"environment": benchmark_environment(),"results": list()}
+    for scale in scales:
+        shape = BENCHMARK_SCALES[scale] if isinstance(scale,str) else tuple(scale)
+        result = benchmark_phantom(shape,repeat,seed,calls,workers)
+        result["scale"] = scale if isinstance(scale,str) else "x".join(str(value) for value in shape)
+        report["results"].append(result)
+        if output is not None:
+            with open(output,"w") as f:
+                json.dump(report,f,indent=2)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the network construction on synthetic phantoms")
+    parser.add_argument("--scales",nargs="+",default=["small","medium"],choices=list(BENCHMARK_SCALES))
+    parser.add_argument("--repeat",type=int,default=3)
+    parser.add_argument("--seed",type=int,default=0)
+    parser.add_argument("--workers",type=int,default=1,help="number of processes used by NetworkEngine.run")
+    parser.add_argument("--skip-steps",type=int,nargs="*",default=None,help="also compare coarse to fine tracking with these skip steps")
+    parser.add_argument("--worker-counts",type=int,nargs="*",default=None,help="also compare NetworkEngine.run with these worker counts")
+    parser.add_argument("--references",action="store_true",help="also time the hot functions against their reference implementations")
+    parser.add_argument("--dense-branches",action="store_true",help="also time NetworkEngine.run on a phantom with 20 to 40 branches per depth")
+    parser.add_argument("--output",default="benchmark.json")
+    args = parser.parse_args(argv)
+    report = benchmark_suite(args.scales,args.repeat,args.seed,workers=args.workers,output=args.output)
+    for result in report["results"]:
+        print(result["scale"]+" : "+", ".join(key+" "+str(round(result[key]["seconds"],3))+"s" for key in
+              ["regionSearch","regionGrowing","contour_intersect","run","merge_network","segmentize","generate3DImages"])
+              +", recall "+str(round(result["accuracy"]["recall"],3)))
+    if args.references:
+        report["references"] = {"regionGrowing": benchmark_regionGrowing(repeat=args.repeat,seed=args.seed),
+                                "contour_intersect": benchmark_contour_intersect(repeat=args.repeat),
+                                "branch_index": benchmark_branch_index(repeat=args.repeat,seed=args.seed)}
+        with open(args.output,"w") as f:
+            json.dump(report,f,indent=2)
+        for result in report["references"]["regionGrowing"]["results"]:
+            print("regionGrowing radius "+str(result["radius"])+" : "+str(round(1000*result["seconds"],3))+"ms, reference "
+                  +str(round(1000*result["reference_seconds"],3))+"ms, identical "+str(result["identical"]))
+        for result in report["references"]["contour_intersect"]["results"]:
+            print("contour_intersect "+str(result["points"])+" points "+result["case"]+" : "+str(round(1000*result["seconds"],3))+"ms, reference "
+                  +str(round(1000*result["reference_seconds"],3))+"ms, identical "+str(result["identical"]))
+        result = report["references"]["branch_index"]
+        print("branch index "+str(result["depth"])+" slices "+str(result["branch_count"])+" branches : lookups "+str(round(result["lookup_seconds"],3))
+              +"s, scan "+str(round(result["scan_seconds"],3))+"s, remove half "+str(round(result["remove_half_seconds"],3))+"s, identical "+str(result["identical"]))
+    if args.worker_counts:
+        report["scaling"] = [benchmark_scaling(BENCHMARK_SCALES[scale],[1]+args.worker_counts,seed=args.seed) for scale in args.scales]
+        with open(args.output,"w") as f:
+            json.dump(report,f,indent=2)
+        for scale,comparison in zip(args.scales,report["scaling"]):
+            for result in comparison["results"]:
+                print(scale+" workers "+str(result["workers"])+" : "+str(round(result["seconds"],3))+"s, speedup "
+                      +str(round(result["speedup"],2))+", identical "+str(result["identical"]))
+    if args.skip_steps:
+        report["skip_tracking"] = [benchmark_skip_tracking(BENCHMARK_SCALES[scale],[1]+args.skip_steps,args.seed) for scale in args.scales]
+        with open(args.output,"w") as f:
+            json.dump(report,f,indent=2)
+        for scale,comparison in zip(args.scales,report["skip_tracking"]):
+            for result in comparison["results"]:
+                print(scale+" skip "+str(result["skip_step"])+" : regionGrowing "+str(result["regionGrowing"])+" calls, "
+                      +str(round(result["seconds"],3))+"s, dice "+str(round(result["agreement"]["dice"],3))+", recall "+str(round(result["accuracy"]["recall"],3)))
+    if args.dense_branches:
+        report["dense_branches"] = benchmark_dense_branches(repeat=args.repeat,seed=args.seed)
+        with open(args.output,"w") as f:
+            json.dump(report,f,indent=2)
+        result = report["dense_branches"]
+        line = ("dense branches : run "+str(round(result["run"]["seconds"],3))+"s, "+str(round(result["run"]["mean_branches"],1))+" branches per depth, "
+                +str(round(result["run"]["branch_milliseconds"],3))+"ms per branch step")
+        if "dense" in result:
+            line += (", dense part "+str(round(result["dense"]["seconds"],3))+"s, "+str(round(result["dense"]["mean_branches"],1))+" branches per depth, "
+                     +str(round(result["dense"]["branch_milliseconds"],3))+"ms per branch step")
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
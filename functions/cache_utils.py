@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+import numpy as np
+from functions.volume_utils import open_volume
+
+# Content hash of an input volume file, a .mhd header is hashed with the raw data file it references
+def hash_input(path,chunk_size=1<<24):
+    path = Path(path)
+    digest = hashlib.blake2b(digest_size=20)
+    paths = [path]
+    if path.suffix == ".mhd":
+        with open(path) as f:
+            for line in f:
+                key,_,value = line.partition("=")
+                if key.strip() == "ElementDataFile" and value.strip() != "LOCAL":
+                    paths.append(path.parent / value.strip())
+    for file_path in paths:
+        with open(file_path,"rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size),b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# Key of a stage output : stage name, keys of the stages it depends on and its parameters
+def stage_key(stage,*parents,**params):
+    description = json.dumps([stage,parents,params],sort_keys=True,default=str)
+    return stage+"-"+hashlib.blake2b(description.encode(),digest_size=20).hexdigest()
+
+# On disk cache of pipeline stage outputs. Objects are pickled, volumes are saved as .npy and read back as memory maps
+# Entries are written atomically (temporary file then rename). When the cache is bigger than max_bytes, the least recently
+# used entries are removed (an entry is used when it is written or read)
+class StageCache:
+    def __init__(self,directory,max_bytes=20*1024**3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True,exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get_path(self,key,suffix):
+        return self.directory / (key+suffix)
+
+    # Cached object of key, default if there is none
+    def get(self,key,default=None):
+        path = self.get_path(key,".pkl")
+        try:
+            with open(path,"rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        self.touch(path)
+        return value
+
+    def put(self,key,value):
+        path = self.get_path(key,".pkl")
+        with self.write(path) as f:
+            pickle.dump(value,f,protocol=pickle.HIGHEST_PROTOCOL)
+        self.evict(keep=path)
+
+    # Cached volume of key as a memory mapped LazyVolume, None if there is none
+    def get_volume(self,key,cache_size=64):
+        path = self.get_path(key,".npy")
+        if not path.exists():
+            return None
+        self.touch(path)
+        return open_volume(path,cache_size)
+
+    def put_volume(self,key,volume,cache_size=64):
+        path = self.get_path(key,".npy")
+        with self.write(path) as f:
+            np.save(f,volume)
+        self.evict(keep=path)
+        return open_volume(path,cache_size)
+
+    # Object of key, computed and cached if there is none. Returns the object and True if it was cached
+    def cached(self,key,compute):
+        value = self.get(key)
+        if value is not None:
+            return value,True
+        value = compute()
+        self.put(key,value)
+        return value,False
+
+    def cached_volume(self,key,compute,cache_size=64):
+        volume = self.get_volume(key,cache_size)
+        if volume is not None:
+            return volume,True
+        return self.put_volume(key,compute(),cache_size),False
+
+    # File object writing to a temporary file renamed to path when closed without error
+    def write(self,path):
+        return AtomicWriter(path)
+
+    def touch(self,path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def get_entries(self):
+        entries = list()
+        for path in self.directory.iterdir():
+            if path.suffix in (".pkl",".npy"):
+                stat = path.stat()
+                entries.append((stat.st_mtime,stat.st_size,path))
+        return entries
+
+    def get_size(self):
+        return sum(size for _,size,_ in self.get_entries())
+
+    # Remove least recently used entries until the cache fits in max_bytes (keep is never removed)
+    def evict(self,keep=None):
+        entries = sorted(self.get_entries())
+        total = sum(size for _,size,_ in entries)
+        for _,size,path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # A volume removed while memory mapped stays readable until it is closed
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for _,_,path in self.get_entries():
+            path.unlink(missing_ok=True)
+
+class AtomicWriter:
+    def __init__(self,path):
+        self.path = Path(path)
+        handle,self.temporary_path = tempfile.mkstemp(dir=self.path.parent,prefix=".tmp-")
+        self.file = os.fdopen(handle,"wb")
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temporary_path,self.path)
+        else:
+            os.unlink(self.temporary_path)
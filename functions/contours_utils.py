@@ -9,8 +9,70 @@ def ccw(A,B,C):
     return (C[1]-A[1]) * (B[0]-A[0]) > (B[1]-A[1]) * (C[0]-A[0])
 
 # Check if two contours intersects or if one is included into another
+# Same result as contour_intersect_reference : contours far from each other are rejected with their bounding boxes,
+# close points are found on a small raster and segments are tested all at once with numpy
 def contour_intersect(cnt_ref,cnt_query,DEBUG=False):
 
+    # Check if contour is included
+    if cv2.pointPolygonTest(cnt_ref,cnt_query[0][0].astype(np.uint8),False)>=0:
+        if DEBUG:
+            print("included")
+        return True
+
+    ref = np.asarray(cnt_ref).reshape(-1,2).astype(np.int64)
+    query = np.asarray(cnt_query).reshape(-1,2).astype(np.int64)
+    ref_min, ref_max = ref.min(axis=0), ref.max(axis=0)
+    query_min, query_max = query.min(axis=0), query.max(axis=0)
+    # Equivalent points are at most 1 pixel away and crossing segments lie in both bounding boxes
+    if np.any(ref_min > query_max+1) or np.any(query_min > ref_max+1):
+        return False
+
+    # Check if some points are equivalent : query points are drawn on a raster of the common area then dilated with a cross
+    low = np.maximum(ref_min,query_min)-1
+    high = np.minimum(ref_max,query_max)+1
+    canvas = np.zeros((high[1]-low[1]+3,high[0]-low[0]+3),dtype=bool)
+    points = query[np.all((query >= low) & (query <= high),axis=1)]-low+1
+    canvas[points[:,1],points[:,0]] = True
+    near = canvas.copy()
+    near[1:,:] |= canvas[:-1,:]
+    near[:-1,:] |= canvas[1:,:]
+    near[:,1:] |= canvas[:,:-1]
+    near[:,:-1] |= canvas[:,1:]
+    points = ref[np.all((ref >= low) & (ref <= high),axis=1)]-low+1
+    if near[points[:,1],points[:,0]].any():
+        if DEBUG:
+            print("border collapse")
+        return True
+
+    ## Connect each point to the following point to get a line, only lines crossing the common area are kept
+    low = np.maximum(ref_min,query_min)
+    high = np.minimum(ref_max,query_max)
+    def lines_in_common_area(cnt):
+        start, end = cnt[:-1], cnt[1:]
+        keep = np.all((np.minimum(start,end) <= high) & (np.maximum(start,end) >= low),axis=1)
+        return start[keep], end[keep]
+    A, B = lines_in_common_area(ref)
+    C, D = lines_in_common_area(query)
+    if len(A) == 0 or len(C) == 0:
+        return False
+    # Points are given to ccw as (x,y) tuples of arrays, ref lines on rows and query lines on columns
+    C, D = (C[:,0],C[:,1]), (D[:,0],D[:,1])
+    # Lines are checked by blocks to bound memory on large contours
+    block = max(1,1000000//len(C[0]))
+    for start in range(0,len(A),block):
+        a = (A[start:start+block,0,np.newaxis],A[start:start+block,1,np.newaxis])
+        b = (B[start:start+block,0,np.newaxis],B[start:start+block,1,np.newaxis])
+        ## Check if line intersect
+        if np.any((ccw(a,C,D) != ccw(b,C,D)) & (ccw(a,b,C) != ccw(a,b,D))):
+            if DEBUG:
+                print("border cut")
+            return True
+
+    return False
+
+# Point by point implementation of contour_intersect, kept as reference
+def contour_intersect_reference(cnt_ref,cnt_query,DEBUG=False):
+
     ## Contour is a list of points
 
     # Check if contour is included
@@ -0,0 +1,164 @@
+import warnings
+import cv2
+import numpy as np
+from functions.volume_utils import LazyVolume
+
+# Kernel of dilation in anomaly_detection.ipynb
+DILATION_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(4,4))
+
+# First and last slice of a branch as find_slice_with_mask of anomaly_detection.ipynb gives them on the generate3DImages mask
+# (slice 0 is ignored), None if the branch has no area
+def branch_slice_range(network_manager,branch_id):
+    depths = [depth for depth in network_manager.get_branch_depths(branch_id) if depth > 0]
+    if len(depths) == 0:
+        return None
+    return min(depths),max(depths)
+
+# Contour points of a branch at a depth drawn on the smallest canvas holding them (1 pixel margin, clipped to the slice)
+# Returns the canvas and its (x,y) offset in the slice
+def draw_branch_slice(network_manager,branch_id,depth,slice_shape):
+    return draw_points_canvas(network_manager.get_area(depth,branch_id).contour.reshape(-1,2),slice_shape)
+
+# (x,y) points drawn with 255 on the smallest canvas holding them (1 pixel margin, clipped to the slice), with its (x,y) offset
+def draw_points_canvas(points,slice_shape):
+    x0, y0 = max(int(points[:,0].min())-1,0), max(int(points[:,1].min())-1,0)
+    x1, y1 = min(int(points[:,0].max())+2,slice_shape[1]), min(int(points[:,1].max())+2,slice_shape[0])
+    canvas = np.zeros((y1-y0,x1-x0),dtype=np.uint8)
+    canvas[points[:,1]-y0,points[:,0]-x0] = 255
+    return canvas,(x0,y0)
+
+# Same parameters as fit_ellipses of anomaly_detection.ipynb on the generate3DImages mask of the branch, without the mask :
+# each slice is drawn in its bounding box from the contours stored in network_manager. Ellipses are (center,(a,b),angle)
+def fit_branch_ellipses(network_manager,branch_id,rangemin,rangemax,slice_shape):
+    canvases = dict()
+    for depth in network_manager.get_branch_depths(branch_id):
+        canvases[depth] = draw_branch_slice(network_manager,branch_id,depth,slice_shape)
+    return fit_canvas_ellipses(canvases,rangemin,rangemax)
+
+# fit_ellipses of anomaly_detection.ipynb on mask slices given as {depth: (canvas,offset)}, a missing depth is an empty slice
+# An empty slice is skipped with a warning (the notebook prints "erreur nb contours"), the list is then shorter than the range
+def fit_canvas_ellipses(canvases,rangemin,rangemax):
+    pixel_count = sum(np.count_nonzero(canvas) for canvas,_ in canvases.values())
+    mean_nb_pixel = pixel_count / (rangemax-rangemin)
+    if mean_nb_pixel <= 6:
+        return None
+
+    list_params_ellipses = []
+    for index_img in reversed(range(rangemax-rangemin)):
+        if rangemin+index_img not in canvases:
+            warnings.warn("no contour in mask slice "+str(rangemin+index_img),RuntimeWarning)
+            continue
+        canvas,offset = canvases[rangemin+index_img]
+        # The notebook swaps mode and method in its findContours call, this is the effective mode and method
+        contours_found,_ = cv2.findContours(canvas,cv2.RETR_CCOMP,cv2.CHAIN_APPROX_NONE,offset=offset)
+        if len(contours_found) > 0:
+            if len(contours_found[0]) > 5:
+                ellipse = cv2.fitEllipse(contours_found[0])
+                list_params_ellipses.append(((ellipse[0][0],ellipse[0][1]),(ellipse[1][0]/2,ellipse[1][1]/2),ellipse[2]))
+            elif len(list_params_ellipses) > 0:
+                previous = list_params_ellipses[-1]
+                list_params_ellipses.append(((previous[0][0],previous[0][1]),(previous[1][0]/2,previous[1][1]/2),previous[2]))
+            else:
+                list_params_ellipses.append(((contours_found[0][0][0][0],contours_found[0][0][0][1]),(1,1),0))
+        else:
+            warnings.warn("no contour in mask slice "+str(rangemin+index_img),RuntimeWarning)
+    list_params_ellipses.reverse()
+    return list_params_ellipses
+
+# Same as predict_and_compare_values of anomaly_detection.ipynb : ellipses whose a*b is more than 80% away from a linear
+# regression over the branch are replaced by the next one, except at bifurcations (index in all_ranges_max)
+def predict_and_compare_values(list_params,rangemin,all_ranges_max):
+    new_list_params = [list_params[-1]]
+    list_products_ab = [params[1][0]*params[1][1] for params in list_params]
+    list_indexes = [i for i in range(len(list_products_ab))]
+    fit = np.polyfit(list_indexes,list_products_ab,deg=1)
+    predict_size_area = np.poly1d(fit)
+    list_products_ab_predicted = [predict_size_area(index) for index in list_indexes]
+    all_ranges_max = set(all_ranges_max)
+
+    for index in reversed(range(len(list_products_ab_predicted)-1)):
+        product_predicted = list_products_ab_predicted[index]
+        if np.abs((product_predicted-list_products_ab[index])*100/product_predicted) < 80:
+            new_list_params.append(list_params[index])
+        elif (index+rangemin) in all_ranges_max:
+            new_list_params.append(list_params[index])
+        else:
+            new_list_params.append(new_list_params[-1])
+    new_list_params.reverse()
+    return new_list_params,list_products_ab,list_products_ab_predicted
+
+# Filled ellipse of a slice drawn with value in its bounding box only, dilated as dilation of the notebook (4x4 ellipse kernel)
+# Returns the drawn box and its (x,y) offset in the slice
+def draw_ellipse_box(params,slice_shape,value=255,dilate=False):
+    center = (int(params[0][0]),int(params[0][1]))
+    axis = (int(params[1][0]),int(params[1][1]))
+    angle = int(params[2])
+    margin = max(abs(axis[0]),abs(axis[1]))+2+(len(DILATION_KERNEL) if dilate else 0)
+    x0, y0 = min(max(center[0]-margin,0),slice_shape[1]), min(max(center[1]-margin,0),slice_shape[0])
+    x1, y1 = max(min(center[0]+margin+1,slice_shape[1]),x0), max(min(center[1]+margin+1,slice_shape[0]),y0)
+    box = np.zeros((y1-y0,x1-x0),dtype=np.uint8)
+    if box.size > 0:
+        cv2.ellipse(box,(center[0]-x0,center[1]-y0),axis,angle,0,360,value,-1)
+        if dilate:
+            box = cv2.dilate(box,DILATION_KERNEL,iterations=1)
+    return box,(x0,y0)
+
+# Same volume as create_3d_ellipses of the notebook placed at rangemin in a full size uint8 volume (the notebook pads it with zeros),
+# ellipses are drawn in their bounding box only. values gives one pixel value per slice (255 if None)
+def draw_ellipses(list_params_ellipses,shape,rangemin,values=None,dilate=False,image=None):
+    if image is None:
+        image = np.zeros(shape,dtype=np.uint8)
+    for index,params in enumerate(list_params_ellipses):
+        box,(x0,y0) = draw_ellipse_box(params,shape[1:],255 if values is None else values[index],dilate)
+        image[rangemin+index,y0:y0+box.shape[0],x0:x0+box.shape[1]] = box
+    return image
+
+# Volume of ellipses drawn only when a slice is read, use ellipse_volume to get it with a slice cache
+class EllipseMasks:
+    def __init__(self,list_params_ellipses,shape,rangemin,values=None,dilate=False):
+        self.list_params_ellipses = list_params_ellipses
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(np.uint8)
+        self.rangemin = rangemin
+        self.values = values
+        self.dilate = dilate
+
+    def __getitem__(self,depth):
+        if depth is Ellipsis:
+            depth = slice(None)
+        if isinstance(depth,slice):
+            return np.array([self[i] for i in range(*depth.indices(self.shape[0]))],dtype=np.uint8).reshape((-1,)+self.shape[1:])
+        zslice = np.zeros(self.shape[1:],dtype=np.uint8)
+        index = depth-self.rangemin
+        if 0 <= index < len(self.list_params_ellipses):
+            box,(x0,y0) = draw_ellipse_box(self.list_params_ellipses[index],self.shape[1:],
+                                           255 if self.values is None else self.values[index],self.dilate)
+            zslice[y0:y0+box.shape[0],x0:x0+box.shape[1]] = box
+        return zslice
+
+def ellipse_volume(list_params_ellipses,shape,rangemin,values=None,dilate=False,cache_size=64):
+    return LazyVolume(EllipseMasks(list_params_ellipses,shape,rangemin,values,dilate),cache_size)
+
+# construct_ellipses_network of the notebook for a branch of network_manager : fit, regression and dilated ellipses volume
+# With lazy, ellipses_3D is drawn slice by slice when read instead of being a full volume
+def construct_branch_ellipses(network_manager,branch_id,shape,all_ranges_max,lazy=False):
+    slice_range = branch_slice_range(network_manager,branch_id)
+    if slice_range is None:
+        return None
+    rangemin, rangemax = slice_range[0],slice_range[1]+1
+    list_params = fit_branch_ellipses(network_manager,branch_id,rangemin,rangemax,shape[1:])
+    if list_params is None:
+        return None
+    new_list_param, list_products_ab, list_products_ab_predicted = predict_and_compare_values(list_params,rangemin,all_ranges_max)
+    if lazy:
+        ellipses_3d = ellipse_volume(new_list_param,shape,rangemin,dilate=True)
+    else:
+        ellipses_3d = draw_ellipses(new_list_param,shape,rangemin,dilate=True)
+    return {'rangemin': rangemin,
+            'rangemax': rangemax,
+            'branch_id': branch_id,
+            'ellipses_3D': ellipses_3d,
+            'list_ab': list_products_ab,
+            'list_ab_predicted': list_products_ab_predicted,
+            'list_params_ellipses': new_list_param
+            }
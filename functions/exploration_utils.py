@@ -1,10 +1,96 @@
 
+import collections
+import functools
 import math
 import cv2
 import numpy as np
 
+# Visiting order of regionSearchReference for a search box of half size limit+1, returned as (dx,dy) offsets
+# Pixels are visited as in a breadth first search where neighbours are added from (-1,-1) to (1,1), only pixels closer than limit are expanded
+@functools.lru_cache(maxsize=None)
+def searchOffsets(limit):
+    size = 2*limit+3
+    visited = np.zeros((size,size), dtype=bool)
+    visited[limit+1, limit+1] = True
+    order = [(0,0)]
+    queue = collections.deque(order)
+    while queue:
+        dx, dy = queue.popleft()
+        if max(abs(dx),abs(dy)) > limit:
+            continue
+        for i in range(-1, 2):
+            for j in range(-1, 2):
+                if not visited[dy+j+limit+1, dx+i+limit+1]:
+                    visited[dy+j+limit+1, dx+i+limit+1] = True
+                    order.append((dx+i,dy+j))
+                    queue.append((dx+i,dy+j))
+    offsets = np.array(order, dtype=np.intp)
+    offsets.setflags(write=False)
+    return offsets
+
 # Region search look for a minimum intensity value point in the area given by point and search radius. Once a point is found with a minimum intensity, it's returned
-def regionSearch(image,point,searchRadius,minValue):
+# Pixels are checked in the same order as regionSearchReference, using a precomputed offset table on a window of half size searchRadius+5
+# If stats is a dict, stats["pixels"] is set to the number of pixels checked (used by functions.profiling_utils)
+def regionSearch(image,point,searchRadius,minValue,stats=None):
+    x, y = int(point[0]), int(point[1])
+    height, width = image.shape[0], image.shape[1]
+    if not (0 <= x < width and 0 <= y < height):
+        return regionSearchReference(image,point,searchRadius,minValue)
+    # Most of the time the previous center is still in the vessel
+    if int(image[y, x]) > minValue:
+        if stats is not None:
+            stats["pixels"] = 1
+        return (x,y)
+    # Pixels at a distance lower than limit are expanded
+    limit = math.ceil(searchRadius+5)-1
+    if limit < 0:
+        return (-1,-1)
+    offsets = searchOffsets(limit)
+    if x-limit-1 < 0 or y-limit-1 < 0 or x+limit+1 >= width or y+limit+1 >= height:
+        # The search box is cut by the image border, the visiting order differs from the offset table
+        return regionSearchWindow(image,(x,y),limit,minValue,stats)
+    window = image[y-limit-1:y+limit+2, x-limit-1:x+limit+2]
+    values = window[offsets[:,1]+limit+1, offsets[:,0]+limit+1]
+    if not np.issubdtype(values.dtype, np.integer):
+        values = np.trunc(values)
+    found = values > minValue
+    index = np.argmax(found)
+    if stats is not None:
+        stats["pixels"] = int(index)+1 if found[index] else len(offsets)
+    if found[index]:
+        return (x+int(offsets[index,0]),y+int(offsets[index,1]))
+    return (-1,-1)
+
+# Breadth first search on the part of the search box that is inside the image, used by regionSearch near the image border
+def regionSearchWindow(image,point,limit,minValue,stats=None):
+    x0, y0 = max(point[0]-limit-1, 0), max(point[1]-limit-1, 0)
+    x1, y1 = min(point[0]+limit+2, image.shape[1]), min(point[1]+limit+2, image.shape[0])
+    window = image[y0:y1, x0:x1]
+    visited = np.zeros(window.shape, dtype=bool)
+    visited[point[1]-y0, point[0]-x0] = True
+    queue = collections.deque([point])
+    checked = 0
+    while queue:
+        x, y = queue.popleft()
+        checked += 1
+        # Check if pixel value is in an acceptable range
+        if int(window[y-y0, x-x0]) > minValue:
+            if stats is not None:
+                stats["pixels"] = checked
+            return (x,y)
+        # Add neighbour to queue
+        if abs(y-point[1]) <= limit and abs(x-point[0]) <= limit:
+            for i in range(-1, 2):
+                for j in range(-1, 2):
+                    if x0 <= x + i < x1 and y0 <= y + j < y1 and not visited[y+j-y0, x+i-x0]:
+                        visited[y+j-y0, x+i-x0] = True
+                        queue.append((x + i, y + j))
+    if stats is not None:
+        stats["pixels"] = checked
+    return (-1,-1)
+
+# Pixel by pixel region search, kept as the reference implementation of regionSearch
+def regionSearchReference(image,point,searchRadius,minValue):
     search_memory = np.zeros_like(image, dtype=np.uint8)
     queue = [point]
     while queue:
@@ -24,7 +110,102 @@ def regionSearch(image,point,searchRadius,minValue):
     return (-1,-1)
 
 
-def regionGrowing(image,point,nested_intensity,mean_radius=-1,alpha=0.60,exclusion_zone=None):
+# Rasterize exclusion contours on a boolean mask of the given shape, offset is the position of the mask in the image
+# A pixel is excluded if it is inside or on a contour, contours with 10 points or less are replaced by the segment [[0,0],[1,1]]
+def exclusionMask(shape,exclusion_zone,offset=(0,0)):
+    mask = np.zeros(shape, dtype=np.uint8)
+    degenerate = False
+    for contour in exclusion_zone:
+        if len(contour)>10:
+            cv2.drawContours(mask, [contour], -1, 1, -1, offset=(-offset[0],-offset[1]))
+        else:
+            degenerate = True
+    if degenerate:
+        for (x, y) in ((0,0),(1,1)):
+            if 0 <= x-offset[0] < shape[1] and 0 <= y-offset[1] < shape[0]:
+                mask[y-offset[1], x-offset[0]] = 1
+    return mask.view(bool)
+
+
+# Region growing works on a window around the seed : the window is thresholded, labelled in one pass and enlarged until the seed component is entirely inside it
+# The result is the same as regionGrowingReference (8-connected growth from the seed)
+# exclusion_zone is either a list of contours or a boolean mask of the image shape built once with exclusionMask
+# If stats is a dict, stats["pixels"] is set to the number of labelled pixels and stats["guards"] to 1 if the aorta guard (sum > 2000) stopped the growth
+def regionGrowing(image,point,nested_intensity,mean_radius=-1,alpha=0.60,exclusion_zone=None,stats=None):
+    x, y = int(point[0]), int(point[1])
+    height, width = image.shape[0], image.shape[1]
+    # regionSearch returns (-1,-1) when nothing is found, the reference implementation wraps this index so we keep its behaviour
+    if not (0 <= x < width and 0 <= y < height):
+        return regionGrowingReference(image,point,nested_intensity,mean_radius,alpha,exclusion_zone)
+
+    # Get the average expected intensity value for this region
+    seed_value = nested_intensity.get_average()
+    # Define a unrealistic area equal to 2x the expected radius
+    if mean_radius > -1:
+        unrealistic_area = 2 * np.pi * math.pow(mean_radius,2) * 2
+    else:
+        unrealistic_area = np.pow(10,7)
+
+    if stats is not None:
+        stats["pixels"] = 0
+        stats["guards"] = 0
+    half_size = max(16, int(4 * mean_radius))
+    while True:
+        x0, y0 = max(x - half_size, 0), max(y - half_size, 0)
+        x1, y1 = min(x + half_size + 1, width), min(y + half_size + 1, height)
+        window = image[y0:y1, x0:x1]
+        candidates = window >= seed_value*alpha
+        # Remove pixels that are in exclusion zone
+        if isinstance(exclusion_zone,np.ndarray):
+            candidates &= ~exclusion_zone[y0:y1, x0:x1]
+        elif exclusion_zone is not None:
+            candidates &= ~exclusionMask(window.shape,exclusion_zone,(x0,y0))
+        if not candidates[y-y0, x-x0]:
+            return [],False
+        _, labels, component_stats, _ = cv2.connectedComponentsWithStats(candidates.view(np.uint8), connectivity=8)
+        if stats is not None:
+            stats["pixels"] += candidates.size
+        label = labels[y-y0, x-x0]
+        left, top, w, h, sum = component_stats[label]
+        # The component is complete if it does not reach a window border that is not an image border
+        if ((left > 0 or x0 == 0) and (top > 0 or y0 == 0)
+            and (left + w < x1 - x0 or x1 == width) and (top + h < y1 - y0 or y1 == height)):
+            break
+        # Early exit : the component is already bigger than the abdominal aorta and unrealistic
+        if sum > 2000 and sum > unrealistic_area:
+            if stats is not None:
+                stats["guards"] = 1
+            return [],False
+        half_size *= 2
+
+    segmented = (labels == label).astype(np.uint8)
+    contours, _ = cv2.findContours(segmented, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE, offset=(x0, y0))
+    if len(contours)>0:
+        rect = cv2.minAreaRect(contours[0])
+        contourBoundingWidth = max(rect[1])/2 #rect width
+        # check if contour is big enough and thus anormal
+        if contourBoundingWidth > 5 and (contourBoundingWidth > mean_radius * 3 or sum > unrealistic_area):
+            if sum > 2000:
+                #Bigger than the abdominal aorta
+                if stats is not None:
+                    stats["guards"] = 1
+                return [],False
+            # The predicted circle is drawn on a window big enough to hold it
+            radius = int(mean_radius)
+            x0, y0 = max(x - radius - 2, 0), max(y - radius - 2, 0)
+            x1, y1 = min(x + radius + 3, width), min(y + radius + 3, height)
+            segmented = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.circle(segmented,(x - x0, y - y0),radius,255)
+            contours, _ = cv2.findContours(segmented, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE, offset=(x0, y0))
+            return contours[0],True
+        # else ok
+        return contours[0],False
+    else:
+        return [],False
+
+
+# Pixel by pixel region growing, kept as the reference implementation of regionGrowing
+def regionGrowingReference(image,point,nested_intensity,mean_radius=-1,alpha=0.60,exclusion_zone=None):
 
     segmented = np.zeros_like(image, dtype=np.uint8)
 
@@ -47,7 +228,11 @@ def regionGrowing(image,point,nested_intensity,mean_radius=-1,alpha=0.60,exclusi
             # Check if intensity value is in range
             if image[y, x] >= seed_value*alpha:
                 # Check if pixel is not in exclusion zone
-                if isinstance(exclusion_zone,type(None)) or not any([cv2.pointPolygonTest(exclusion_zone[i] if len(exclusion_zone[i])>10 else np.array([[0,0],[1,1]]),(x,y),False) >= 0 for i in range(len(exclusion_zone))]):
+                if isinstance(exclusion_zone,np.ndarray):
+                    excluded = exclusion_zone[y, x]
+                else:
+                    excluded = not isinstance(exclusion_zone,type(None)) and any([cv2.pointPolygonTest(exclusion_zone[i] if len(exclusion_zone[i])>10 else np.array([[0,0],[1,1]]),(x,y),False) >= 0 for i in range(len(exclusion_zone))])
+                if not excluded:
                     segmented[y, x] = 255
                     sum += 1
                     # Add neighbour to stack
@@ -73,4 +258,4 @@ def regionGrowing(image,point,nested_intensity,mean_radius=-1,alpha=0.60,exclusi
         # else ok
         return contours[0],False
     else:
-        return [],False
\ No newline at end of file
+        return [],False
@@ -0,0 +1,101 @@
+from pathlib import Path
+import cv2
+import numpy as np
+
+# Sparse masks are stored as contour points in a compressed npz file. For each branch (and for the debug areas):
+#   <prefix>_depths  (n,)    depth of each area
+#   <prefix>_offsets (n+1,)  area i owns points[offsets[i]:offsets[i+1]]
+#   <prefix>_points  (N,2)   contour points (x,y), int16
+# with prefix branch_<branch_id> or debug. Every array is compressed separately, so a branch is read without the others
+def save_sparse_masks(path,shape,branches,debug=None):
+    arrays = {
+        'shape': np.array(shape,dtype=np.int64),
+        'branch_ids': np.array(list(branches.keys()),dtype=np.int32),
+    }
+    if debug is not None:
+        branches = dict(branches)
+        branches['debug'] = debug
+    for branch_id,(depths,offsets,points) in branches.items():
+        prefix = get_prefix(branch_id)
+        arrays[prefix+'_depths'] = np.asarray(depths,dtype=np.int32)
+        arrays[prefix+'_offsets'] = np.asarray(offsets,dtype=np.int64)
+        arrays[prefix+'_points'] = np.asarray(points,dtype=np.int16).reshape(-1,2)
+    np.savez_compressed(Path(path),**arrays)
+
+def get_prefix(branch_id):
+    return 'debug' if branch_id == 'debug' else 'branch_'+str(branch_id)
+
+# Draw areas given as depths/offsets/points in a (depth,height,width) uint8 volume, contour points are set to value
+# All points are scattered at once, with filled the lumen of each area is drawn with cv2.drawContours
+def rasterize(image,depths,offsets,points,value=255,filled=False):
+    if filled:
+        for depth,start,end in zip(depths,offsets[:-1],offsets[1:]):
+            cv2.drawContours(image[depth],[points[start:end].astype(np.int32).reshape(-1,1,2)],-1,value,-1)
+        return image
+    lengths = np.diff(offsets)
+    point_depths = np.repeat(np.asarray(depths,dtype=np.int64),lengths)
+    image[point_depths,points[:,1],points[:,0]] = value
+    return image
+
+# Read a file written by save_sparse_masks (NetworkManager.export_sparse). Branches are loaded on demand,
+# indexing gives the dense mask of a branch as generate3DImages does (debug areas excluded)
+class SparseMasks:
+    def __init__(self,path):
+        self.data = np.load(Path(path))
+        self.shape = tuple(int(value) for value in self.data['shape'])
+        self.branch_ids = [int(branch_id) for branch_id in self.data['branch_ids']]
+        self.branches = dict()
+        self.last_dense = None
+
+    def __len__(self):
+        return len(self.branch_ids)
+
+    def __getitem__(self,index):
+        return self.densify(self.branch_ids[index])
+
+    def __iter__(self):
+        for branch_id in self.branch_ids:
+            yield self.densify(branch_id)
+
+    def has_debug(self):
+        return 'debug_depths' in self.data.files
+
+    # (depths,offsets,points) of a branch, 'debug' for the debug areas
+    def get_branch(self,branch_id):
+        branch = self.branches.get(branch_id)
+        if branch is None:
+            prefix = get_prefix(branch_id)
+            branch = (self.data[prefix+'_depths'],self.data[prefix+'_offsets'],self.data[prefix+'_points'])
+            self.branches[branch_id] = branch
+        return branch
+
+    # First and last depth of a branch (as find_slice_with_mask for a dense mask), None if the branch has no area
+    def get_depth_range(self,branch_id):
+        depths,_,_ = self.get_branch(branch_id)
+        if len(depths) == 0:
+            return None
+        return int(depths.min()),int(depths.max())
+
+    # Contours of a branch at a depth, in OpenCV format
+    def get_contours(self,branch_id,depth):
+        depths,offsets,points = self.get_branch(branch_id)
+        return [points[offsets[i]:offsets[i+1]].astype(np.int32).reshape(-1,1,2) for i in np.flatnonzero(depths == depth)]
+
+    # Dense uint8 volume of one branch (lumen filled if filled), the last one is kept because notebooks index the same mask several times
+    # The volume is read-only since the next lookup of the branch returns the same array, copy it to modify it
+    def densify(self,branch_id,filled=False):
+        if self.last_dense is not None and self.last_dense[0] == (branch_id,filled):
+            return self.last_dense[1]
+        image = rasterize(np.zeros(self.shape,dtype=np.uint8),*self.get_branch(branch_id),filled=filled)
+        image.setflags(write=False)
+        self.last_dense = ((branch_id,filled),image)
+        return image
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
@@ -0,0 +1,111 @@
+import collections
+import json
+import logging
+import time
+import numpy as np
+from networkclass import NetworkObserver
+
+# Sinks for NetworkEngine events, attach one with network_engine.set_observer(observer)
+
+# numpy values of event fields as json values
+def to_json(value):
+    if isinstance(value,np.generic):
+        return value.item()
+    if isinstance(value,np.ndarray):
+        return value.tolist()
+    return str(value)
+
+# Every event is logged as "event key=value ...", depth_done events are logged at debug level (one per slice)
+class LoggingObserver(NetworkObserver):
+    enabled = True
+
+    def __init__(self,logger=None,level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("networkclass")
+        self.level = level
+
+    def emit(self,event,**fields):
+        level = logging.DEBUG if event == "depth_done" else self.level
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level,"%s %s",event," ".join(key+"="+str(value) for key,value in fields.items()))
+
+# One json object per line with the event name and a timestamp, path is opened in append mode
+class JsonLinesObserver(NetworkObserver):
+    enabled = True
+
+    def __init__(self,path):
+        self.file = open(path,"a")
+
+    def emit(self,event,**fields):
+        record = {"event": event,"time": time.time()}
+        record.update(fields)
+        self.file.write(json.dumps(record,default=to_json)+"\n")
+
+    def close(self):
+        self.file.close()
+
+# Progress bar of NetworkEngine.run, one bar per run
+class ProgressObserver(NetworkObserver):
+    enabled = True
+
+    def __init__(self,**tqdm_kwargs):
+        self.tqdm_kwargs = tqdm_kwargs
+        self.pbar = None
+
+    def emit(self,event,**fields):
+        if event == "run_start":
+            from tqdm.auto import tqdm
+            self.close()
+            self.pbar = tqdm(total=fields["depth"]-fields["stop_depth"],**self.tqdm_kwargs)
+        elif event == "depth_done" and self.pbar is not None:
+            self.pbar.update(1)
+            self.pbar.set_description("Searching region %s" % str(fields["depth"]))
+        elif event == "run_end":
+            self.close()
+
+    def close(self):
+        if self.pbar is not None:
+            self.pbar.close()
+            self.pbar = None
+
+# Count events and keep the per depth timings of run
+class MetricsObserver(NetworkObserver):
+    enabled = True
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.reasons = collections.Counter()
+        self.depth_seconds = dict()
+
+    def emit(self,event,**fields):
+        self.counts[event] += 1
+        if "reason" in fields:
+            self.reasons[(event,fields["reason"])] += 1
+        elif "outcome" in fields:
+            self.reasons[(event,fields["outcome"])] += 1
+        if event == "depth_done":
+            self.depth_seconds[fields["depth"]] = self.depth_seconds.get(fields["depth"],0)+fields["seconds"]
+
+    def summary(self):
+        seconds = list(self.depth_seconds.values())
+        return {
+            "counts": dict(self.counts),
+            "reasons": {event+":"+reason: count for (event,reason),count in self.reasons.items()},
+            "depths": len(seconds),
+            "depth_seconds_total": float(np.sum(seconds)) if seconds else 0.0,
+            "depth_seconds_max": float(np.max(seconds)) if seconds else 0.0,
+        }
+
+# Send events to several observers
+class CompositeObserver(NetworkObserver):
+    enabled = True
+
+    def __init__(self,*observers):
+        self.observers = [observer for observer in observers if observer.enabled]
+
+    def emit(self,event,**fields):
+        for observer in self.observers:
+            observer.emit(event,**fields)
+
+    def close(self):
+        for observer in self.observers:
+            observer.close()
@@ -0,0 +1,239 @@
+import math
+import cv2
+import numpy as np
+from functions.preprocessing_utils import window_intensity
+
+# Intensities of the phantom tissues in Hounsfield units (before windowing)
+AIR = -1000
+TISSUE = 40
+LUMEN = 650
+MARROW = 250
+CORTICAL_BONE = 1300
+CALCIFICATION = 1500
+
+# Centrelines of a synthetic lower body vessel tree, each branch is an array of (z,x,y,radius) rows with one row per slice, going down
+# (z decreasing) as NetworkEngine explores. The aorta (branch 0) splits in two leg arteries at split_depth, each leg artery splits
+# again below the knee (bifurcation_levels gives how many of these levels are made, above 2 the arteries below the knee keep
+# splitting, see benchmark_utils.benchmark_dense_branches). Side branches leave the aorta and stop
+def make_centrelines(shape,rng,aorta_radius,bifurcation_levels=2,side_branches=2,split_depth=None,knee_depth=None):
+    depth, height, width = shape
+    split_depth = int(0.55*depth) if split_depth is None else split_depth
+    knee_depth = int(depth/3) if knee_depth is None else knee_depth
+    centrelines = dict()
+    parents = dict()
+
+    def add_branch(parent,rows):
+        branch_id = len(centrelines)
+        centrelines[branch_id] = np.array(rows,dtype=np.float64).reshape(-1,4)
+        parents[branch_id] = parent
+        return branch_id
+
+    # Aorta, slightly wiggling and tapering
+    phase = rng.uniform(0,2*math.pi)
+    aorta_stop = split_depth if bifurcation_levels > 0 else 0
+    rows = list()
+    for z in range(depth-1,aorta_stop-1,-1):
+        t = (depth-1-z)/max(depth-1-aorta_stop,1)
+        rows.append((z,width/2+0.02*width*math.sin(phase+6*t),height/2-0.04*height,aorta_radius*(1-0.2*t)))
+    aorta = add_branch(None,rows)
+
+    # Short side branches going laterally from the upper aorta
+    for _ in range(side_branches):
+        start = int(rng.uniform(split_depth+0.3*(depth-split_depth),depth-0.1*(depth-split_depth)))
+        side = rng.choice((-1,1))
+        x, y, radius = centrelines[aorta][depth-1-start,1:]
+        length = max(int(0.05*depth),8)
+        rows = list()
+        for k in range(length):
+            rows.append((start-k-1,x+side*(radius+2+0.6*k),y+0.1*k,max(0.35*radius,2.5)))
+        add_branch(aorta,rows)
+
+    if bifurcation_levels == 0:
+        return centrelines,parents,split_depth,knee_depth
+
+    # Leg arteries : they move from the aorta to the leg center then go down to the feet
+    x_split, y_split, radius_split = centrelines[aorta][-1,1:]
+    # Leg arteries taper down to a popliteal artery of a few pixels at the knee (extract_arteries_position_from_knee looks for 10-100 pixels areas)
+    knee_radius = max(min(0.3*radius_split,4),3)
+    tibial_depth = max(knee_depth-int(0.05*depth),2)
+    leg_stop = tibial_depth if bifurcation_levels > 1 else 0
+    legs = list()
+    for side in (-1,1):
+        leg_x = width/2+side*0.22*width
+        phase = rng.uniform(0,2*math.pi)
+        rows = list()
+        for z in range(split_depth-1,leg_stop-1,-1):
+            t = (split_depth-1-z)/max(split_depth-1,1)
+            # Smoothstep from the aorta to the leg center on the first 15% of the leg
+            s = min(t/0.15,1.0)
+            s = s*s*(3-2*s)
+            x = (1-s)*(x_split+side*0.5*radius_split)+s*leg_x+0.01*width*math.sin(phase+20*t)
+            y = (1-s)*y_split+s*(height/2+0.05*height)
+            k = min(t*(split_depth-1)/max(split_depth-1-knee_depth,1),1.0)
+            rows.append((z,x,y,(1-k)*0.6*radius_split+k*knee_radius))
+        legs.append(add_branch(aorta,rows))
+
+    if bifurcation_levels < 2:
+        return centrelines,parents,split_depth,knee_depth
+
+    if bifurcation_levels > 2:
+        # Dense branch phantoms : below the knee, arteries split again every segment slices and fan out in the leg, the
+        # 2**(bifurcation_levels-1) arteries of a leg end evenly spaced on 36% of the width. Their radius stays above the radius
+        # NetworkEngine needs to detect a split
+        levels = bifurcation_levels-1
+        segment = max(min(int(0.06*depth),tibial_depth//levels),2)
+        spacing = 0.36*width/2**levels
+        arteries = list(legs)
+        for level in range(levels):
+            start = tibial_depth-level*segment
+            stop = start-segment if level < levels-1 else 0
+            offset = spacing*2**(levels-level-2)
+            children = list()
+            for parent in arteries:
+                x0, y0, radius0 = centrelines[parent][-1,1:]
+                for side in (-1,1):
+                    rows = list()
+                    for z in range(start-1,stop-1,-1):
+                        s = min((start-1-z)/max(0.6*segment,1),1.0)
+                        rows.append((z,x0+side*offset*s*s*(3-2*s),y0,max(radius0,4.5)))
+                    children.append(add_branch(parent,rows))
+            arteries = children
+        return centrelines,parents,split_depth,knee_depth
+
+    # Below the knee, each leg artery splits in two arteries going apart
+    for leg in legs:
+        x0, y0, radius0 = centrelines[leg][-1,1:]
+        for side in (-1,1):
+            rows = list()
+            for z in range(tibial_depth-1,-1,-1):
+                t = (tibial_depth-1-z)/max(tibial_depth-1,1)
+                s = min(t/0.3,1.0)
+                rows.append((z,x0+side*(0.5*radius0+0.035*width*s),y0+0.01*height*s,max(0.7*radius0*(1-0.3*t),2.5)))
+            add_branch(leg,rows)
+    return centrelines,parents,split_depth,knee_depth
+
+# Synthetic angiography volume of a lower body with its ground truth. Vessels are tubes around the centrelines of make_centrelines
+# with noise, calcified plaques on their wall, a spine in the abdomen and leg bones whose section grows at the knees (find_knee_depth)
+# The volume is windowed as in the preprocessing (0-1000 HU to 0-255) unless windowed is False. With out, the volume is written slice
+# by slice to a .npy file opened as a memory map, so full body sizes do not need to fit in memory
+# Returns the volume and a dict with the centrelines, parents, aorta position on the top slice, knee depth and knee arteries
+def make_phantom(shape=(400,160,160),seed=0,bifurcation_levels=2,side_branches=2,noise=25,calcification_rate=0.01,
+                 bone=True,knees=True,windowed=True,aorta_radius=None,out=None,dtype=np.int16):
+    rng = np.random.default_rng(seed)
+    depth, height, width = shape
+    aorta_radius = max(0.06*min(height,width),9) if aorta_radius is None else aorta_radius
+    centrelines,parents,split_depth,knee_depth = make_centrelines(shape,rng,aorta_radius,bifurcation_levels,side_branches)
+
+    # Calcified plaques : (branch_id,first depth,last depth,angle,radius)
+    plaques = list()
+    for branch_id,centreline in centrelines.items():
+        for _ in range(rng.poisson(calcification_rate*len(centreline))):
+            end = int(rng.integers(0,len(centreline)))
+            length = int(rng.integers(3,9))
+            plaques.append((branch_id,int(centreline[end,0]),int(centreline[end,0])+length,rng.uniform(0,2*math.pi),int(rng.integers(1,3))))
+    lumen_values = {branch_id: LUMEN*rng.uniform(0.9,1.1) for branch_id in centrelines}
+    by_depth = [list() for _ in range(depth)]
+    for branch_id,centreline in centrelines.items():
+        for row in centreline:
+            by_depth[int(row[0])].append((branch_id,row[1],row[2],row[3]))
+
+    if out is not None:
+        image = np.lib.format.open_memmap(out,mode="w+",dtype=dtype,shape=tuple(shape))
+    else:
+        image = np.empty(shape,dtype=dtype)
+    body = np.zeros((height,width),dtype=np.uint8)
+    for z in range(depth):
+        zslice = (TISSUE+noise*rng.standard_normal((height,width),dtype=np.float32))
+        body[:] = 0
+        if z >= split_depth:
+            cv2.ellipse(body,(width//2,height//2),(int(0.45*width),int(0.38*height)),0,0,360,1,-1)
+        else:
+            for side in (-1,1):
+                cv2.circle(body,(int(width/2+side*0.22*width),int(height/2)),int(0.2*min(height,width)),1,-1)
+        zslice[body == 0] = AIR
+        if bone:
+            if z >= split_depth:
+                # Spine behind the aorta
+                draw_bone(zslice,(width//2,int(0.78*height)),(int(0.09*width),int(0.07*height)))
+            else:
+                # Leg bones, wider than deep (find_knee_depth ignores square boxes), their section is larger at the knees
+                bump = math.exp(-((z-knee_depth)/(0.03*depth))**2) if knees else 0
+                axis = 0.04*width+0.05*width*bump
+                for side in (-1,1):
+                    draw_bone(zslice,(int(width/2+side*0.22*width),int(height/2-0.07*height-0.04*width*bump)),(int(1.3*axis),int(axis)))
+        for branch_id,x,y,radius in by_depth[z]:
+            cv2.circle(zslice,(int(round(x)),int(round(y))),int(round(radius)),float(lumen_values[branch_id]),-1)
+        for branch_id,first,last,angle,plaque_radius in plaques:
+            index = int(centrelines[branch_id][0,0])-z
+            if first <= z <= last and 0 <= index < len(centrelines[branch_id]):
+                _,x,y,radius = centrelines[branch_id][index]
+                cv2.circle(zslice,(int(round(x+radius*math.cos(angle))),int(round(y+radius*math.sin(angle)))),plaque_radius,CALCIFICATION,-1)
+        image[z] = window_intensity(zslice[np.newaxis])[0] if windowed else zslice
+    if out is not None:
+        image.flush()
+
+    top = centrelines[0][0]
+    truth = {
+        'centrelines': centrelines,
+        'parents': parents,
+        'aorta': (int(round(top[1])),int(round(top[2]))),
+        'aorta_radius': float(top[3]),
+        'split_depth': split_depth,
+        'knee_depth': knee_depth,
+        'knee_arteries': [centreline_point(centrelines,branch_id,knee_depth) for branch_id in centrelines
+                          if parents[branch_id] == 0 and centreline_point(centrelines,branch_id,knee_depth) is not None],
+    }
+    return image,truth
+
+# Bone section : cortical ellipse filled with marrow
+def draw_bone(zslice,center,axes):
+    cv2.ellipse(zslice,center,axes,0,0,360,CORTICAL_BONE,-1)
+    cv2.ellipse(zslice,center,(max(axes[0]-3,0),max(axes[1]-3,0)),0,0,360,MARROW,-1)
+
+# (x,y) of a branch at a depth, None if the branch is not at this depth
+def centreline_point(centrelines,branch_id,depth):
+    centreline = centrelines[branch_id]
+    rows = centreline[centreline[:,0] == depth]
+    if len(rows) == 0:
+        return None
+    return (int(round(rows[0,1])),int(round(rows[0,2])))
+
+# Compare the areas of a network manager with the ground truth of make_phantom
+#   recall       ratio of centreline points inside an area of their depth
+#   precision    ratio of areas whose center is at most radius+margin from a centreline point of their depth
+#   center_error mean distance between the center of the areas and the nearest centreline point
+def score_network(network_manager,truth,margin=2):
+    network = network_manager.network
+    points = np.concatenate([centreline for centreline in truth['centrelines'].values()])
+    points = points[points[:,0] < len(network)]
+    by_depth = dict()
+    for row in points:
+        by_depth.setdefault(int(row[0]),list()).append(row[1:])
+    by_depth = {depth: np.array(rows) for depth,rows in by_depth.items()}
+
+    found = 0
+    for z,x,y,_ in points:
+        if any(cv2.pointPolygonTest(area.contour,(float(x),float(y)),False) >= 0 for area in network[int(z)]):
+            found += 1
+    area_count = 0
+    matched = 0
+    errors = list()
+    for depth,areas in enumerate(network):
+        for area in areas:
+            area_count += 1
+            rows = by_depth.get(depth)
+            if rows is None:
+                continue
+            (x,y),_ = cv2.minEnclosingCircle(area.contour)
+            distances = np.hypot(rows[:,0]-x,rows[:,1]-y)
+            nearest = int(np.argmin(distances))
+            errors.append(distances[nearest])
+            if distances[nearest] <= rows[nearest,2]+margin:
+                matched += 1
+    return {
+        'points': len(points),
+        'areas': area_count,
+        'recall': found/len(points) if len(points) > 0 else 0.0,
+        'precision': matched/area_count if area_count > 0 else 0.0,
+        'center_error': float(np.mean(errors)) if errors else None,
+    }
@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import csv
+import json
+import shutil
+import time
+import traceback
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from networkclass import NetworkEngine
+from functions.preprocessing_utils import window_volume
+from functions.volume_utils import open_volume
+from functions.observer_utils import JsonLinesObserver
+from functions.profiling_utils import EngineProfiler
+from functions.cache_utils import StageCache, hash_input, stage_key
+from functions.segmentation_utils import extract_centroid_first_slice, find_knee_depth, extract_arteries_position_from_knee
+
+# Record wall time and peak traced memory of a pipeline stage in stages, the stage can add fields to the record it gets
+@contextlib.contextmanager
+def measure_stage(stages,name):
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    record = {"stage": name, "cached": False}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter()-start
+        record["peak_memory"] = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        stages.append(record)
+
+# Output of compute, or the cached one if cache has it (record is marked as cached)
+def cached_stage(cache,record,key,compute):
+    if cache is None:
+        return compute()
+    value,record["cached"] = cache.cached(key,compute)
+    return value
+
+# Run the notebooks pipeline on one volume: windowing, network construction from the aorta and from the knee arteries,
+# merge, segmentation and mask export. Outputs are written in output_directory/<patient>/ with the notebooks file names
+# With log_events, engine events are written in events.jsonl. With profile, the engine profiling trace is written in profile.npz
+# knee_depth and knee_seeds ((x,y) of the two knee arteries) replace the detected ones when given
+# With cache_directory, stage outputs are cached on disk (functions.cache_utils.StageCache) with keys made of the input content
+# hash and of the parameters the stage depends on, a re-run only computes the stages whose parameters changed
+# With checkpoint_interval, engine runs are checkpointed and a killed run is resumed by the next call
+# skip_step > 1 turns on the coarse to fine tracking of the engine (NetworkEngine.skip_step)
+# The input volume is windowed in slabs of at most max_memory bytes (functions.preprocessing_utils.window_volume)
+def run_patient(path,output_directory,initial_radius=10,engine_workers=1,trace_memory=True,log_events=False,profile=False,
+                alpha=0.6,beta=0.6,stop_depth=200,knee_depth=None,knee_seeds=None,cache_directory=None,cache_size=20*1024**3,
+                checkpoint_interval=None,skip_step=0,max_memory=64*1024**2):
+    path = Path(path)
+    patient_directory = Path(output_directory) / path.stem
+    patient_directory.mkdir(parents=True,exist_ok=True)
+    stages = list()
+    observer = None
+    cache = StageCache(cache_directory,cache_size) if cache_directory is not None else None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        if log_events:
+            observer = JsonLinesObserver(patient_directory / "events.jsonl")
+        profiler = EngineProfiler() if profile else None
+        # Image, processes and sinks of an engine, they are not cached
+        def attach(network_engine):
+            network_engine.image = image_array
+            network_engine.workers = engine_workers
+            if observer is not None:
+                network_engine.set_observer(observer)
+            network_engine.profiler = profiler
+            network_engine.checkpoint_path = None
+            return network_engine
+        # Run of an engine made by prepare, or resumed from the checkpoint of the same stage if it was interrupted
+        # Checkpoints are written in the patient directory every checkpoint_interval depths and removed once the run is done
+        def run_stage(key,prepare):
+            checkpoint_path = patient_directory / (key+".checkpoint")
+            if checkpoint_interval is not None and checkpoint_path.exists():
+                network_engine = attach(NetworkEngine.resume(checkpoint_path,image_array))
+            else:
+                network_engine = prepare()
+            if checkpoint_interval is not None:
+                network_engine.checkpoint_path, network_engine.checkpoint_interval = checkpoint_path, checkpoint_interval
+            network_engine.run()
+            network_engine.checkpoint_path = None
+            checkpoint_path.unlink(missing_ok=True)
+            return network_engine
+
+        windowed_image = None
+        if cache is not None:
+            with measure_stage(stages,"hash"):
+                input_key = hash_input(path)
+            windowing_key = stage_key("windowing",input_key)
+            windowed_image = cache.get_volume(windowing_key)
+        if windowed_image is None:
+            # The volume is read and windowed slab by slab, it keeps its type : NestedAverage sums of uint8 intensities would overflow
+            with measure_stage(stages,"windowing"):
+                image_array,_ = window_volume(path,patient_directory / "preprocessed_image.npy",dtype=None,max_memory=max_memory)
+                if cache is not None:
+                    cache.put_volume(windowing_key,image_array)
+        else:
+            with measure_stage(stages,"windowing") as record:
+                record["cached"] = True
+                shutil.copyfile(cache.get_path(windowing_key,".npy"),patient_directory / "preprocessed_image.npy")
+        # The rest of the pipeline reads the saved volume through a memory map
+        image_array = open_volume(patient_directory / "preprocessed_image.npy")
+        image_key = windowing_key if cache is not None else None
+
+        with measure_stage(stages,"centroid") as record:
+            centroid_key = stage_key("centroid",image_key)
+            target = cached_stage(cache,record,centroid_key,lambda: np.array(extract_centroid_first_slice(image_array)).astype(np.uint16))
+        with measure_stage(stages,"run") as record:
+            def prepare_run():
+                network_engine = attach(NetworkEngine(image_array,len(image_array)-1))
+                network_engine.alpha, network_engine.beta, network_engine.stop_depth = alpha, beta, stop_depth
+                network_engine.skip_step = skip_step
+                network_engine.network_manager.set_branch_target(0,target)
+                network_engine.network_manager.get_nested_intensity(0).add_number(image_array[len(image_array)-1,target[1],target[0]])
+                network_engine.network_manager.get_mean_radius(0).add_number(initial_radius)
+                return network_engine
+            run_key = stage_key("run",centroid_key,initial_radius=initial_radius,alpha=alpha,beta=beta,stop_depth=stop_depth,skip_step=skip_step)
+            network_engine = attach(cached_stage(cache,record,run_key,lambda: run_stage(run_key,prepare_run)))
+        with measure_stage(stages,"knee") as record:
+            def knee():
+                if knee_depth is not None and knee_seeds is not None:
+                    return knee_depth,tuple(knee_seeds[0]),tuple(knee_seeds[1])
+                detected_depth, knee_contour = find_knee_depth(image_array)
+                seed_depth = detected_depth if knee_depth is None else knee_depth
+                if knee_seeds is not None:
+                    return seed_depth,tuple(knee_seeds[0]),tuple(knee_seeds[1])
+                vessel1,vessel2 = extract_arteries_position_from_knee(image_array[seed_depth],knee_contour)
+                return seed_depth,vessel1,vessel2
+            knee_key = stage_key("knee",image_key,knee_depth=knee_depth,knee_seeds=knee_seeds)
+            seed_depth,vessel1,vessel2 = cached_stage(cache,record,knee_key,knee)
+        with measure_stage(stages,"explore_reverse") as record:
+            def explore_reverse():
+                network_engine.explore_reverse(vessel1,seed_depth)
+                network_engine.explore_reverse(vessel2,seed_depth)
+                return network_engine
+            explore_reverse_key = stage_key("explore_reverse",run_key,knee_key)
+            network_engine = attach(cached_stage(cache,record,explore_reverse_key,explore_reverse))
+        with measure_stage(stages,"run_knee") as record:
+            def prepare_run_knee():
+                network_engine.force_prepare_explore(vessel1,seed_depth)
+                network_engine.force_prepare_explore(vessel2,seed_depth)
+                return network_engine
+            run_knee_key = stage_key("run_knee",explore_reverse_key)
+            network_engine = attach(cached_stage(cache,record,run_knee_key,lambda: run_stage(run_knee_key,prepare_run_knee)))
+        with measure_stage(stages,"sanitize") as record:
+            def sanitize():
+                network_engine.network_manager.sanitize()
+                return network_engine.network_manager
+            sanitize_key = stage_key("sanitize",run_knee_key)
+            network_engine.network_manager = cached_stage(cache,record,sanitize_key,sanitize)
+        with measure_stage(stages,"merge") as record:
+            merge_key = stage_key("merge",sanitize_key)
+            merged_network_manager = cached_stage(cache,record,merge_key,lambda: network_engine.merge_network(network_engine.network_manager))
+        with measure_stage(stages,"segmentize") as record:
+            segmentize_key = stage_key("segmentize",merge_key)
+            segmented_network_manager = cached_stage(cache,record,segmentize_key,lambda: network_engine.segmentize(merged_network_manager))
+        with measure_stage(stages,"export"):
+            # Sparse masks, read them with functions.mask_utils.SparseMasks
+            segmented_network_manager.export_sparse(patient_directory / "mask_list.npz",image_array.shape,include_debug=False)
+        if profile:
+            profiler.save(patient_directory / "profile.npz")
+        return {"patient": path.stem, "path": str(path), "status": "success", "error": None, "stages": stages}
+    except Exception as e:
+        return {"patient": path.stem, "path": str(path), "status": "failed", "error": repr(e), "traceback": traceback.format_exc(), "stages": stages}
+    finally:
+        if observer is not None:
+            observer.close()
+        if trace_memory:
+            tracemalloc.stop()
+
+# Run every volume of input_directory matching pattern, patients are processed in parallel by workers processes
+# A failing patient is reported and does not stop the others. The report is written as report.json and report.csv in output_directory
+def run_batch(input_directory,output_directory,workers=1,pattern="*.mhd",**kwargs):
+    paths = sorted(Path(input_directory).glob(pattern))
+    Path(output_directory).mkdir(parents=True,exist_ok=True)
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_patient,path,output_directory,**kwargs) for path in paths]
+            results = list()
+            for path,future in zip(paths,futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # Worker process died (out of memory, ...)
+                    results.append({"patient": path.stem, "path": str(path), "status": "failed", "error": repr(e), "stages": []})
+    else:
+        results = [run_patient(path,output_directory,**kwargs) for path in paths]
+    report = {
+        "patients": results,
+        "success": sum(1 for result in results if result["status"] == "success"),
+        "failed": sum(1 for result in results if result["status"] != "success"),
+        "seconds": time.perf_counter()-start,
+    }
+    write_report(report,output_directory)
+    return report
+
+def write_report(report,output_directory):
+    with open(Path(output_directory) / "report.json","w") as f:
+        json.dump(report,f,indent=2)
+    with open(Path(output_directory) / "report.csv","w",newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["patient","status","stage","cached","seconds","peak_memory"])
+        for result in report["patients"]:
+            for stage in result["stages"]:
+                writer.writerow([result["patient"],result["status"],stage["stage"],stage["cached"],stage["seconds"],stage["peak_memory"]])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruct the vascular network of every volume in a directory")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--workers",type=int,default=1,help="number of patients processed in parallel")
+    parser.add_argument("--engine-workers",type=int,default=1,help="number of processes used by each NetworkEngine.run")
+    parser.add_argument("--pattern",default="*.mhd")
+    parser.add_argument("--initial-radius",type=float,default=10)
+    parser.add_argument("--no-trace-memory",action="store_true",help="do not measure peak memory (tracemalloc slows down the pipeline)")
+    parser.add_argument("--log-events",action="store_true",help="write engine events of each patient in events.jsonl")
+    parser.add_argument("--profile",action="store_true",help="write the engine profiling trace of each patient in profile.npz")
+    parser.add_argument("--alpha",type=float,default=0.6,help="region search threshold of the engine")
+    parser.add_argument("--beta",type=float,default=0.6,help="region growing threshold of the engine")
+    parser.add_argument("--stop-depth",type=int,default=200,help="depth where the exploration from the aorta stops")
+    parser.add_argument("--skip-step",type=int,default=0,help="track stable vessels every N slices and interpolate the slices in between")
+    parser.add_argument("--max-memory",type=float,default=64,help="memory used to window the input volume in MB")
+    parser.add_argument("--cache-directory",default=None,help="cache stage outputs in this directory to speed up re-runs")
+    parser.add_argument("--cache-size",type=float,default=20,help="maximum size of the cache in GB")
+    parser.add_argument("--checkpoint-interval",type=int,default=None,help="checkpoint engine runs every N depths and resume interrupted runs")
+    args = parser.parse_args(argv)
+    report = run_batch(args.input_directory,args.output_directory,args.workers,args.pattern,
+                       initial_radius=args.initial_radius,engine_workers=args.engine_workers,trace_memory=not args.no_trace_memory,
+                       log_events=args.log_events,profile=args.profile,alpha=args.alpha,beta=args.beta,stop_depth=args.stop_depth,
+                       cache_directory=args.cache_directory,cache_size=int(args.cache_size*1024**3),checkpoint_interval=args.checkpoint_interval,skip_step=args.skip_step,
+                       max_memory=int(args.max_memory*1024**2))
+    print(str(report["success"])+" success, "+str(report["failed"])+" failed in "+str(round(report["seconds"],1))+"s")
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
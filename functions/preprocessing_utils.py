@@ -0,0 +1,135 @@
+from pathlib import Path
+import numpy as np
+
+# Load a volume as a (depth,height,width) array, .mhd/.mha files are read with SimpleITK and .npy files with numpy
+def load_volume(path):
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path)
+    import SimpleITK as sitk
+    return sitk.GetArrayFromImage(sitk.ReadImage(path))
+
+# Same result as sitk.IntensityWindowingImageFilter : values are scaled linearly from the window to the output range,
+# clamped outside the window and truncated to the input type
+def window_intensity(image,window_minimum=0,window_maximum=1000,output_minimum=0,output_maximum=255):
+    scale = (output_maximum-output_minimum)/(window_maximum-window_minimum)
+    shift = output_minimum-window_minimum*scale
+    result = np.empty(image.shape,dtype=image.dtype)
+    # Slice by slice to keep the float buffer small
+    for i in range(len(image)):
+        values = image[i]*scale+shift
+        values[image[i] < window_minimum] = output_minimum
+        values[image[i] > window_maximum] = output_maximum
+        result[i] = values
+    return result
+
+# numpy types of the MetaImage element types
+MET_TYPES = {
+    "MET_CHAR": np.int8,
+    "MET_UCHAR": np.uint8,
+    "MET_SHORT": np.int16,
+    "MET_USHORT": np.uint16,
+    "MET_INT": np.int32,
+    "MET_UINT": np.uint32,
+    "MET_LONG": np.int64,
+    "MET_ULONG": np.uint64,
+    "MET_FLOAT": np.float32,
+    "MET_DOUBLE": np.float64,
+}
+
+# Fields of a MetaImage (.mhd/.mha) header as strings, with the size in bytes of the header
+# The header ends with the ElementDataFile field, in a .mha file the data follows it
+def read_mhd_header(path):
+    header = dict()
+    size = 0
+    with open(path,"rb") as f:
+        for line in f:
+            size += len(line)
+            key,_,value = line.decode("latin-1").partition("=")
+            header[key.strip()] = value.strip()
+            if key.strip() == "ElementDataFile":
+                break
+    return header,size
+
+# Raw data of a MetaImage as a read-only (depth,height,width) memory map, None if the data cannot be mapped
+# (compressed data, several channels or data files, not a 3D volume)
+def map_mhd(path):
+    path = Path(path)
+    header,header_size = read_mhd_header(path)
+    element_type = MET_TYPES.get(header.get("ElementType"))
+    data_file = header.get("ElementDataFile")
+    if (element_type is None or data_file is None or header.get("NDims") != "3" or header.get("CompressedData","False") == "True"
+        or int(header.get("ElementNumberOfChannels","1")) != 1 or data_file.startswith("LIST") or " " in data_file):
+        return None
+    width,height,depth = (int(value) for value in header["DimSize"].split())
+    big_endian = (header.get("ElementByteOrderMSB",header.get("BinaryDataByteOrderMSB","False")) == "True")
+    dtype = np.dtype(element_type).newbyteorder(">" if big_endian else "<")
+    if data_file == "LOCAL":
+        data_path, offset = path, header_size
+    else:
+        data_path, offset = path.parent / data_file, int(header.get("HeaderSize","0"))
+    return np.memmap(data_path,dtype=dtype,mode="r",offset=offset,shape=(depth,height,width))
+
+# Slabs of at most slab_depth slices of a volume file, as (first depth,array) : .npy files and uncompressed MetaImages
+# are read through a memory map, other files with the streaming reader of SimpleITK (which may read the whole file)
+def read_slabs(path,slab_depth):
+    path = Path(path)
+    volume = np.load(path,mmap_mode="r") if path.suffix == ".npy" else map_mhd(path) if path.suffix in (".mhd",".mha") else None
+    if volume is not None:
+        for start in range(0,len(volume),slab_depth):
+            yield start,np.asarray(volume[start:start+slab_depth])
+        return
+    import SimpleITK as sitk
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(str(path))
+    reader.ReadImageInformation()
+    width,height,depth = reader.GetSize()
+    for start in range(0,depth,slab_depth):
+        reader.SetExtractIndex((0,0,start))
+        reader.SetExtractSize((width,height,min(slab_depth,depth-start)))
+        yield start,sitk.GetArrayFromImage(reader.Execute())
+
+# Shape and type of a volume file without reading its data
+def volume_info(path):
+    path = Path(path)
+    if path.suffix == ".npy":
+        volume = np.load(path,mmap_mode="r")
+        return volume.shape,volume.dtype
+    volume = map_mhd(path) if path.suffix in (".mhd",".mha") else None
+    if volume is not None:
+        return volume.shape,volume.dtype
+    import SimpleITK as sitk
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(str(path))
+    reader.ReadImageInformation()
+    width,height,depth = reader.GetSize()
+    # The type is read on one voxel
+    reader.SetExtractIndex((0,0,0))
+    reader.SetExtractSize((1,1,1))
+    return (depth,height,width),sitk.GetArrayFromImage(reader.Execute()).dtype
+
+# window_intensity of a volume file written to the .npy file out slab by slab, without loading the volume
+# The output has type dtype (the input type if None), the slab depth is chosen so that a slab and its buffers use
+# less than max_memory bytes. With histogram, the count of each output value is computed in the same pass
+# Returns the output as a memory map and the histogram (None without histogram)
+def window_volume(path,out,window_minimum=0,window_maximum=1000,output_minimum=0,output_maximum=255,dtype=np.uint8,
+                  histogram=False,max_memory=64*1024**2):
+    shape,input_dtype = volume_info(path)
+    dtype = input_dtype.newbyteorder("=") if dtype is None else np.dtype(dtype)
+    scale = (output_maximum-output_minimum)/(window_maximum-window_minimum)
+    shift = output_minimum-window_minimum*scale
+    # Input slab, float64 values, comparison masks, output slab and histogram indices
+    slice_bytes = shape[1]*shape[2]*(input_dtype.itemsize+8+2+dtype.itemsize+(8 if histogram else 0))
+    slab_depth = max(int(max_memory//slice_bytes),1)
+    result = np.lib.format.open_memmap(out,mode="w+",dtype=dtype,shape=tuple(shape))
+    counts = np.zeros(int(output_maximum-output_minimum)+1,dtype=np.int64) if histogram else None
+    for start,slab in read_slabs(path,slab_depth):
+        values = slab*scale+shift
+        values[slab < window_minimum] = output_minimum
+        values[slab > window_maximum] = output_maximum
+        windowed = result[start:start+len(slab)]
+        windowed[...] = values
+        if histogram:
+            counts += np.bincount(windowed.ravel().astype(np.intp)-output_minimum,minlength=len(counts))
+    result.flush()
+    return result,counts
@@ -0,0 +1,90 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Columns of a profiling trace, one row per function, depth and branch (branch_id is -1 when a record is not about a branch)
+TRACE_DTYPE = np.dtype([('function',np.uint8),('depth',np.int32),('branch_id',np.int32),('calls',np.int64),
+                        ('seconds',np.float64),('pixels',np.int64),('pushes',np.int64),('guards',np.int64)])
+
+# Counters of the NetworkEngine hot path, set network_engine.profiler = EngineProfiler() before run to fill it
+# Records are summed by (function,depth,branch_id) :
+#   explore            one explored slice of a branch (includes the calls below)
+#   regionSearch       pixels = pixels checked before finding the target
+#   regionGrowing      pixels = window pixels labelled, guards = components stopped by the "sum > 2000" aorta guard
+#   exclusionMask      exclusion contours rasterized for a split branch
+#   split              split detection and creation of the child branch
+#   speculated         slices explored ahead by a NetworkScheduler worker (time is spent in the worker)
+#   push               explore calls pushed on the stack (pushes)
+#   skip               slices given interpolated contours by coarse to fine tracking (NetworkEngine.skip_step)
+#   merge_network      one depth of a merging pass, contour_intersect calls of merging are counted apart
+class EngineProfiler:
+    def __init__(self):
+        self.functions = list()
+        self.function_codes = dict()
+        self.counters = dict()
+
+    def record(self,function,depth,branch_id=-1,seconds=0.0,calls=1,pixels=0,pushes=0,guards=0):
+        code = self.function_codes.get(function)
+        if code is None:
+            code = len(self.functions)
+            self.functions.append(function)
+            self.function_codes[function] = code
+        key = (code,int(depth),int(branch_id))
+        counter = self.counters.get(key)
+        if counter is None:
+            self.counters[key] = [calls,seconds,pixels,pushes,guards]
+        else:
+            counter[0] += calls
+            counter[1] += seconds
+            counter[2] += pixels
+            counter[3] += pushes
+            counter[4] += guards
+
+    def clear(self):
+        self.counters.clear()
+
+    # Compact trace as a structured array (see TRACE_DTYPE), function codes index self.functions
+    def to_array(self):
+        trace = np.empty(len(self.counters),dtype=TRACE_DTYPE)
+        for row,(key,counter) in enumerate(self.counters.items()):
+            trace[row] = key+tuple(counter)
+        return np.sort(trace,order=['depth','branch_id','function'])
+
+    def to_dataframe(self):
+        return trace_to_dataframe(self.to_array(),self.functions)
+
+    # Total per function, sorted by time
+    def summary(self):
+        return summarize_trace(self.to_dataframe())
+
+    # Depths where the engine spent the most time, guards shows slices with a leaking region growing
+    def slowest_depths(self,count=10,function="explore"):
+        trace = self.to_dataframe()
+        trace = trace[trace['function'] == function]
+        return trace.groupby('depth')[['calls','seconds','pixels','guards']].sum().nlargest(count,'seconds')
+
+    # .parquet files are written with pandas (pyarrow or fastparquet needed), other paths as a compressed npz
+    def save(self,path):
+        path = Path(path)
+        if path.suffix == '.parquet':
+            self.to_dataframe().to_parquet(path,index=False)
+        else:
+            np.savez_compressed(path,trace=self.to_array(),functions=np.array(self.functions))
+
+def trace_to_dataframe(trace,functions):
+    trace = pd.DataFrame(trace)
+    trace['function'] = pd.Categorical.from_codes(trace['function'],categories=list(functions))
+    return trace
+
+def summarize_trace(trace):
+    summary = trace.groupby('function',observed=True)[['calls','seconds','pixels','pushes','guards']].sum()
+    summary['seconds_per_call'] = summary['seconds']/summary['calls']
+    return summary.sort_values('seconds',ascending=False)
+
+# Read a trace written by EngineProfiler.save as a DataFrame
+def load_trace(path):
+    path = Path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    with np.load(path) as data:
+        return trace_to_dataframe(data['trace'],[str(function) for function in data['functions']])
@@ -0,0 +1,132 @@
+import numpy as np
+from functions.ellipse_utils import draw_points_canvas, fit_canvas_ellipses, predict_and_compare_values, draw_ellipse_box
+from functions.mask_utils import SparseMasks, rasterize
+from functions.statistics_utils import compute_slice_statistics
+
+# First and last slice of a dense mask holding a 255 pixel, as find_slice_with_mask of anomaly_detection.ipynb (slice 0 is ignored)
+# Slices are found with one any reduction, None if the mask is empty
+def find_slice_range(mask):
+    slices = np.flatnonzero(np.any(np.asarray(mask[1:]) == 255,axis=(1,2)))+1
+    if len(slices) == 0:
+        return None
+    return int(slices[0]),int(slices[-1])
+
+# find_slice_range of a branch of SparseMasks, read from the depths of its areas
+def sparse_slice_range(sparse_masks,branch_id):
+    depths,_,_ = sparse_masks.get_branch(branch_id)
+    depths = depths[depths > 0]
+    if len(depths) == 0:
+        return None
+    return int(depths.min()),int(depths.max())
+
+# {depth: (canvas,offset)} of the mask of a branch, each slice drawn on its bounding box (see fit_canvas_ellipses)
+def sparse_canvases(sparse_masks,branch_id,slice_shape):
+    depths,offsets,points = sparse_masks.get_branch(branch_id)
+    order = np.argsort(depths,kind="stable")
+    canvases = dict()
+    for depth in np.unique(depths):
+        areas = order[np.searchsorted(depths[order],depth):np.searchsorted(depths[order],depth,side="right")]
+        slice_points = np.concatenate([points[offsets[i]:offsets[i+1]] for i in areas]).astype(np.intp)
+        canvases[int(depth)] = draw_points_canvas(slice_points,slice_shape)
+    return canvases
+
+# {depth: (canvas,offset)} of a dense mask, from its nonzero pixels
+def dense_canvases(mask):
+    canvases = dict()
+    for depth in np.flatnonzero(np.any(np.asarray(mask) != 0,axis=(1,2))):
+        ys, xs = np.nonzero(mask[depth])
+        canvases[int(depth)] = draw_points_canvas(np.stack([xs,ys],axis=1),mask.shape[1:])
+    return canvases
+
+# Write box in volume at depth and (x,y) offset where box is not 0, as the np.where(new != 0,new,network) of the notebook
+def composite_box(volume,depth,offset,box):
+    x0, y0 = offset
+    np.copyto(volume[depth,y0:y0+box.shape[0],x0:x0+box.shape[1]],box,where=box != 0,casting="unsafe")
+
+# Pixel values of the slices of create_heatmap of anomaly_detection.ipynb for the column str_value of a statistics table
+def heatmap_values(df,str_value):
+    if str_value == "proportion_calcification":
+        min_value, max_value = 0.85, 1
+        return [int(((1-value-min_value)*254/(max_value-min_value))+1) for value in df[str_value]]
+    min_value, max_value = -3, 3
+    return [int(((value+np.abs(min_value))*254/(max_value-min_value))+1) for value in df[str_value]]
+
+# Dilated ellipses of a branch (construct_ellipses_network of the notebook) as one (box,offset) per slice from rangemin,
+# with the fitted parameters. None if the mask has too few pixels
+def branch_ellipse_boxes(canvases,rangemin,rangemax,all_ranges_max,slice_shape):
+    list_params = fit_canvas_ellipses(canvases,rangemin,rangemax)
+    if list_params is None:
+        return None
+    new_list_param, list_products_ab, list_products_ab_predicted = predict_and_compare_values(list_params,rangemin,all_ranges_max)
+    boxes = [draw_ellipse_box(params,slice_shape,dilate=True) for params in new_list_param]
+    return boxes,new_list_param,list_products_ab,list_products_ab_predicted
+
+# Statistics table of a branch (compute_stats_table of the notebook) computed on the slab of its range cut to the bounding box
+# of its ellipses : the lumen mask is the dilated ellipses drawn with 255
+def branch_statistics(image,boxes,rangemin,list_ab,list_ab_predicted,list_params_ellipses):
+    x0 = min(offset[0] for _,offset in boxes)
+    y0 = min(offset[1] for _,offset in boxes)
+    x1 = max(offset[0]+box.shape[1] for box,offset in boxes)
+    y1 = max(offset[1]+box.shape[0] for box,offset in boxes)
+    lumen = np.zeros((len(boxes),max(y1-y0,0),max(x1-x0,0)),dtype=np.uint8)
+    for index,(box,offset) in enumerate(boxes):
+        lumen[index,offset[1]-y0:offset[1]-y0+box.shape[0],offset[0]-x0:offset[0]-x0+box.shape[1]] = box
+    slab = np.asarray(image[rangemin:rangemin+len(boxes),y0:y1,x0:x1])
+    df = compute_slice_statistics(slab,lumen,0,len(boxes),list_ab,list_ab_predicted,list_params_ellipses)
+    df['index'] += rangemin
+    return df
+
+# Same networks and statistics as constructing_all_networks of anomaly_detection.ipynb for the masks min_range to max_range-1
+# of mask_list (SparseMasks or a list of dense masks). Each requested network is one uint8 volume where every branch is
+# composited in place, only inside its slice range and the bounding box of its ellipses, so memory and time scale with the vessel
+# voxels and not with the number of branches times the volume. Networks that are not requested are None, with one mask they are
+# built as with several (the notebook builds all of them in that case)
+# Returns mask_network, ellipses_network, arteries_network, ellipses_heatmap_network, list_table_stats
+def reconstruct_networks(image,mask_list,min_range,max_range,param_to_study="z",reconstruct_ellipse=False,reconstruct_arteries=False,
+                         reconstruct_masks=False,reconstruct_heatmap=False):
+    sparse = isinstance(mask_list,SparseMasks)
+    shape = tuple(mask_list.shape) if sparse else mask_list[0].shape
+    slice_shape = shape[1:]
+    mask_network = np.zeros(shape,dtype=np.uint8) if reconstruct_masks else None
+    ellipses_network = np.zeros(shape,dtype=np.uint8) if reconstruct_ellipse else None
+    arteries_network = np.zeros(shape,dtype=np.uint8) if reconstruct_arteries else None
+    ellipses_heatmap_network = np.zeros(shape,dtype=np.uint8) if reconstruct_heatmap else None
+    list_table_stats = []
+
+    if sparse:
+        slice_ranges = [sparse_slice_range(mask_list,branch_id) for branch_id in mask_list.branch_ids]
+    else:
+        slice_ranges = [find_slice_range(mask) for mask in mask_list]
+    # Last slice of every mask, kept as bifurcations by predict_and_compare_values
+    all_ranges_max = [slice_range[1] for slice_range in slice_ranges if slice_range is not None]
+
+    for index in range(min_range,max_range):
+        if reconstruct_masks:
+            if sparse:
+                rasterize(mask_network,*mask_list.get_branch(mask_list.branch_ids[index]))
+            else:
+                np.copyto(mask_network,mask_list[index],where=mask_list[index] != 0)
+        if slice_ranges[index] is None:
+            continue
+        rangemin, rangemax = slice_ranges[index][0],slice_ranges[index][1]+1
+        canvases = sparse_canvases(mask_list,mask_list.branch_ids[index],slice_shape) if sparse else dense_canvases(mask_list[index])
+        ellipses = branch_ellipse_boxes(canvases,rangemin,rangemax,all_ranges_max,slice_shape)
+        if ellipses is None:
+            continue
+        boxes, list_params_ellipses, list_ab, list_ab_predicted = ellipses
+        for depth,(box,offset) in enumerate(boxes,rangemin):
+            if reconstruct_ellipse:
+                composite_box(ellipses_network,depth,offset,box)
+            if reconstruct_arteries:
+                x0, y0 = offset
+                arteries = np.where(box == 255,image[depth,y0:y0+box.shape[0],x0:x0+box.shape[1]],0)
+                composite_box(arteries_network,depth,offset,arteries)
+
+        df = branch_statistics(image,boxes,rangemin,list_ab,list_ab_predicted,list_params_ellipses)
+        list_table_stats.append(df)
+
+        if reconstruct_heatmap:
+            for depth,(params,value) in enumerate(zip(list_params_ellipses,heatmap_values(df,param_to_study)),rangemin):
+                box,offset = draw_ellipse_box(params,slice_shape,value,dilate=True)
+                composite_box(ellipses_heatmap_network,depth,offset,box)
+    return mask_network, ellipses_network, arteries_network, ellipses_heatmap_network, list_table_stats
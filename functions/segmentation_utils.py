@@ -1,4 +1,6 @@
 import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import pandas as pd
 import numpy as np
@@ -20,7 +22,7 @@ def extract_centroid_first_slice(img):
     zslice = img[z-1,:,:]
 
     # érosion de l'image
-    zslice_erosion_shift = skimage.morphology.erosion(zslice, shift_x=True, shift_y=True)
+    zslice_erosion_shift = skimage.morphology.erosion(zslice)
 
     # Créer une image binaire à partir du seuil d'Otsu
     value_threshold_otsu = skimage.filters.threshold_otsu(zslice_erosion_shift)
@@ -48,32 +50,56 @@ def extract_centroid_first_slice(img):
 
     return(coordinates) 
 
+# Bone mask of a slice used by find_knee_depth, values outside the bone range are set to 0
+def knee_canvas(zslice,bone_low_range=70,bone_high_range=255):
+    canvas = zslice.astype(np.uint8)
+    canvas[canvas>bone_high_range] = 0
+    canvas[canvas<bone_low_range] = 0
+    return canvas
+
+# Area of the largest bounding box of a bone mask whose sides ratio is < 3 (w == h is ignored), 0 if there is none
+def knee_object_area(canvas):
+    contours, _ = cv2.findContours(canvas, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    bounding_rects = [cv2.boundingRect(cnt) for cnt in contours]
+    return max([w*h if (w>h and w/h < 3) or (w<h and h/w < 3) else 0 for (_,_,w,h) in bounding_rects],default=0)
+
+# knee_object_area of the slices in [low,high), read by slabs of slab_size slices whose slices are thresholded and outlined
+# by a thread pool (numpy and OpenCV release the GIL). Only the search range is read, image can be a memory map or a LazyVolume
+def knee_object_areas(image,low,high,bone_low_range=70,bone_high_range=255,workers=None,slab_size=16):
+    workers = min(8,os.cpu_count() or 1) if workers is None else workers
+    object_areas = np.zeros(max(high-low,0),dtype=np.int64)
+    areas = lambda zslice: knee_object_area(knee_canvas(zslice,bone_low_range,bone_high_range))
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for start in range(low,high,slab_size):
+            stop = min(start+slab_size,high)
+            slab = np.asarray(image[start:stop])
+            object_areas[start-low:stop-low] = list(map(areas,slab) if executor is None else executor.map(areas,slab))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return object_areas
+
 # From a bottom body angiography, find the knee position given image + bone intensity range
 # Function return depth of the knee and knee contour 
-def find_knee_depth(image,bone_low_range=70,bone_high_range=255):
+# Only the search range is read, so image can be a memory map or a LazyVolume
+def find_knee_depth(image,bone_low_range=70,bone_high_range=255,workers=None):
     depth = len(image)
-    canvas = copy.deepcopy(image.astype(np.uint8))
     # We assume we should find knee in the 1/6 - 3/6 range on a bottom body angiography
     knee_low_index = int(depth/6)
     knee_high_index = int(depth/6 * 3)
-    canvas[canvas>bone_high_range] = 0
-    canvas[canvas<bone_low_range] = 0
     
-    object_areas = list()
-
     # We look for the largest contour in the search range (we search object where width ~= height )
-    for i in range(knee_low_index,knee_high_index):
-        contours, _ = cv2.findContours(canvas[i], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        bounding_rects = [cv2.boundingRect(cnt) for cnt in contours]
-        object_areas.append(max([w*h if (w>h and w/h < 3) or (w<h and h/w < 3) else 0 for (_,_,w,h) in bounding_rects],default=0))
+    object_areas = knee_object_areas(image,knee_low_index,knee_high_index,bone_low_range,bone_high_range,workers)
     
-    max_area_depth = knee_low_index + object_areas.index(max(object_areas))
-    contours, _ = cv2.findContours(canvas[max_area_depth], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    max_area_depth = knee_low_index + int(np.argmax(object_areas))
+    canvas = knee_canvas(image[max_area_depth],bone_low_range,bone_high_range)
+    contours, _ = cv2.findContours(canvas, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     bounding_rects = [cv2.boundingRect(cnt) for cnt in contours]
     filtered_bounding_rects = [w*h if (w/h < 3) else 0 for (_,_,w,h) in bounding_rects]
     index_contour = np.argsort(filtered_bounding_rects)[-2:]
     # Fill knee polygon
-    mask = np.zeros_like(canvas[0], dtype=np.uint8)
+    mask = np.zeros_like(canvas, dtype=np.uint8)
     cv2.drawContours(mask, [contours[index_contour[0]]],-1, 255,1)
     cv2.drawContours(mask, [contours[index_contour[1]]],-1, 255,1)
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(5,5))
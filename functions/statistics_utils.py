@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# Per slice statistics of the pixels of image inside a lumen mask (pixels == 255), same table as the Descriptor pipeline of
+# anomaly_detection.ipynb (compute_stats + convert_stats_to_table). Only slices rangemin to rangemax-1 are used
+# Pixels are grouped by slice with np.bincount : mean and sd without calcifications (< calcification_threshold),
+# proportion of calcification (> calcification_threshold), deviations to the mean of all slices and z score
+def compute_slice_statistics(image,lumen_mask,rangemin,rangemax,list_ab,list_ab_predicted,list_params_ellipses,calcification_threshold=250):
+    inside = lumen_mask[rangemin:rangemax] == 255
+    slice_count = len(inside)
+    slice_index = np.nonzero(inside)[0]
+    values = np.asarray(image[rangemin:rangemax])[inside].astype(np.float64)
+
+    kept = values < calcification_threshold
+    kept_index = slice_index[kept]
+    kept_values = values[kept]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        count = np.bincount(kept_index,minlength=slice_count)
+        mean = np.bincount(kept_index,weights=kept_values,minlength=slice_count)/count
+        # Two pass variance, as np.std
+        deviation = kept_values-mean[kept_index]
+        sd = np.sqrt(np.bincount(kept_index,weights=deviation*deviation,minlength=slice_count)/count)
+        proportion_calcification = (np.bincount(slice_index[values > calcification_threshold],minlength=slice_count)
+                                    /np.bincount(slice_index,minlength=slice_count))
+        mean_mean = np.mean(mean)
+        mean_sd = np.mean(sd)
+        deviation_mean = ((mean-mean_mean)/mean_mean)*100
+        deviation_sd = ((sd-mean_sd)/mean_sd)*100
+        z = (mean-mean_mean)/np.sqrt(sd+mean_sd)
+
+    params = list_params_ellipses[:slice_count]
+    return pd.DataFrame({
+        'index': np.arange(rangemin,rangemin+slice_count),
+        'mean': mean,
+        'deviation_mean': deviation_mean,
+        'sd': sd,
+        'deviation_sd': deviation_sd,
+        'z': z,
+        'proportion_calcification': proportion_calcification,
+        'ab': list_ab[:slice_count],
+        'ab_pred': list_ab_predicted[:slice_count],
+        'xc': [param[0][0] for param in params],
+        'yc': [param[0][1] for param in params],
+        'a': [param[1][0] for param in params],
+        'b': [param[1][1] for param in params],
+        'theta': [param[2] for param in params],
+    })
+
+# Same call as compute_stats of anomaly_detection.ipynb, returns the table directly
+def compute_stats_table(info_one_mask,arteries,calcification_threshold=250):
+    return compute_slice_statistics(arteries,info_one_mask['ellipses_3D'],info_one_mask['rangemin'],info_one_mask['rangemax'],
+                                    info_one_mask['list_ab'],info_one_mask['list_ab_predicted'],info_one_mask['list_params_ellipses'],
+                                    calcification_threshold)
@@ -0,0 +1,53 @@
+import collections
+from pathlib import Path
+import numpy as np
+
+# Read-only (depth,height,width) volume decoding slices on demand from a memory map or any array-like source
+# (h5py/zarr dataset, ...). The last decoded slices are kept in a small LRU cache, indexing a depth returns a cached slice
+class LazyVolume:
+    def __init__(self,source,cache_size=64):
+        self.source = source
+        self.cache_size = cache_size
+        self.shape = tuple(source.shape)
+        self.dtype = np.dtype(source.dtype)
+        self.ndim = len(self.shape)
+        self.slices = collections.OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    def get_slice(self,depth):
+        depth = int(depth)
+        if depth < 0:
+            depth += self.shape[0]
+        zslice = self.slices.get(depth)
+        if zslice is not None:
+            self.slices.move_to_end(depth)
+            return zslice
+        zslice = np.array(self.source[depth])
+        zslice.setflags(write=False)
+        self.slices[depth] = zslice
+        if len(self.slices) > self.cache_size:
+            self.slices.popitem(last=False)
+        return zslice
+
+    def __getitem__(self,key):
+        if isinstance(key,tuple) and len(key) > 0 and isinstance(key[0],(int,np.integer)):
+            zslice = self.get_slice(key[0])
+            return zslice[key[1:]] if len(key) > 1 else zslice
+        if isinstance(key,(int,np.integer)):
+            return self.get_slice(key)
+        # Anything else (ranges of slices, masks, ...) is read from the source without cache
+        return np.asarray(self.source[key])
+
+    def __array__(self,dtype=None,copy=None):
+        array = np.asarray(self.source[...])
+        return array if dtype is None else array.astype(dtype)
+
+# Open a .npy volume as a memory map wrapped in a LazyVolume, the volume is never fully loaded in memory
+def open_volume(path,cache_size=64):
+    return LazyVolume(np.load(Path(path),mmap_mode="r"),cache_size)
@@ -0,0 +1,30 @@
+
+# Disjoint set of hashable elements where each element points directly to the root of its set
+# Elements that are not registered are roots of their own set. Unlike a classic union-find, an element can leave its set
+class DisjointSet:
+    def __init__(self):
+        self.root = dict()
+        self.members = dict()
+
+    def find(self,element):
+        return self.root.get(element,element)
+
+    def is_merged(self,element):
+        return element in self.root
+
+    # Move element and the elements of its set to the set of root, return the elements that followed element
+    def union(self,root,element):
+        self.remove(element)
+        followers = self.members.pop(element,set())
+        for follower in followers:
+            self.root[follower] = root
+        self.root[element] = root
+        members = self.members.setdefault(root,set())
+        members.update(followers)
+        members.add(element)
+        return followers
+
+    def remove(self,element):
+        root = self.root.pop(element,None)
+        if root is not None:
+            self.members[root].discard(element)
@@ -1,28 +1,66 @@
-import copy
+import collections
+import numpy as np
+
+# Numbers summed in window order, numpy floats included (np.float32 is not a float)
+FLOAT_TYPES = (float,np.floating)
 
 # This class is used to compute an average value on a variable windows
+# The window holds the last limit+1 numbers, oldest first, in a bounded deque with a running sum
 class NestedAverage:
-    def __init__(self,numbers=list(),limit=10,average=0,count=0):
+    __slots__ = ("limit","average","count","window","sum","floats")
+
+    def __init__(self,numbers=None,limit=10,average=0,count=0):
         self.limit = limit
         self.average = average
         self.count = count
-        self.numbers = numbers
-        if self.average == 0 and self.count == 0:
-            self.numbers = []
-    
+        self.window = collections.deque(maxlen=limit+1)
+        self.sum = 0
+        # Number of floats (python or numpy) in the window
+        self.floats = 0
+        if numbers is not None and not (self.average == 0 and self.count == 0):
+            self.window.extend(numbers)
+            self.sum = sum(self.window)
+            self.floats = sum(1 for number in self.window if isinstance(number,FLOAT_TYPES))
+
     def add_number(self, number):
-        self.numbers.append(number)
+        if isinstance(number,FLOAT_TYPES):
+            self.floats += 1
         if self.count > self.limit:
-            self.numbers.pop(0)
+            # Window is full, the oldest number is dropped by the deque
+            removed = self.window[0]
+            self.window.append(number)
+            if isinstance(removed,FLOAT_TYPES):
+                self.floats -= 1
+                self.sum = sum(self.window)
+            elif self.floats > 0:
+                # Float sums are recomputed in window order to keep the same rounding as sum() on the window
+                self.sum = sum(self.window)
+            else:
+                # Integer sums are exact (numpy integers wrap the same way), the order does not matter
+                self.sum = self.sum + number - removed
         else:
+            self.window.append(number)
+            self.sum = self.sum + number
             self.count += 1
-        self.average = sum(self.numbers)/self.count
+        self.average = self.sum/self.count
+
+    # Numbers of the window, oldest first
+    @property
+    def numbers(self):
+        return list(self.window)
 
     def get_average(self):
         return self.average
-    
+
     def get_last(self):
-        return self.numbers[-1]
-    
+        return self.window[-1]
+
     def copy(self):
-        return copy.deepcopy(self)
\ No newline at end of file
+        copied = NestedAverage.__new__(NestedAverage)
+        copied.limit = self.limit
+        copied.average = self.average
+        copied.count = self.count
+        copied.window = self.window.copy()
+        copied.sum = self.sum
+        copied.floats = self.floats
+        return copied
@@ -0,0 +1,121 @@
+import numpy as np
+from .NetworkManagerArea import NetworkManagerArea
+
+# Columnar storage of the areas detected in a network. Contour points of every area are concatenated in one int16 buffer,
+# area i owns points[offsets[i]:offsets[i+1]]. Areas are returned as NetworkManagerArea views on this store
+class NetworkAreaStore:
+    def __init__(self,capacity=1024,point_capacity=65536):
+        self.size = 0
+        self.points = np.empty((point_capacity,2),dtype=np.int16)
+        self.offsets = np.zeros(capacity+1,dtype=np.int64)
+        self.branch_ids = np.empty(capacity,dtype=np.int32)
+        self.depths = np.empty(capacity,dtype=np.int32)
+        self.predicted = np.empty(capacity,dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def append(self,depth,branch_id,contour,predicted=False):
+        points = np.asarray(contour).reshape(-1,2)
+        start = self.offsets[self.size]
+        end = start + len(points)
+        if self.size == len(self.branch_ids):
+            self.reserve(max(2*self.size,1),len(self.points))
+        if end > len(self.points):
+            self.reserve(len(self.branch_ids),max(2*len(self.points),end))
+        self.points[start:end] = points
+        self.offsets[self.size+1] = end
+        self.branch_ids[self.size] = branch_id
+        self.depths[self.size] = depth
+        self.predicted[self.size] = predicted
+        self.size += 1
+        return NetworkManagerArea(self,self.size-1)
+
+    # Grow buffers (amortized doubling is done by append)
+    def reserve(self,capacity,point_capacity):
+        def grow(array,length):
+            if len(array) >= length:
+                return array
+            grown = np.empty((length,)+array.shape[1:],dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+        self.points = grow(self.points,point_capacity)
+        self.offsets = grow(self.offsets,capacity+1)
+        self.branch_ids = grow(self.branch_ids,capacity)
+        self.depths = grow(self.depths,capacity)
+        self.predicted = grow(self.predicted,capacity)
+
+    # Rebuild the buffers with only the given areas (the areas still in the network), in store order. Their views are updated
+    # in place, so lists holding them stay valid. Views of the other areas are no longer valid
+    def compact(self,areas):
+        areas = sorted(areas,key=lambda area: area.index)
+        indices = np.array([area.index for area in areas],dtype=np.int64)
+        offsets,points = self.gather(indices)
+        # Buffers keep room for one area so that append can double them, fancy indexing copies read-only buffers
+        capacity = max(len(areas),1)
+        def rebuild(array,length):
+            rebuilt = np.empty((length,)+array.shape[1:],dtype=array.dtype)
+            rebuilt[:len(array)] = array
+            return rebuilt
+        self.branch_ids = rebuild(self.branch_ids[indices],capacity)
+        self.depths = rebuild(self.depths[indices],capacity)
+        self.predicted = rebuild(self.predicted[indices],capacity)
+        self.offsets = rebuild(offsets,capacity+1)
+        self.points = rebuild(points,max(len(points),1))
+        for index,area in enumerate(areas):
+            area.index = index
+        self.size = len(areas)
+
+    # Contour of area index, in OpenCV format (int32, n x 1 x 2)
+    def get_contour(self,index):
+        return self.points[self.offsets[index]:self.offsets[index+1]].astype(np.int32).reshape(-1,1,2)
+
+    # Points of several areas concatenated, with their offsets in the result (offsets[i]:offsets[i+1] for the i-th area)
+    def gather(self,indices):
+        indices = np.asarray(indices,dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices+1]-starts
+        offsets = np.zeros(len(indices)+1,dtype=np.int64)
+        np.cumsum(lengths,out=offsets[1:])
+        point_index = np.repeat(starts-offsets[:-1],lengths)+np.arange(offsets[-1])
+        return offsets,self.points[point_index]
+
+    # Used part of the buffers, arrays are views on the store (no copy)
+    def get_buffers(self):
+        return {
+            'points': self.points[:self.offsets[self.size]],
+            'offsets': self.offsets[:self.size+1],
+            'branch_ids': self.branch_ids[:self.size],
+            'depths': self.depths[:self.size],
+            'predicted': self.predicted[:self.size]
+        }
+
+    # Build a store on existing buffers (no copy), buffers can be read-only (memory map)
+    @classmethod
+    def from_buffers(cls,buffers):
+        store = cls.__new__(cls)
+        store.points = np.asarray(buffers['points']).reshape(-1,2)
+        store.offsets = np.asarray(buffers['offsets'])
+        store.branch_ids = np.asarray(buffers['branch_ids'])
+        store.depths = np.asarray(buffers['depths'])
+        store.predicted = np.asarray(buffers['predicted'])
+        store.size = len(store.branch_ids)
+        return store
+
+    def get_areas(self):
+        return [NetworkManagerArea(self,index) for index in range(self.size)]
+
+    def save(self,path):
+        np.savez(path,**self.get_buffers())
+
+    @classmethod
+    def load(cls,path):
+        with np.load(path) as data:
+            return cls.from_buffers({key: data[key] for key in data.files})
+
+    # Pickle only the used part of the buffers (views, pickled out-of-band with protocol 5)
+    def __getstate__(self):
+        return self.get_buffers()
+
+    def __setstate__(self,state):
+        self.__dict__.update(NetworkAreaStore.from_buffers(state).__dict__)
@@ -1,11 +1,13 @@
 import copy
-from functools import partial
+import os
+import pickle
+import tempfile
+import time
 from unittest import result
 
 from matplotlib import pyplot as plt
 from functions.contours_utils import contour_intersect, merge_contours
 from functions.exploration_utils import *
-from tqdm.notebook import tqdm
 from . import *
 
 
@@ -24,7 +26,69 @@ class NetworkEngine:
         self.alpha = 0.6 #alpha >= beta used for region search
         self.beta = 0.6 #similarity score used for region growing
         self.stop_depth = 200
-        self.pbar = tqdm(total=max_depth-self.stop_depth)
+        # Number of processes used by run, branches are explored ahead by workers when > 1 (same result as a serial run)
+        # Workers reopen the file of a .npy memory map (preprocessing_utils.window_volume output), any other image is copied
+        # into a shared memory block of the full volume size for the run, which doubles the resident memory of the image
+        self.workers = 1
+        # Number of slices a worker explores ahead for a branch
+        self.speculation_depth = 32
+        self.scheduler = None
+        # Split, branch and timing events are sent to observer (dropped by default), see set_observer
+        self.observer = NetworkObserver()
+        # functions.profiling_utils.EngineProfiler counting calls, pixels and time of the hot path (None : no profiling)
+        self.profiler = None
+        # During run, the engine state is written in checkpoint_path every checkpoint_interval depths (None : no checkpoint), see resume
+        self.checkpoint_path = None
+        self.checkpoint_interval = 50
+        # Coarse to fine tracking (off when skip_step < 2) : a stable branch explores the slice skip_step slices below its last one
+        # from a linear prediction of its center, slices in between get interpolated contours, see skip_ahead
+        self.skip_step = 0
+        # Largest relative change of radius and drop of intensity of a stable branch, larger changes are tracked on every slice
+        self.skip_tolerance = 0.15
+        # Depth below which a branch can skip again after a dropped probe
+        self.skip_wait = dict()
+
+    # The engine is pickled without its image and runtime helpers (scheduler, observer, profiler), set image after loading it
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["image"] = None
+        state["scheduler"] = None
+        state["observer"] = NetworkObserver()
+        state["profiler"] = None
+        return state
+
+    # Write the engine state (branches, stack, network manager) in path, the file is replaced only once completely written
+    def checkpoint(self,path):
+        handle,temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),prefix=".tmp-")
+        try:
+            with os.fdopen(handle,"wb") as f:
+                pickle.dump(self,f,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path,path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    # Engine written by checkpoint, run continues from the checkpoint depth and gives the same result as an uninterrupted run
+    # stop_depth can be changed before run to explore only a range of depths
+    @classmethod
+    def resume(cls,path,image):
+        with open(path,"rb") as f:
+            network_engine = pickle.load(f)
+        network_engine.image = image
+        return network_engine
+
+    # Send events of the engine and of its network manager to observer (sinks are in functions.observer_utils)
+    def set_observer(self,observer):
+        self.observer = observer
+        self.network_manager.observer = observer
+
+    # Stop exploring a branch at its current depth, short branches are removed
+    def terminate_branch(self,branch_id,reason):
+        length = self.network_manager.branch_length[branch_id]
+        self.observer.emit("branch_terminated",branch_id=branch_id,depth=self.branch_depth[branch_id],reason=reason,length=length,removed=length < 20)
+        self.branch_depth[branch_id] = 0
+        if length < 20:
+            self.network_manager.remove_branch(branch_id)
 
     def get_new_branch(self,parent_branch_id,reverse=False,force_depth=None):
         child_id = self.network_manager.get_new_branch(parent_branch_id,reverse)
@@ -44,37 +108,77 @@ class NetworkEngine:
                 self.branch_protected_split.append(force_depth)
         return child_id
     
+    # regionSearch, regionGrowing and exclusionMask of the engine, recorded by the profiler if there is one
+    def region_search(self,branch_id,depth,*args):
+        if self.profiler is None:
+            return regionSearch(*args)
+        stats = dict()
+        start = time.perf_counter()
+        result = regionSearch(*args,stats=stats)
+        self.profiler.record("regionSearch",depth,branch_id,time.perf_counter()-start,pixels=stats.get("pixels",0))
+        return result
+
+    def region_growing(self,branch_id,depth,*args):
+        if self.profiler is None:
+            return regionGrowing(*args)
+        stats = dict()
+        start = time.perf_counter()
+        result = regionGrowing(*args,stats=stats)
+        self.profiler.record("regionGrowing",depth,branch_id,time.perf_counter()-start,pixels=stats.get("pixels",0),guards=stats.get("guards",0))
+        return result
+
+    def exclusion_mask(self,branch_id,depth,excluded):
+        if self.profiler is None:
+            return exclusionMask(self.image.shape[1:],excluded)
+        start = time.perf_counter()
+        result = exclusionMask(self.image.shape[1:],excluded)
+        self.profiler.record("exclusionMask",depth,branch_id,time.perf_counter()-start)
+        return result
+
     # Callback function used in case of split considered as successfull
     def success_split(self,parent_branch,new_target,child_depth,exclusion_radius):
         self.network_manager.set_branch_target(parent_branch,new_target)
-        print("SUCCESS SPLIT PARENT "+str(parent_branch))
+        self.observer.emit("split_success",branch_id=parent_branch,child_depth=child_depth)
         self.network_manager.branch_mean_radius[parent_branch] = RunningAverage(exclusion_radius,1,exclusion_radius)
         self.branch_monitored_depth[parent_branch] = child_depth
         self.branch_protected_split[parent_branch] = child_depth
         #Rollback parent branch if success (cancel last add)
         self.branch_depth[parent_branch]+=1
-        self.network_manager.network[self.branch_depth[parent_branch]].remove(next((area for area in self.network_manager.network[self.branch_depth[parent_branch]] if area.branch_id == parent_branch),None))
+        self.network_manager.remove_from_network(self.branch_depth[parent_branch],parent_branch)
 
     # Explore is the core function of the Network engine, it find target in a slice, grows it and check if it's correct + manage vessel splitting
+    # onsuccess holds the success_split arguments of a newly splitted branch (stack entries are data so the engine can be pickled)
     def explore(self,branch_id,iteration=1,excluded=None,onsuccess=None):
         multi = True if iteration > 1 else False
+        # Exclusion contours are rasterized once and reused for every iteration
+        excluded_mask = None
         for i in range(iteration):
-            foundTarget = regionSearch(self.image[self.branch_depth[branch_id],:,:],self.network_manager.get_branch_target(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.network_manager.get_nested_intensity(branch_id).get_average()*self.alpha)
-            if not isinstance(excluded,type(None)):
-                #Case exploring a newly splitted branch
-                tube_contour,predicted = regionGrowing(self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta,excluded)
-            elif(self.branch_monitored_depth[branch_id]<self.branch_depth[branch_id]):
-                #Case a splitted branch has succeed and we do not want it to merge with parent
-                excluded = list()
-                for area in self.network_manager.network[self.branch_depth[branch_id]]:
-                    excluded.append(area.contour)
-                tube_contour,predicted = regionGrowing(self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta,excluded)
+            speculated = None
+            if self.scheduler is not None and isinstance(excluded,type(None)) and not self.branch_monitored_depth[branch_id]<self.branch_depth[branch_id]:
+                speculated = self.scheduler.get_step(branch_id)
+            if speculated is not None:
+                #Case a worker has already explored this step
+                foundTarget,tube_contour,predicted = speculated
+                if self.profiler is not None:
+                    self.profiler.record("speculated",self.branch_depth[branch_id],branch_id)
             else:
-                tube_contour,predicted = regionGrowing(self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta)
+                foundTarget = self.region_search(branch_id,self.branch_depth[branch_id],self.image[self.branch_depth[branch_id],:,:],self.network_manager.get_branch_target(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.network_manager.get_nested_intensity(branch_id).get_average()*self.alpha)
+                if not isinstance(excluded,type(None)):
+                    #Case exploring a newly splitted branch
+                    if excluded_mask is None:
+                        excluded_mask = self.exclusion_mask(branch_id,self.branch_depth[branch_id],excluded)
+                    tube_contour,predicted = self.region_growing(branch_id,self.branch_depth[branch_id],self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta,excluded_mask)
+                elif(self.branch_monitored_depth[branch_id]<self.branch_depth[branch_id]):
+                    #Case a splitted branch has succeed and we do not want it to merge with parent
+                    excluded = list()
+                    for area in self.network_manager.network[self.branch_depth[branch_id]]:
+                        excluded.append(area.contour)
+                    excluded_mask = self.exclusion_mask(branch_id,self.branch_depth[branch_id],excluded)
+                    tube_contour,predicted = self.region_growing(branch_id,self.branch_depth[branch_id],self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta,excluded_mask)
+                else:
+                    tube_contour,predicted = self.region_growing(branch_id,self.branch_depth[branch_id],self.image[self.branch_depth[branch_id],:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta)
             if len(tube_contour)==0:
-                self.branch_depth[branch_id] = 0
-                if self.network_manager.branch_length[branch_id] < 20:
-                    self.network_manager.remove_branch(branch_id)
+                self.terminate_branch(branch_id,"no_contour")
                 break
             center, radius = cv2.minEnclosingCircle(tube_contour)
             self.network_manager.add_label((self.branch_depth[branch_id],center[1],center[0]),"Predicted "+str(predicted)+" "+str(branch_id))
@@ -82,8 +186,9 @@ class NetworkEngine:
             #  we check if the branch is not protected from splitting + if there is a constriction on the vessel radius
             if not multi and radius > 3 and self.branch_protected_split[branch_id] > self.branch_depth[branch_id] and (radius < self.network_manager.get_mean_radius(branch_id).get_average()*0.65 
                               or radius/self.network_manager.get_mean_radius(branch_id).get_last() < 0.75):
-                print("Splitted "+str(branch_id)+" because protected until "+str(self.branch_protected_split[branch_id]))
-                print("Found target is "+str(foundTarget)+" radius is "+str(radius))
+                self.observer.emit("split_attempt",branch_id=branch_id,depth=self.branch_depth[branch_id],radius=radius,target=foundTarget,protected_until=self.branch_protected_split[branch_id])
+                if self.profiler is not None:
+                    split_start, split_depth = time.perf_counter(), self.branch_depth[branch_id]
                 # We suspect a splitted vessel
                 last_radius = self.network_manager.get_mean_radius(branch_id).get_last()
                 # We try to fit an rectangle to get the split orientation
@@ -119,47 +224,110 @@ class NetworkEngine:
                 
                 #Not a split, branch just disappear
                 if(exclusion_radius < 1):
-                    self.branch_depth[branch_id] = 0
-                    print(str(branch_id)+"stop because exclusion contours was "+str(contours))
-                    if self.network_manager.branch_length[branch_id] < 20:
-                        self.network_manager.remove_branch(branch_id)
+                    self.terminate_branch(branch_id,"no_split")
                 else:
                     self.network_manager.append_to_debug(self.branch_depth[branch_id],contours[0])
                     #Creating a new branch with a new target
                     target_2_branch_id = self.get_new_branch(branch_id)
-                    print("Create branch id :"+str(target_2_branch_id))
+                    self.observer.emit("branch_created",branch_id=target_2_branch_id,parent_branch_id=branch_id,depth=self.branch_depth[branch_id],reason="split")
                     self.network_manager.set_branch_target(target_2_branch_id,pixel_2)
                     self.network_manager.get_mean_radius(target_2_branch_id).add_number(exclusion_radius)
                     #Exploring 20 frames of new branch with a success callback for parent branch
-                    self.stack.append([target_2_branch_id,20,exclusion_zone,partial(self.success_split, branch_id, pixel_1,self.branch_depth[branch_id]-20,exclusion_radius)])
+                    self.stack.append([target_2_branch_id,20,exclusion_zone,(branch_id,pixel_1,self.branch_depth[branch_id]-20,exclusion_radius)])
+                    if self.profiler is not None:
+                        self.profiler.record("push",self.current_depth,target_2_branch_id,calls=0,pushes=1)
                     #In case branch failed we set up parent branch to continue, these data will be rollback if child branch succeed
                     self.network_manager.append_to_network(self.branch_depth[branch_id],branch_id,tube_contour,predicted)
                     self.branch_depth[branch_id]-=1
                     self.network_manager.set_branch_target(branch_id,center)
+                if self.profiler is not None:
+                    self.profiler.record("split",split_depth,branch_id,time.perf_counter()-split_start)
             
             else:
                 if radius == 0:
-                    self.branch_depth[branch_id] = 0
-                    if self.network_manager.branch_length[branch_id] < 20:
-                        self.network_manager.remove_branch(branch_id)
+                    self.terminate_branch(branch_id,"zero_radius")
                     break
+                if predicted:
+                    self.observer.emit("predicted",branch_id=branch_id,depth=self.branch_depth[branch_id])
                 self.network_manager.append_to_network(self.branch_depth[branch_id],branch_id,tube_contour,predicted)
                 self.branch_depth[branch_id]-=1
                 self.network_manager.set_branch_target(branch_id,center)
                 self.network_manager.get_nested_intensity(branch_id).add_number(self.image[self.branch_depth[branch_id],self.network_manager.get_branch_target(branch_id)[1],self.network_manager.get_branch_target(branch_id)[0]])
                 self.network_manager.get_mean_radius(branch_id).add_number(radius)
+                if self.skip_step > 1 and not multi and excluded is None:
+                    self.skip_ahead(branch_id,tube_contour,center,radius)
         if multi and i == iteration-1:
-            onsuccess()
+            self.success_split(*onsuccess)
         return None
     
+    # Coarse to fine step of a branch just explored at full resolution (contour, center and radius of its last area)
+    # If the branch is stable (radius close to the previous one and far from a constriction, no intensity drop, center moving by less
+    # than radius/2 over skip_step slices),
+    # the slice skip_step slices below is explored from the linear prediction of the center. A probe of the same radius and position
+    # is kept and the slices in between get the nearest of both contours moved and scaled to the interpolated center and radius.
+    # Otherwise the probe is dropped and the branch is explored slice by slice, where explore tests splits, for skip_step slices
+    def skip_ahead(self,branch_id,contour,center,radius):
+        depth = self.branch_depth[branch_id]
+        step = self.skip_step
+        probe_depth = depth+1-step
+        if probe_depth <= self.stop_depth or self.branch_monitored_depth[branch_id] < depth or self.skip_wait.get(branch_id,depth) < depth:
+            return
+        mean_radius = self.network_manager.get_mean_radius(branch_id)
+        nested_intensity = self.network_manager.get_nested_intensity(branch_id)
+        # Where explore tests splits, far enough from its constriction test for a probe within skip_tolerance not to hide a split
+        splitting = self.branch_protected_split[branch_id] > probe_depth and radius*(1+self.skip_tolerance) > 3
+        if ((splitting and radius*(1-self.skip_tolerance) < mean_radius.get_average()*0.65)
+            or nested_intensity.get_last() < (1-self.skip_tolerance)*nested_intensity.get_average()):
+            return
+        previous = self.network_manager.get_area(depth+2,branch_id)
+        if previous is None:
+            return
+        previous_center,previous_radius = cv2.minEnclosingCircle(previous.contour)
+        if abs(radius-previous_radius) > self.skip_tolerance*radius:
+            return
+        velocity = np.subtract(center,previous_center)
+        if np.hypot(*velocity)*step > radius/2:
+            return
+        predicted_center = np.add(center,velocity*step)
+        target = (int(predicted_center[0]),int(predicted_center[1]))
+        if not (0 <= target[0] < self.image.shape[2] and 0 <= target[1] < self.image.shape[1]):
+            return
+        foundTarget = self.region_search(branch_id,probe_depth,self.image[probe_depth,:,:],target,mean_radius.get_average(),nested_intensity.get_average()*self.alpha)
+        probe_contour,predicted = self.region_growing(branch_id,probe_depth,self.image[probe_depth,:,:],foundTarget,nested_intensity,mean_radius.get_average(),self.beta)
+        if len(probe_contour) > 0 and not predicted:
+            probe_center,probe_radius = cv2.minEnclosingCircle(probe_contour)
+        if (len(probe_contour) == 0 or predicted or probe_radius == 0 or abs(probe_radius-radius) > self.skip_tolerance*radius
+            or np.hypot(*np.subtract(probe_center,predicted_center)) > radius/2):
+            self.skip_wait[branch_id] = probe_depth
+            return
+        self.observer.emit("slices_skipped",branch_id=branch_id,depth=depth,count=step-1)
+        if self.profiler is not None:
+            self.profiler.record("skip",depth,branch_id,calls=step-1)
+        bound = np.array([self.image.shape[2]-1,self.image.shape[1]-1])
+        for k in range(1,step+1):
+            t = k/step
+            if k < step:
+                shape,shape_center,shape_radius = (contour,center,radius) if t < 0.5 else (probe_contour,probe_center,probe_radius)
+                area_center = np.add(np.multiply(center,1-t),np.multiply(probe_center,t))
+                area_radius = radius*(1-t)+probe_radius*t
+                area_contour = np.clip(np.round((shape-shape_center)*(area_radius/shape_radius)+area_center),0,bound).astype(np.int32)
+            else:
+                area_contour,area_center,area_radius = probe_contour,probe_center,probe_radius
+            self.network_manager.append_to_network(self.branch_depth[branch_id],branch_id,area_contour,False)
+            self.branch_depth[branch_id]-=1
+            self.network_manager.set_branch_target(branch_id,area_center)
+            self.network_manager.get_nested_intensity(branch_id).add_number(self.image[self.branch_depth[branch_id],self.network_manager.get_branch_target(branch_id)[1],self.network_manager.get_branch_target(branch_id)[0]])
+            self.network_manager.get_mean_radius(branch_id).add_number(area_radius)
+
     def explore_reverse(self,initial_point,initial_depth):
         branch_id = self.get_new_branch(-1,True)
+        self.observer.emit("branch_created",branch_id=branch_id,parent_branch_id=None,depth=initial_depth,reason="reverse")
         self.network_manager.set_branch_target(branch_id,initial_point)
         self.network_manager.get_mean_radius(branch_id).add_number(10)
         self.network_manager.get_nested_intensity(branch_id).add_number(self.image[initial_depth,initial_point[1],initial_point[0]])
         for depth in range(initial_depth,self.max_depth):
-            foundTarget = regionSearch(self.image[depth,:,:],self.network_manager.get_branch_target(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.network_manager.get_nested_intensity(branch_id).get_average()*self.alpha)
-            tube_contour,predicted = regionGrowing(self.image[depth,:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta)
+            foundTarget = self.region_search(branch_id,depth,self.image[depth,:,:],self.network_manager.get_branch_target(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.network_manager.get_nested_intensity(branch_id).get_average()*self.alpha)
+            tube_contour,predicted = self.region_growing(branch_id,depth,self.image[depth,:,:],foundTarget,self.network_manager.get_nested_intensity(branch_id),self.network_manager.get_mean_radius(branch_id).get_average(),self.beta)
             if len(tube_contour) == 0:
                 if self.network_manager.branch_length[branch_id] < 20:
                     self.network_manager.remove_branch(branch_id)
@@ -183,119 +351,171 @@ class NetworkEngine:
         self.network_manager.get_nested_intensity(branch_id).add_number(self.image[initial_depth,initial_point[1],initial_point[0]])
         self.network_manager.get_mean_radius(branch_id).add_number(initial_radius)
         self.current_depth = initial_depth
-        print("Force create branch "+str(branch_id)+" at depth "+str(initial_depth))
+        self.observer.emit("branch_created",branch_id=branch_id,parent_branch_id=None,depth=initial_depth,reason="force")
 
     def explore_all(self):
         for i in range(len(self.branch_depth)):  
             if self.branch_depth[i] >= self.current_depth:
                 for j in range(self.branch_depth[i] - self.current_depth + 1):
                     self.stack.extend([[i]])
+                if self.profiler is not None:
+                    self.profiler.record("push",self.current_depth,i,calls=0,pushes=self.branch_depth[i]-self.current_depth+1)
 
     def run(self):
-        self.explore_all()
-        while self.current_depth > self.stop_depth:
-            while len(self.stack) > 0:
-                exploring_parameters = self.stack.pop()
-                self.explore(*exploring_parameters)
-            self.current_depth -= 1
-            self.pbar.update(1)
-            self.pbar.set_description("Searching region %s" % str(self.branch_depth))
+        if self.workers > 1:
+            self.scheduler = NetworkScheduler(self,self.workers,self.speculation_depth)
+        run_start = time.perf_counter()
+        self.observer.emit("run_start",depth=self.current_depth,stop_depth=self.stop_depth)
+        depth_count = 0
+        try:
             self.explore_all()
+            while self.current_depth > self.stop_depth:
+                depth_start = time.perf_counter()
+                stack_size = len(self.stack)
+                if self.scheduler is not None:
+                    self.scheduler.dispatch()
+                while len(self.stack) > 0:
+                    exploring_parameters = self.stack.pop()
+                    if self.profiler is None:
+                        self.explore(*exploring_parameters)
+                    else:
+                        explore_start = time.perf_counter()
+                        self.explore(*exploring_parameters)
+                        self.profiler.record("explore",self.current_depth,exploring_parameters[0],time.perf_counter()-explore_start)
+                self.observer.emit("depth_done",depth=self.current_depth,seconds=time.perf_counter()-depth_start,stack_size=stack_size)
+                self.current_depth -= 1
+                depth_count += 1
+                # The stack is empty between two depths, explore_all fills it again when the run is resumed
+                if self.checkpoint_path is not None and depth_count % self.checkpoint_interval == 0:
+                    self.checkpoint(self.checkpoint_path)
+                self.explore_all()
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.close()
+                self.scheduler = None
+            self.observer.emit("run_end",depth=self.current_depth,seconds=time.perf_counter()-run_start)
         return
     
     # Used to merge branch that are similar and/or intesecting in order to remove redundancy
-    # This function can be widely optimised. For now it could me useful to run in twice to get a better result
+    # Merging passes are repeated until nothing is merged, so one call gives the final result
     def merge_network(self,network_to_merge,DEBUG=False):
+        # Intersection tests of areas that are not modified by a pass are reused by the next one
+        intersections = dict()
+        result_network_manager,merged_count = self.merge_network_pass(network_to_merge,intersections,DEBUG)
+        while merged_count > 0:
+            result_network_manager,merged_count = self.merge_network_pass(result_network_manager,intersections,DEBUG)
+        return result_network_manager
+
+    # One merging pass. A branch is merged into an intersecting branch with a higher offset (lowest id if equal) and stays merged
+    # at the next depths while this branch is there. Merged branches are tracked with a disjoint set of branch ids
+    def merge_network_pass(self,network_to_merge,intersections,DEBUG=False):
         net = network_to_merge.network
         offset_list = list()
         for i in range(len(network_to_merge.branch_length)):
             _,offset = network_to_merge.get_branch(i)
             offset_list.append(offset)
+        def outranks(branch_a,branch_b):
+            return offset_list[branch_a] > offset_list[branch_b] or (offset_list[branch_a] == offset_list[branch_b] and branch_a < branch_b)
 
-        merged_branch_list = list()
-        merged_to_branch_list = list()
+        merged = DisjointSet()
+        merged_count = 0
         result_network_manager = NetworkManager(len(self.image),network_to_merge.branch_list,network_to_merge.last_branch_id)
+        result_network_manager.observer = self.observer
 
         for depth in range(len(net)):
             nodes = net[depth]
-            to_merge = dict()
+            if len(nodes) == 0:
+                continue
+            if self.profiler is not None:
+                depth_start = time.perf_counter()
+            branch_ids = [node.branch_id for node in nodes]
+            contours = [node.contour for node in nodes]
+            # First node of each branch at this depth
+            local = dict()
+            for idx in reversed(range(len(nodes))):
+                local[branch_ids[idx]] = idx
+
+            # Pairs that can't intersect are rejected on bounding boxes (contour_intersect first checks if the query first point converted to uint8 is inside the reference)
+            points = [np.asarray(contour).reshape(-1,2) for contour in contours]
+            low = np.array([p.min(axis=0) if len(p) > 0 else (np.iinfo(np.int32).max,)*2 for p in points])
+            high = np.array([p.max(axis=0) if len(p) > 0 else (np.iinfo(np.int32).min,)*2 for p in points])
+            first = np.array([p[0] if len(p) > 0 else (-1,-1) for p in points]).astype(np.uint8)
+            candidates = (np.all((low[:,np.newaxis] <= high[np.newaxis]+1) & (low[np.newaxis] <= high[:,np.newaxis]+1),axis=2)
+                          | np.all((low[:,np.newaxis] <= first[np.newaxis]) & (first[np.newaxis] <= high[:,np.newaxis]),axis=2))
+            # Intersections are kept between passes only if branch ids identify areas at this depth
+            unique = len(local) == len(nodes)
+            depth_intersections = intersections.setdefault(depth,dict()) if unique else dict()
+            def intersect(ida,idb):
+                if not candidates[ida,idb]:
+                    return False
+                key = (branch_ids[ida],branch_ids[idb]) if unique else (ida,idb)
+                if key not in depth_intersections:
+                    if self.profiler is None:
+                        depth_intersections[key] = contour_intersect(contours[ida],contours[idb],DEBUG)
+                    else:
+                        intersect_start = time.perf_counter()
+                        depth_intersections[key] = contour_intersect(contours[ida],contours[idb],DEBUG)
+                        self.profiler.record("contour_intersect",depth,-1,time.perf_counter()-intersect_start)
+                return depth_intersections[key]
 
+            to_merge = dict()
             for ida in range(len(nodes)):
                 to_merge[ida] = set()
             last_merged = True
             while last_merged:
                 last_merged = False
                 for ida in range(len(nodes)):
-                    contour = list()
-                    if nodes[ida].branch_id in merged_branch_list:
-                        merged_to_id = merged_to_branch_list[merged_branch_list.index(nodes[ida].branch_id)]
-                        merge_to_local_idxx = next((i for i, item in enumerate(nodes) if item.branch_id == merged_to_id), None)
-                        if merge_to_local_idxx is not None:
-                            if ida not in to_merge[merge_to_local_idxx]:
+                    if merged.is_merged(branch_ids[ida]):
+                        merge_to_local_idx = local.get(merged.find(branch_ids[ida]))
+                        if merge_to_local_idx is not None:
+                            if ida not in to_merge[merge_to_local_idx]:
                                 last_merged = True
-                                to_merge[merge_to_local_idxx].add(ida)
+                                to_merge[merge_to_local_idx].add(ida)
                         else:
                             # Branch has been merge to a branch that is not there anymore
-                            # Then we cancel the merge from this depth to the top 
-                            merged_branch_list_idx = merged_branch_list.index(nodes[ida].branch_id)
-                            merged_to_branch_list.pop(merged_branch_list_idx)
-                            merged_branch_list.pop(merged_branch_list_idx)
+                            # Then we cancel the merge from this depth to the top
+                            merged.remove(branch_ids[ida])
                     else:
                         for idb in range(len(nodes)):
-                            already_merged_to_idx = next((i for i, item in enumerate(merged_branch_list) if item == nodes[idb].branch_id), None)
-                            if (ida != idb 
-                            and (already_merged_to_idx == None or 
-                                 (offset_list[merged_to_branch_list[already_merged_to_idx]] < offset_list[nodes[ida].branch_id] 
-                                  or (
-                                      offset_list[merged_to_branch_list[already_merged_to_idx]] == offset_list[nodes[ida].branch_id]  
-                                      and
-                                      nodes[ida].branch_id < merged_to_branch_list[already_merged_to_idx]
-                                  ))
-                                 )
-                            and contour_intersect(nodes[ida].contour,nodes[idb].contour,DEBUG) 
-                            and (offset_list[nodes[ida].branch_id] > offset_list[nodes[idb].branch_id] or 
-                            (nodes[ida].branch_id < nodes[idb].branch_id and offset_list[nodes[ida].branch_id] == offset_list[nodes[idb].branch_id]))):
+                            if (ida != idb
+                                and (not merged.is_merged(branch_ids[idb]) or outranks(branch_ids[ida],merged.find(branch_ids[idb])))
+                                and outranks(branch_ids[ida],branch_ids[idb])
+                                and intersect(ida,idb)):
                                 last_merged = True
-                                if already_merged_to_idx != None:
-                                    merged_branch_list_idx = merged_branch_list.index(nodes[idb].branch_id)
-                                    merged_to_branch_list.pop(merged_branch_list_idx)
-                                    merged_branch_list.pop(merged_branch_list_idx)
-                                merged_branch_list.append(nodes[idb].branch_id)
-                                merged_to_branch_list.append(nodes[ida].branch_id)
                                 to_merge[ida].add(idb)
                                 if len(to_merge[idb]) > 0:
                                     to_merge[ida].update(to_merge[idb])
                                     to_merge[idb].clear()
-                                branch_to_force_merge = list()
-                                for i in range(len(merged_to_branch_list)):
-                                    if(nodes[idb].branch_id == merged_to_branch_list[i]):
-                                        merged_to_branch_list[i] = nodes[ida].branch_id
-                                        branch_to_force_merge.append(merged_branch_list[i])
-                                
-                                for branch in branch_to_force_merge:
-                                    local_branch_idb = next((i for i, item in enumerate(nodes) if item.branch_id == branch), None)
+                                # Branches merged to idb are now merged to ida
+                                for branch in merged.union(branch_ids[ida],branch_ids[idb]):
+                                    local_branch_idb = local.get(branch)
                                     if local_branch_idb is not None:
                                         to_merge[ida].add(local_branch_idb)
                                 if DEBUG:
-                                    print(str(nodes[idb].branch_id)+" merged to "+str(nodes[ida].branch_id))
+                                    print(str(branch_ids[idb])+" merged to "+str(branch_ids[ida]))
 
             for key, value in to_merge.items():
                 if len(value) == 0:
-                    if nodes[key].branch_id not in merged_branch_list:
+                    if not merged.is_merged(branch_ids[key]):
                         if DEBUG:
-                            print("add "+str(nodes[key].branch_id)+" to final network")
-                        result_network_manager.append_to_network(depth,nodes[key].branch_id,nodes[key].contour,nodes[key].predicted)
+                            print("add "+str(branch_ids[key])+" to final network")
+                        result_network_manager.append_to_network(depth,branch_ids[key],contours[key],nodes[key].predicted)
                 else:
-                    contours_to_merge = [node.contour for index,node in enumerate(nodes) if index in value]
-                    contours_to_merge.append(nodes[key].contour)
-                    debug_id = [node.branch_id for index,node in enumerate(nodes) if index in value]
+                    merged_count += 1
+                    contours_to_merge = [contours[index] for index in sorted(value)]
+                    contours_to_merge.append(contours[key])
+                    debug_id = [branch_ids[index] for index in sorted(value)]
                     contour = merge_contours(self.image[0],contours_to_merge)
                     if DEBUG:
-                        print("at depth"+str(depth)+" merge "+str(nodes[key].branch_id)+" with"+str(debug_id)+" contour size "+str(cv2.contourArea(contour)))
-                    
-                    result_network_manager.append_to_network(depth,nodes[key].branch_id,contour)
+                        print("at depth"+str(depth)+" merge "+str(branch_ids[key])+" with"+str(debug_id)+" contour size "+str(cv2.contourArea(contour)))
+                    result_network_manager.append_to_network(depth,branch_ids[key],contour)
+                    # The area has changed, its intersections have to be computed again by the next pass
+                    for intersection_key in [intersection_key for intersection_key in depth_intersections if branch_ids[key] in intersection_key]:
+                        del depth_intersections[intersection_key]
+            if self.profiler is not None:
+                self.profiler.record("merge_network",depth,-1,time.perf_counter()-depth_start)
 
-        return result_network_manager
+        return result_network_manager,merged_count
     
 
     def find_parent_branch(self,contour,areas):
@@ -309,6 +529,7 @@ class NetworkEngine:
         registered_branch = dict()
         base_network = network_manager.network
         result_network_manager = NetworkManager(len(base_network))
+        result_network_manager.observer = self.observer
         #We register the first branch
         _,depth = network_manager.get_branch(0)
         registered_branch[base_network[depth][0].branch_id] = 0
@@ -320,30 +541,28 @@ class NetworkEngine:
                 if base_network[depth][area_idx].branch_id not in registered_branch.keys():
                     #Find where does this branch come
                     parent_branch_id = self.find_parent_branch(base_network[depth][area_idx].contour,base_network[depth+1])
-                    print(parent_branch_id)
                     if parent_branch_id == False:
                         #Case branch has been explored from bottom
-                        print("Can't find parent for "+str(base_network[depth][area_idx].branch_id)+" at depth "+str(depth))
+                        self.observer.emit("segment_parent",branch_id=base_network[depth][area_idx].branch_id,parent_branch_id=None,depth=depth,outcome="not_found")
                         new_branch_id = result_network_manager.get_new_branch()
                         registered_branch[base_network[depth][area_idx].branch_id] = new_branch_id
                         result_network_manager.append_to_network(depth,registered_branch[base_network[depth][area_idx].branch_id],base_network[depth][area_idx].contour)
                         excluded.append(base_network[depth][area_idx].branch_id)
                     elif parent_branch_id not in [area.branch_id for area in base_network[depth]]:
-                        print("Parent not present at current depth for "+str(base_network[depth][area_idx].branch_id)+" at depth "+str(depth))
+                        self.observer.emit("segment_parent",branch_id=base_network[depth][area_idx].branch_id,parent_branch_id=parent_branch_id,depth=depth,outcome="parent_absent")
                         registered_branch[base_network[depth][area_idx].branch_id] = registered_branch[parent_branch_id]
                         excluded.append(base_network[depth][area_idx].branch_id)
                         registered_branch[base_network[depth][area_idx].branch_id]
                         result_network_manager.append_to_network(depth,registered_branch[base_network[depth][area_idx].branch_id],base_network[depth][area_idx].contour)
                     else:
-                        print("at depth "+str(depth)+" create 2 new branch for parent & child")
                         new_branch_id = result_network_manager.get_new_branch()
                         registered_branch[base_network[depth][area_idx].branch_id] = new_branch_id
                         result_network_manager.append_to_network(depth,registered_branch[base_network[depth][area_idx].branch_id],base_network[depth][area_idx].contour)
                         new_branch_id = result_network_manager.get_new_branch()
                         registered_branch[parent_branch_id] = new_branch_id
                         excluded.append(base_network[depth][area_idx].branch_id)
-                        print(str(base_network[depth][area_idx].branch_id)+" is now "+str(registered_branch[base_network[depth][area_idx].branch_id]))
-                        print(str(parent_branch_id)+" is now "+str(registered_branch[parent_branch_id]))
+                        self.observer.emit("segment_parent",branch_id=base_network[depth][area_idx].branch_id,parent_branch_id=parent_branch_id,depth=depth,outcome="bifurcation",
+                                           segment_id=registered_branch[base_network[depth][area_idx].branch_id],parent_segment_id=registered_branch[parent_branch_id])
             for area_idx in range(len(base_network[depth])):
                 if base_network[depth][area_idx].branch_id not in excluded:
                     result_network_manager.append_to_network(depth,registered_branch[base_network[depth][area_idx].branch_id],base_network[depth][area_idx].contour)
@@ -1,6 +1,7 @@
 import copy
 import numpy as np
-from . import RunningAverage,NestedAverage,NetworkManagerArea
+from functions.mask_utils import save_sparse_masks, rasterize
+from . import RunningAverage,NestedAverage,NetworkAreaStore,NetworkObserver
 
 class NetworkManager:
     def __init__(self,depth,branch_list=None,max_branch_id=None):
@@ -9,6 +10,11 @@ class NetworkManager:
         self.debug = list()
         self.label = list()
         self.label_coord = list()
+        # Areas are stored in a columnar store, network and debug hold views on it
+        self.store = NetworkAreaStore()
+        self.debug_store = NetworkAreaStore(16,1024)
+        # For each branch, area of the branch indexed by depth, a list is used if a branch has more than one area at a depth (same order as in network)
+        self.branch_index = dict()
         for i in range(depth):
             self.network.append(list())
             self.debug.append(list())
@@ -22,7 +28,15 @@ class NetworkManager:
             self.branch_length = [0]
         self.branch_mean_radius = [RunningAverage()]
         self.branch_nested_intensity = [NestedAverage()]
+        # Receives sanitize and generate3DImages events, NetworkEngine.set_observer sets it
+        self.observer = NetworkObserver()
         
+    # The observer is a runtime sink (file, progress bar), it is not pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["observer"] = NetworkObserver()
+        return state
+
     def get_new_branch(self,parent_branch_id=0,reverse=False):
         self.last_branch_id = self.last_branch_id+1
         self.branch_length.append(0)
@@ -48,11 +62,37 @@ class NetworkManager:
         self.branch_target[branch_id] = (int(target[0]),int(target[1]))
 
     def append_to_network(self,depth,branch_id,contour,predicted=False):
-        self.network[depth].append(NetworkManagerArea(branch_id,contour,predicted))
+        area = self.store.append(depth,branch_id,contour,predicted)
+        self.network[depth].append(area)
+        depths = self.branch_index.setdefault(branch_id,dict())
+        slot = depths.get(depth)
+        if slot is None:
+            depths[depth] = area
+        elif isinstance(slot,list):
+            slot.append(area)
+        else:
+            depths[depth] = [slot,area]
         self.branch_length[branch_id]+=1
+
+    # Remove the area of a branch at a given depth, branch length is not modified
+    # Raises ValueError if the branch has no area at this depth, as list.remove did before the branch index
+    def remove_from_network(self,depth,branch_id):
+        depths = self.branch_index.get(branch_id)
+        if depths is None or depth not in depths:
+            raise ValueError("branch "+str(branch_id)+" has no area at depth "+str(depth))
+        slot = depths[depth]
+        if isinstance(slot,list):
+            area = slot.pop(0)
+            if len(slot) == 1:
+                depths[depth] = slot[0]
+        else:
+            area = slot
+            del depths[depth]
+        self.network[depth].remove(area)
+        return area
     
     def append_to_debug(self,depth,contour):
-        self.debug[depth].append(NetworkManagerArea(-1,contour,False))
+        self.debug[depth].append(self.debug_store.append(depth,-1,contour,False))
 
     def add_label(self,coord,text):
         text_dict = {
@@ -67,64 +107,78 @@ class NetworkManager:
     def get_branchs(self):
         return self.branch_list
 
+    # Depths of the first continuous part of a branch, starting from the top of the network
+    def get_branch_depths(self,branch_id):
+        depths = self.branch_index.get(branch_id)
+        if not depths:
+            return range(0)
+        start = max(depths)
+        end = start
+        while end-1 in depths:
+            end -= 1
+        return range(start,end-1,-1)
+
     def get_branch(self,branch_id):
-        branch = list()
-        offset = 0
-        for i in reversed(range(len(self.network))):
-            area = next((area for area in self.network[i] if area.branch_id == branch_id),None)
-            if len(branch) == 0:
-                offset = i
-            if area != None:
-                branch.append(area)
-            else:
-                if len(branch)>0:
-                    break
+        depths = self.get_branch_depths(branch_id)
+        branch = [self.get_area(depth,branch_id) for depth in depths]
+        offset = depths[0] if len(depths) > 0 else 0
         return branch,offset
     
     def get_predicted_percentage(self,branch_id):
         predicted_counter = 0
-        found = False
-        for i in reversed(range(len(self.network))):
-            area = next((area for area in self.network[i] if area.branch_id == branch_id),None)
-            if area != None:
-                found = True
-                if area.predicted:
-                    predicted_counter+=1
-            else:
-                if found:
-                    break
+        for depth in self.get_branch_depths(branch_id):
+            if self.get_area(depth,branch_id).predicted:
+                predicted_counter+=1
         return predicted_counter/self.branch_length[branch_id]
 
     def get_last_from_branch(self,branch_id):
-        for i in range(len(self.network)):
-            area = next((area for area in self.network[i] if area.branch_id == branch_id),None)
-            if area != None:
-                return area
+        depths = self.branch_index.get(branch_id)
+        if depths:
+            return self.get_area(min(depths),branch_id)
+
+    # First area of a branch at a given depth
+    def get_area(self,depth,branch_id):
+        slot = self.branch_index.get(branch_id,dict()).get(depth)
+        if isinstance(slot,list):
+            return slot[0]
+        return slot
 
     def get_branch_length(self,branch_id):
         return self.branch_length[branch_id]
 
     def remove_branch(self,branch_id):
-        found = False
-        for i in reversed(range(len(self.network))):
-            area = next((area for area in self.network[i] if area.branch_id == branch_id),None)
-            if area != None:
-                found = True
-                self.network[i].remove(area)
-            else:
-                #La branche a été trouvée et on est arrivée au bout de sa supression
-                if found:
-                    break
+        for depth in self.get_branch_depths(branch_id):
+            self.remove_from_network(depth,branch_id)
         self.branch_length[branch_id] = 0
         self.branch_list.remove(branch_id)
     
     #Each subnetwork is a different image
-    def generate3DImages(self,shape):
+    # Contour points of a branch are written at once, with filled the lumen of each area is drawn (debug image stays as contours)
+    def generate3DImages(self,shape,filled=False):
         generated_images = []
         for branch_id in self.branch_list:
             image = np.zeros(shape,dtype=np.uint8)
             branch,offset = self.get_branch(branch_id)
-            print("branch "+str(branch_id)+" start "+str(offset)+" length "+str(len(branch)))
+            self.observer.emit("branch_generated",branch_id=branch_id,start=offset,length=len(branch))
+            offsets,points = self.store.gather([area.index for area in branch])
+            rasterize(image,np.arange(offset,offset-len(branch),-1),offsets,points,filled=filled)
+            generated_images.append(image)
+        #Display debug
+        image = np.zeros(shape,dtype=np.uint8)
+        areas = [area for i in reversed(range(len(self.debug))) for area in self.debug[i]]
+        offsets,points = self.debug_store.gather([area.index for area in areas])
+        rasterize(image,[area.depth for area in areas],offsets,points)
+        generated_images.append(image)
+        return generated_images
+
+    # Point by point implementation of generate3DImages, kept as reference
+    def generate3DImagesReference(self,shape,DEBUG=False):
+        generated_images = []
+        for branch_id in self.branch_list:
+            image = np.zeros(shape,dtype=np.uint8)
+            branch,offset = self.get_branch(branch_id)
+            if DEBUG:
+                print("branch "+str(branch_id)+" start "+str(offset)+" length "+str(len(branch)))
             for area in branch:
                 for point in area.contour:
                     image[offset][point[0][1]][point[0][0]] = 255
@@ -139,13 +193,33 @@ class NetworkManager:
         generated_images.append(image)
         return generated_images
     
+    # Sparse version of generate3DImages : contour points of each branch are written in a compressed npz file
+    # Use functions.mask_utils.SparseMasks to read a branch or densify it
+    def export_sparse(self,path,shape,include_debug=True):
+        branches = dict()
+        for branch_id in self.branch_list:
+            branch,offset = self.get_branch(branch_id)
+            offsets,points = self.store.gather([area.index for area in branch])
+            branches[branch_id] = (np.arange(offset,offset-len(branch),-1),offsets,points)
+        debug = None
+        if include_debug:
+            areas = [area for i in reversed(range(len(self.debug))) for area in self.debug[i]]
+            offsets,points = self.debug_store.gather([area.index for area in areas])
+            debug = ([area.depth for area in areas],offsets,points)
+        save_sparse_masks(path,shape,branches,debug)
+
     # Remove branch that seems inconsistent for a vascular network (length < 20) or that looks like artefact (branch is > 40% predicted)
     def sanitize(self):
         branch_list = copy.deepcopy(self.branch_list)
         for branch_id in branch_list:
             if self.branch_length[branch_id] < 20:
                 self.remove_branch(branch_id)
-                print("Sanitize : remove "+str(branch_id)+" (too short)")
+                self.observer.emit("branch_removed",branch_id=branch_id,reason="too_short")
             elif self.get_predicted_percentage(branch_id) > 0.4:
                 self.remove_branch(branch_id)
-                print("Sanitize : remove "+str(branch_id)+" (predicted)")
+                self.observer.emit("branch_removed",branch_id=branch_id,reason="predicted")
+        self.compact()
+
+    # Drop the points and rows of removed areas from the store, areas of the network keep their views
+    def compact(self):
+        self.store.compact([area for areas in self.network for area in areas])
@@ -1,10 +1,31 @@
 
 # Represent a area detected in one slice. This class is used by the NetworkManager
+# An area is a view on a row of a NetworkAreaStore
 class NetworkManagerArea:
-    def __init__(self,branch_id,contour,predicted):
-        self.branch_id = branch_id
-        self.contour = contour
-        self.predicted = predicted
+    __slots__ = ("store","index")
+
+    def __init__(self,store,index):
+        self.store = store
+        self.index = index
+
+    @property
+    def branch_id(self):
+        return int(self.store.branch_ids[self.index])
+
+    @property
+    def contour(self):
+        return self.store.get_contour(self.index)
+
+    @property
+    def predicted(self):
+        return bool(self.store.predicted[self.index])
+
+    @property
+    def depth(self):
+        return int(self.store.depths[self.index])
+
+    def __reduce__(self):
+        return (NetworkManagerArea,(self.store,self.index))
 
     def __str__(self) -> str:
-        return "(branch_id : "+str(self.branch_id)+", contour : "+str(self.contour)+", predicted : "+str(self.predicted)+")"
\ No newline at end of file
+        return "(branch_id : "+str(self.branch_id)+", contour : "+str(self.contour)+", predicted : "+str(self.predicted)+")"
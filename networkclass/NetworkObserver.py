@@ -0,0 +1,17 @@
+# Events of NetworkEngine and NetworkManager are sent to an observer, this one drops them (default, no cost)
+# Events are a name and keyword fields :
+#   run_start (depth, stop_depth), depth_done (depth, seconds, stack_size), run_end (depth, seconds)
+#   split_attempt (branch_id, depth, radius, target), split_success (branch_id, child_depth)
+#   branch_created (branch_id, parent_branch_id, depth, reason), branch_terminated (branch_id, depth, reason, length, removed)
+#   predicted (branch_id, depth), segment_parent (branch_id, parent_branch_id, depth, outcome),
+#   branch_removed (branch_id, reason), branch_generated (branch_id, start, length)
+# Sinks (logging, JSON lines, progress bar, counters) are in functions.observer_utils
+class NetworkObserver:
+    # False when events are dropped, callers can skip building costly fields
+    enabled = False
+
+    def emit(self,event,**fields):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,124 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from functions.exploration_utils import regionSearch, regionGrowing
+from functions.volume_utils import LazyVolume
+
+# Image volume of a worker process, attached once by the pool initializer
+_image = None
+_memory = None
+
+# Describe how workers can access the image: the file of a memory map (no copy), otherwise the image is copied in a shared memory block
+def share_image(image):
+    if isinstance(image,LazyVolume) and isinstance(image.source,np.memmap):
+        image = image.source
+    if isinstance(image,np.memmap) and image.filename is not None and image.flags.c_contiguous:
+        return ("memmap",image.filename,image.dtype.str,image.shape,image.offset),None
+    memory = shared_memory.SharedMemory(create=True,size=max(image.nbytes,1))
+    shared = np.ndarray(image.shape,image.dtype,buffer=memory.buf)
+    # Slice by slice, image can be a LazyVolume
+    for i in range(len(image)):
+        shared[i] = image[i]
+    return ("shared",memory.name,image.dtype.str,image.shape),memory
+
+def attach_image(descriptor):
+    global _image, _memory
+    if descriptor[0] == "memmap":
+        _, filename, dtype, shape, offset = descriptor
+        _image = np.memmap(filename,dtype=np.dtype(dtype),mode="r",shape=shape,offset=offset)
+    else:
+        _, name, dtype, shape = descriptor
+        _memory = shared_memory.SharedMemory(name=name)
+        _image = np.ndarray(shape,np.dtype(dtype),buffer=_memory.buf)
+
+# Explore a branch in a worker from a copy of its state, the same way NetworkEngine.explore does when nothing is excluded
+# Each step is returned with the state it was computed from: (depth,target,mean radius,intensity,alpha,beta)
+# The chain stops at the first step where the engine would stop the branch or try a split
+def explore_chain(depth,target,nested_intensity,mean_radius,protected_split,alpha,beta,length):
+    steps = list()
+    for _ in range(length):
+        key = (depth,target,mean_radius.get_average(),nested_intensity.get_average(),alpha,beta)
+        foundTarget = regionSearch(_image[depth,:,:],target,mean_radius.get_average(),nested_intensity.get_average()*alpha)
+        tube_contour,predicted = regionGrowing(_image[depth,:,:],foundTarget,nested_intensity,mean_radius.get_average(),beta)
+        steps.append((key,foundTarget,tube_contour,predicted))
+        if len(tube_contour) == 0:
+            break
+        center, radius = cv2.minEnclosingCircle(tube_contour)
+        if radius == 0 or (radius > 3 and protected_split > depth and (radius < mean_radius.get_average()*0.65
+                              or radius/mean_radius.get_last() < 0.75)):
+            break
+        depth -= 1
+        target = (int(center[0]),int(center[1]))
+        nested_intensity.add_number(_image[depth,target[1],target[0]])
+        mean_radius.add_number(radius)
+    return steps
+
+# Explore branches ahead of NetworkEngine.run on a process pool
+# Worker results are only used when the engine reaches the exact state they were computed from,
+# otherwise the engine explores the step itself, so the network is the same as with a serial run
+class NetworkScheduler:
+    def __init__(self,engine,workers,speculation_depth=32):
+        self.engine = engine
+        self.speculation_depth = speculation_depth
+        descriptor,self.memory = share_image(engine.image)
+        self.executor = ProcessPoolExecutor(max_workers=workers,initializer=attach_image,initargs=(descriptor,))
+        self.pending = dict()
+        self.steps = dict()
+
+    def get_key(self,branch_id):
+        engine = self.engine
+        manager = engine.network_manager
+        return (engine.branch_depth[branch_id],manager.get_branch_target(branch_id),manager.get_mean_radius(branch_id).get_average(),
+                manager.get_nested_intensity(branch_id).get_average(),engine.alpha,engine.beta)
+
+    # Submit a chain for every branch waiting in the engine stack that has nothing speculated yet
+    # Branches monitored against the network or exploring a split are left to the engine
+    def dispatch(self):
+        engine = self.engine
+        for exploring_parameters in reversed(engine.stack):
+            branch_id = exploring_parameters[0]
+            if len(exploring_parameters) > 1 or branch_id in self.pending or self.steps.get(branch_id):
+                continue
+            depth = engine.branch_depth[branch_id]
+            if engine.branch_monitored_depth[branch_id] < depth:
+                continue
+            length = min(self.speculation_depth,depth-engine.stop_depth)
+            if length <= 0 or engine.network_manager.get_mean_radius(branch_id).get_last() is None:
+                continue
+            key = self.get_key(branch_id)
+            manager = engine.network_manager
+            self.pending[branch_id] = self.executor.submit(explore_chain,depth,key[1],manager.get_nested_intensity(branch_id),
+                                                           manager.get_mean_radius(branch_id),engine.branch_protected_split[branch_id],
+                                                           engine.alpha,engine.beta,length)
+
+    # Return (foundTarget,tube_contour,predicted) for the current state of a branch, None if it has not been speculated
+    def get_step(self,branch_id):
+        future = self.pending.pop(branch_id,None)
+        if future is not None:
+            self.steps[branch_id] = collections.deque(future.result())
+        steps = self.steps.get(branch_id)
+        if steps:
+            if steps[0][0] == self.get_key(branch_id):
+                return steps.popleft()[1:]
+            # The engine has taken another path (split, rollback, ...), the chain is dropped
+            del self.steps[branch_id]
+        return None
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.pending.clear()
+        self.steps.clear()
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
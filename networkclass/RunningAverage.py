@@ -1,7 +1,7 @@
-import copy
-
 # This class is used to perform a fast average on a growing-only list
 class RunningAverage:
+    __slots__ = ("sum","count","last")
+
     def __init__(self,sum=0,count=0,last=None):
         self.sum = sum
         self.count = count
@@ -27,8 +27,9 @@ class RunningAverage:
     def get_last(self):
         return self.last
     
+    # Fields are numbers, a shallow copy is enough
     def copy(self):
-        return copy.deepcopy(self)
+        return RunningAverage(self.sum,self.count,self.last)
     
     def __str__(self) -> str:
-        return str(self.get_average())+" ("+str(self.count)+")"
\ No newline at end of file
+        return str(self.get_average())+" ("+str(self.count)+")"
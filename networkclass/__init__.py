@@ -1,6 +1,10 @@
+from .NetworkObserver import NetworkObserver
 from .NestedAverage import NestedAverage
 from .RunningAverage import RunningAverage
 from .NetworkManagerArea import NetworkManagerArea
+from .NetworkAreaStore import NetworkAreaStore
+from .DisjointSet import DisjointSet
 from .NetworkManager import NetworkManager
+from .NetworkScheduler import NetworkScheduler
 from .NetworkEngine import NetworkEngine
 
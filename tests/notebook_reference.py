@@ -0,0 +1,23 @@
+import functools
+import json
+import os
+import cv2
+import numpy as np
+import pandas as pd
+import tqdm
+
+NOTEBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"anomaly_detection.ipynb")
+
+# Functions and classes defined in the cells of anomaly_detection.ipynb, used as references of the library versions
+# compute_stats_table is the compute_stats + convert_stats_to_table pair the notebook called before functions.statistics_utils
+@functools.lru_cache(maxsize=None)
+def load_notebook_functions():
+    with open(NOTEBOOK,encoding="utf-8") as file:
+        cells = json.load(file)["cells"]
+    namespace = {"np": np,"pd": pd,"cv2": cv2,"tqdm": tqdm}
+    for cell in cells:
+        source = "".join(cell["source"])
+        if cell["cell_type"] == "code" and source.lstrip().startswith(("def ","class ")):
+            exec(compile(source,NOTEBOOK,"exec"),namespace)
+    namespace["compute_stats_table"] = lambda info_one_mask,arteries: namespace["convert_stats_to_table"](namespace["compute_stats"](info_one_mask,arteries))
+    return namespace
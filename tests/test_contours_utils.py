@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+from functions.contours_utils import contour_intersect, contour_intersect_reference
+
+# Contour of a filled ellipse drawn on a canvas, as regionGrowing returns them
+def ellipse_contour(rng,center,method,size=128):
+    canvas = np.zeros((size,size),dtype=np.uint8)
+    axes = (int(rng.integers(2,14)),int(rng.integers(2,14)))
+    cv2.ellipse(canvas,(int(center[0]),int(center[1])),axes,float(rng.uniform(0,180)),0,360,255,-1)
+    contours, _ = cv2.findContours(canvas,cv2.RETR_EXTERNAL,method)
+    return contours[0]
+
+# Random walk polyline in the (n,1,2) int32 layout of OpenCV contours
+def polyline_contour(rng,center):
+    steps = rng.integers(-3,4,size=(int(rng.integers(3,40)),2))
+    points = np.clip(np.asarray(center)+np.cumsum(steps,axis=0),0,127)
+    return points.reshape(-1,1,2).astype(np.int32)
+
+# Pair of contours whose centers are close enough for all the outcomes (inclusion, touching, crossing, disjoint) to occur
+def random_pair(rng):
+    center = rng.integers(20,108,size=2)
+    other = np.clip(center+rng.integers(-25,26,size=2),0,127)
+    contours = list()
+    for point in (center,other):
+        kind = rng.integers(3)
+        if kind == 0:
+            contours.append(ellipse_contour(rng,point,cv2.CHAIN_APPROX_NONE))
+        elif kind == 1:
+            contours.append(ellipse_contour(rng,point,cv2.CHAIN_APPROX_SIMPLE))
+        else:
+            contours.append(polyline_contour(rng,point))
+    return contours
+
+@pytest.mark.parametrize("seed",range(6))
+def test_contour_intersect_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(500):
+        cnt_ref, cnt_query = random_pair(rng)
+        assert contour_intersect(cnt_ref,cnt_query) == contour_intersect_reference(cnt_ref,cnt_query)
+
+# Contours of one point and contours whose bounding boxes are one pixel apart are the edge cases of the raster and box tests
+def test_contour_intersect_matches_reference_on_edge_cases():
+    square = np.array([[[10,10]],[[10,20]],[[20,20]],[[20,10]]],dtype=np.int32)
+    for dx in range(-2,3):
+        for dy in range(-2,3):
+            for point in ([21+dx,15+dy],[15+dx,21+dy],[9+dx,9+dy]):
+                single = np.array([[point]],dtype=np.int32)
+                assert contour_intersect(square,single) == contour_intersect_reference(square,single)
+                assert contour_intersect(single,square) == contour_intersect_reference(single,square)
+            shifted = square+np.array([11+dx,dy],dtype=np.int32)
+            assert contour_intersect(square,shifted) == contour_intersect_reference(square,shifted)
@@ -0,0 +1,24 @@
+from networkclass import DisjointSet
+
+def test_union_moves_followers_to_the_new_root():
+    merged = DisjointSet()
+    assert merged.union(1,2) == set()
+    assert merged.union(1,3) == set()
+    assert merged.find(2) == 1 and merged.is_merged(3) and not merged.is_merged(1)
+    # 1 and its members follow it into the set of 0
+    assert merged.union(0,1) == {2,3}
+    assert [merged.find(element) for element in (1,2,3)] == [0,0,0]
+    assert merged.members[0] == {1,2,3}
+
+def test_remove_leaves_the_set():
+    merged = DisjointSet()
+    merged.union(0,1)
+    merged.union(0,2)
+    merged.remove(1)
+    assert merged.find(1) == 1 and not merged.is_merged(1)
+    assert merged.members[0] == {2}
+    # Removing an element that is not merged does nothing
+    merged.remove(5)
+    # A merged element that is merged again leaves its previous set
+    merged.union(3,2)
+    assert merged.find(2) == 3 and merged.members[0] == set()
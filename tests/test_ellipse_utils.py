@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+from functions.ellipse_utils import fit_canvas_ellipses
+from functions.reconstruction_utils import dense_canvases
+from tests.notebook_reference import load_notebook_functions
+
+SHAPE = (24,64,64)
+
+# Contour mask of a tube : ellipse outlines of random size, a slice of one pixel (fewer than 6 contour points) and empty slices
+def make_contour_mask(seed,empty_slices=()):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(SHAPE,dtype=np.uint8)
+    for depth in range(2,22):
+        if depth in empty_slices:
+            continue
+        center = (int(rng.integers(20,44)),int(rng.integers(20,44)))
+        axis = (int(rng.integers(2,10)),int(rng.integers(2,10)))
+        cv2.ellipse(mask[depth],center,axis,int(rng.integers(0,180)),0,360,255,1)
+    mask[12] = 0
+    mask[12,30,30] = 255
+    return mask
+
+@pytest.mark.parametrize("seed",range(5))
+def test_fit_canvas_ellipses_matches_notebook(seed):
+    mask = make_contour_mask(seed)
+    expected = load_notebook_functions()["fit_ellipses"](mask,2,22)
+    assert fit_canvas_ellipses(dense_canvases(mask),2,22) == expected
+
+def test_fit_canvas_ellipses_warns_on_empty_slices(capsys):
+    mask = make_contour_mask(0,empty_slices=(5,17))
+    expected = load_notebook_functions()["fit_ellipses"](mask,2,22)
+    assert capsys.readouterr().out.count("erreur nb contours") == 2
+    with pytest.warns(RuntimeWarning,match="no contour in mask slice") as record:
+        assert fit_canvas_ellipses(dense_canvases(mask),2,22) == expected
+    assert len(record) == 2
+    assert capsys.readouterr().out == ""
+
+def test_fit_canvas_ellipses_too_few_pixels():
+    mask = np.zeros(SHAPE,dtype=np.uint8)
+    mask[3:6,10,10:15] = 255
+    assert load_notebook_functions()["fit_ellipses"](mask,3,6) is None
+    assert fit_canvas_ellipses(dense_canvases(mask),3,6) is None
@@ -0,0 +1,102 @@
+import cv2
+import numpy as np
+import pytest
+from networkclass import NestedAverage
+from functions.exploration_utils import regionSearch, regionSearchReference, regionGrowing, regionGrowingReference, exclusionMask
+from functions.phantom_utils import make_phantom
+
+# Small phantom shared by the tests, its tubes give realistic vessel sections at every depth
+@pytest.fixture(scope="module")
+def phantom():
+    return make_phantom((120,128,128),seed=3)
+
+# Random regionGrowing inputs around the phantom centrelines : (slice,seed,nested intensity,mean radius,alpha,exclusion contours)
+# Exclusion contours are circles around the other vessels of the slice, with sometimes a degenerate contour of 10 points or less
+def sample_cases(image,truth,count,seed):
+    rng = np.random.default_rng(seed)
+    rows = np.concatenate(list(truth['centrelines'].values()))
+    cases = list()
+    for z,x,y,radius in rows[rng.choice(len(rows),size=count,replace=False)]:
+        z = int(z)
+        zslice = image[z]
+        point = (int(np.clip(round(x)+rng.integers(-2,3),0,zslice.shape[1]-1)),int(np.clip(round(y)+rng.integers(-2,3),0,zslice.shape[0]-1)))
+        value = float(zslice[int(round(y)),int(round(x))])*rng.uniform(0.5,1.2)
+        nested_intensity = NestedAverage([value],10,value,1)
+        mean_radius = radius*rng.uniform(0.3,1.5)
+        alpha = rng.uniform(0.3,0.9)
+        exclusion_zone = list()
+        for other_z,other_x,other_y,other_radius in rows[rows[:,0] == z]:
+            if (other_x,other_y) == (x,y) or rng.random() < 0.5:
+                continue
+            canvas = np.zeros(zslice.shape,dtype=np.uint8)
+            cv2.circle(canvas,(int(round(other_x)),int(round(other_y))),int(other_radius)+2,255,-1)
+            contours, _ = cv2.findContours(canvas,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)
+            exclusion_zone.append(contours[0])
+        if rng.random() < 0.2:
+            exclusion_zone.append(np.array([[[point[0]+1,point[1]]],[[point[0]+2,point[1]+1]]],dtype=np.int32))
+        cases.append((zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone))
+    return cases
+
+# Random regionSearch inputs : sparse bright pixels on a small slice, seeds anywhere including the borders (regionSearchWindow),
+# integer, float, negative and tiny search radii and fractional thresholds
+def sample_search_cases(dtype,count,seed):
+    rng = np.random.default_rng(seed)
+    cases = list()
+    for _ in range(count):
+        height, width = rng.integers(8,96,size=2)
+        if np.issubdtype(dtype,np.integer):
+            info = np.iinfo(dtype)
+            zslice = rng.integers(max(info.min,-200),min(info.max,255)+1,size=(height,width)).astype(dtype)
+        else:
+            zslice = (rng.uniform(-50,255,size=(height,width))).astype(dtype)
+        zslice[rng.random((height,width)) < rng.uniform(0.5,1.0)] = 0
+        point = (int(rng.choice([0,width-1,rng.integers(0,width)],p=[0.15,0.15,0.7])),
+                 int(rng.choice([0,height-1,rng.integers(0,height)],p=[0.15,0.15,0.7])))
+        searchRadius = float(rng.choice([rng.integers(-8,12),rng.uniform(-7,12)]))
+        minValue = float(rng.choice([rng.integers(0,250),rng.uniform(0,250)]))
+        cases.append((zslice,point,searchRadius,minValue))
+    return cases
+
+@pytest.mark.parametrize("dtype",[np.uint8,np.int16,np.float32,np.float64])
+def test_regionSearch_matches_reference(dtype):
+    for zslice,point,searchRadius,minValue in sample_search_cases(dtype,1000,0):
+        reference = regionSearchReference(zslice,point,searchRadius,minValue)
+        assert regionSearch(zslice,point,searchRadius,minValue) == reference
+        assert regionSearch(zslice,point,searchRadius,minValue,stats=dict()) == reference
+
+def assert_same_result(result,reference):
+    contour, predicted = result
+    reference_contour, reference_predicted = reference
+    assert predicted == reference_predicted
+    assert np.array_equal(np.asarray(contour),np.asarray(reference_contour))
+
+def test_regionGrowing_matches_reference_without_exclusion_zone(phantom):
+    image, truth = phantom
+    for zslice,point,nested_intensity,mean_radius,alpha,_ in sample_cases(image,truth,150,0):
+        assert_same_result(regionGrowing(zslice,point,nested_intensity,mean_radius,alpha),
+                           regionGrowingReference(zslice,point,nested_intensity,mean_radius,alpha))
+
+def test_regionGrowing_matches_reference_with_exclusion_contours(phantom):
+    image, truth = phantom
+    for zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone in sample_cases(image,truth,100,1):
+        assert_same_result(regionGrowing(zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone),
+                           regionGrowingReference(zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone))
+
+def test_regionGrowing_matches_reference_with_exclusion_mask(phantom):
+    image, truth = phantom
+    for zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone in sample_cases(image,truth,100,2):
+        mask = exclusionMask(zslice.shape,exclusion_zone)
+        assert_same_result(regionGrowing(zslice,point,nested_intensity,mean_radius,alpha,mask),
+                           regionGrowingReference(zslice,point,nested_intensity,mean_radius,alpha,exclusion_zone))
+
+# A low threshold connects the vessels to the body, the growth reaches the image borders and the aorta guard drops the area
+def test_regionGrowing_matches_reference_on_body_sized_components(phantom):
+    image, truth = phantom
+    rng = np.random.default_rng(4)
+    for z in rng.choice(len(image),size=20,replace=False):
+        zslice = image[z]
+        point = (zslice.shape[1]//2,zslice.shape[0]//2)
+        nested_intensity = NestedAverage([8],10,8,1)
+        for mean_radius in (-1,5):
+            assert_same_result(regionGrowing(zslice,point,nested_intensity,mean_radius,0.6),
+                               regionGrowingReference(zslice,point,nested_intensity,mean_radius,0.6))
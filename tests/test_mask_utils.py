@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from functions.mask_utils import SparseMasks, save_sparse_masks
+
+SHAPE = (6,16,16)
+SQUARE = np.array([[2,2],[2,5],[5,5],[5,2]],dtype=np.int16)
+
+@pytest.fixture
+def sparse_masks(tmp_path):
+    branches = {
+        0: ([4,3],[0,4,8],np.concatenate([SQUARE,SQUARE+3])),
+        1: ([],[0],np.zeros((0,2),dtype=np.int16)),
+    }
+    path = tmp_path / "mask_list.npz"
+    save_sparse_masks(path,SHAPE,branches)
+    with SparseMasks(path) as masks:
+        yield masks
+
+def test_get_depth_range(sparse_masks):
+    assert sparse_masks.get_depth_range(0) == (3,4)
+    assert sparse_masks.get_depth_range(1) is None
+
+def test_densify_returns_a_read_only_cached_volume(sparse_masks):
+    mask = sparse_masks[0]
+    assert mask.shape == SHAPE and mask[4,2,2] == 255 and mask[3,5,5] == 255
+    with pytest.raises(ValueError):
+        mask[0,0,0] = 1
+    assert sparse_masks[0] is mask
+    assert not np.any(sparse_masks[1])
@@ -0,0 +1,81 @@
+import copy
+import numpy as np
+import pytest
+from networkclass import NestedAverage
+
+# NestedAverage before the ring buffer, kept as reference
+class NestedAverageReference:
+    def __init__(self,numbers=list(),limit=10,average=0,count=0):
+        self.limit = limit
+        self.average = average
+        self.count = count
+        self.numbers = numbers
+        if self.average == 0 and self.count == 0:
+            self.numbers = []
+
+    def add_number(self, number):
+        self.numbers.append(number)
+        if self.count > self.limit:
+            self.numbers.pop(0)
+        else:
+            self.count += 1
+        self.average = sum(self.numbers)/self.count
+
+    def get_average(self):
+        return self.average
+
+    def get_last(self):
+        return self.numbers[-1]
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+def make_numbers(kind,rng,count=60):
+    if kind == "int":
+        return [int(value) for value in rng.integers(0,300,count)]
+    if kind == "int16":
+        return list(rng.integers(0,300,count).astype(np.int16))
+    if kind == "float":
+        return [float(value) for value in rng.uniform(0,300,count)]
+    if kind == "float32":
+        return list(rng.uniform(0,300,count).astype(np.float32))
+    # Integers and floats mixed, windows go from integers only to floats and back
+    return [float(rng.uniform(0,300)) if index % 25 in range(10,15) else int(rng.integers(0,300)) for index in range(count)]
+
+def assert_same(nested_average,reference):
+    assert nested_average.get_average() == reference.get_average()
+    assert type(nested_average.get_average()) is type(reference.get_average())
+    assert nested_average.count == reference.count
+    assert nested_average.numbers == reference.numbers
+    if reference.numbers:
+        assert nested_average.get_last() == reference.get_last()
+
+@pytest.mark.parametrize("limit",[0,1,10])
+@pytest.mark.parametrize("kind",["int","int16","float","float32","mixed"])
+def test_add_number_matches_reference(limit,kind):
+    rng = np.random.default_rng(limit)
+    nested_average, reference = NestedAverage(limit=limit), NestedAverageReference(limit=limit)
+    copies = []
+    for index,number in enumerate(make_numbers(kind,rng)):
+        nested_average.add_number(number)
+        reference.add_number(number)
+        assert_same(nested_average,reference)
+        if index % 7 == 3:
+            copies.append((nested_average.copy(),reference.copy()))
+    # Copies are independent of the original and of each other
+    for copied,copied_reference in copies:
+        for number in make_numbers(kind,rng,count=2*limit+3):
+            copied.add_number(number)
+            copied_reference.add_number(number)
+            assert_same(copied,copied_reference)
+    assert_same(nested_average,reference)
+
+@pytest.mark.parametrize("kind",["int16","float32"])
+def test_initial_numbers_match_reference(kind):
+    rng = np.random.default_rng(0)
+    first = make_numbers(kind,rng,count=1)[0]
+    nested_average, reference = NestedAverage([first],10,first,1), NestedAverageReference([first],10,first,1)
+    for number in make_numbers(kind,rng):
+        nested_average.add_number(number)
+        reference.add_number(number)
+        assert_same(nested_average,reference)
@@ -0,0 +1,85 @@
+import pickle
+import numpy as np
+import pytest
+from networkclass import NetworkAreaStore, NetworkManager
+
+def square(x,y,size):
+    return np.array([[[x,y]],[[x,y+size]],[[x+size,y+size]],[[x+size,y]]],dtype=np.int32)
+
+# Store of count areas small enough to grow its buffers several times
+def make_store(count=50):
+    store = NetworkAreaStore(4,8)
+    for i in range(count):
+        store.append(100-i,i % 3,square(i,2*i,1+i % 5),i % 4 == 0)
+    return store
+
+def assert_same_areas(store,reference):
+    assert len(store) == len(reference)
+    for area,reference_area in zip(store.get_areas(),reference.get_areas()):
+        assert (area.depth,area.branch_id,area.predicted) == (reference_area.depth,reference_area.branch_id,reference_area.predicted)
+        assert np.array_equal(area.contour,reference_area.contour)
+
+def test_append_and_views():
+    store = make_store()
+    area = store.get_areas()[7]
+    assert (area.depth,area.branch_id,area.predicted) == (93,1,False)
+    assert area.contour.dtype == np.int32 and area.contour.shape == (4,1,2)
+    assert np.array_equal(area.contour,square(7,14,3))
+
+def test_save_load_round_trip(tmp_path):
+    store = make_store()
+    store.save(tmp_path / "store.npz")
+    assert_same_areas(NetworkAreaStore.load(tmp_path / "store.npz"),store)
+
+# Loaded or memory mapped buffers are read-only and exactly full, appending has to grow them into new arrays
+@pytest.mark.parametrize("count",[0,1,50])
+def test_append_after_from_buffers(count):
+    reference = make_store(count)
+    buffers = {key: value.copy() for key,value in reference.get_buffers().items()}
+    for value in buffers.values():
+        value.setflags(write=False)
+    store = NetworkAreaStore.from_buffers(buffers)
+    for i in range(count,count+20):
+        store.append(100-i,i % 3,square(i,2*i,1+i % 5),i % 4 == 0)
+        reference.append(100-i,i % 3,square(i,2*i,1+i % 5),i % 4 == 0)
+    assert_same_areas(store,reference)
+    assert all(not value.flags.writeable for value in buffers.values())
+
+def test_pickle_keeps_areas_and_views():
+    store = make_store()
+    areas = store.get_areas()
+    loaded_store, loaded_areas = pickle.loads(pickle.dumps((store,areas),protocol=5))
+    assert_same_areas(loaded_store,store)
+    assert all(area.store is loaded_store for area in loaded_areas)
+    assert len(loaded_store.get_buffers()['points']) == len(store.get_buffers()['points'])
+
+# Removed areas stay in the store until compact, which keeps the views held by the network and the branch index valid
+def test_compact_drops_removed_areas():
+    network_manager = NetworkManager(120)
+    for depth in range(100,60,-1):
+        network_manager.append_to_network(depth,0,square(depth % 20,5,4))
+    short_branch = network_manager.get_new_branch(0)
+    for depth in range(90,80,-1):
+        network_manager.append_to_network(depth,short_branch,square(50,depth % 30,8))
+    branch,offset = network_manager.get_branch(0)
+    contours = [area.contour for area in branch]
+    points = len(network_manager.store.get_buffers()['points'])
+    network_manager.sanitize()
+    assert network_manager.branch_list == [0]
+    assert len(network_manager.store) == 40
+    assert len(network_manager.store.get_buffers()['points']) == points-10*4
+    branch,compacted_offset = network_manager.get_branch(0)
+    assert compacted_offset == offset
+    assert all(np.array_equal(area.contour,contour) for area,contour in zip(branch,contours))
+    assert [area.index for area in network_manager.network[90]] == [network_manager.get_area(90,0).index]
+    network_manager.append_to_network(60,0,square(1,1,2))
+    assert np.array_equal(network_manager.get_area(60,0).contour,square(1,1,2))
+    assert len(network_manager.store) == 41
+
+def test_compact_to_empty_store_can_grow_again():
+    store = make_store(10)
+    store.compact([])
+    assert len(store) == 0
+    store.append(3,0,square(0,0,2))
+    store.append(2,0,square(1,1,2))
+    assert [area.depth for area in store.get_areas()] == [3,2]
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+from networkclass import NetworkEngine, NetworkManager
+from functions.contours_utils import contour_intersect, merge_contours
+from functions.benchmark_utils import make_synthetic_network, make_phantom_engine
+from functions.phantom_utils import make_phantom
+
+# merge_network before the disjoint set rewrite (one pass, merge lists scanned with list.index), kept to check the new version
+def merge_network_reference(network_engine,network_to_merge):
+    net = network_to_merge.network
+    offset_list = list()
+    for i in range(len(network_to_merge.branch_length)):
+        _,offset = network_to_merge.get_branch(i)
+        offset_list.append(offset)
+
+    merged_branch_list = list()
+    merged_to_branch_list = list()
+    result_network_manager = NetworkManager(len(network_engine.image),network_to_merge.branch_list,network_to_merge.last_branch_id)
+
+    for depth in range(len(net)):
+        nodes = net[depth]
+        to_merge = dict()
+        for ida in range(len(nodes)):
+            to_merge[ida] = set()
+        last_merged = True
+        while last_merged:
+            last_merged = False
+            for ida in range(len(nodes)):
+                if nodes[ida].branch_id in merged_branch_list:
+                    merged_to_id = merged_to_branch_list[merged_branch_list.index(nodes[ida].branch_id)]
+                    merge_to_local_idxx = next((i for i, item in enumerate(nodes) if item.branch_id == merged_to_id), None)
+                    if merge_to_local_idxx is not None:
+                        if ida not in to_merge[merge_to_local_idxx]:
+                            last_merged = True
+                            to_merge[merge_to_local_idxx].add(ida)
+                    else:
+                        merged_branch_list_idx = merged_branch_list.index(nodes[ida].branch_id)
+                        merged_to_branch_list.pop(merged_branch_list_idx)
+                        merged_branch_list.pop(merged_branch_list_idx)
+                else:
+                    for idb in range(len(nodes)):
+                        already_merged_to_idx = next((i for i, item in enumerate(merged_branch_list) if item == nodes[idb].branch_id), None)
+                        if (ida != idb
+                        and (already_merged_to_idx == None or
+                             (offset_list[merged_to_branch_list[already_merged_to_idx]] < offset_list[nodes[ida].branch_id]
+                              or (offset_list[merged_to_branch_list[already_merged_to_idx]] == offset_list[nodes[ida].branch_id]
+                                  and nodes[ida].branch_id < merged_to_branch_list[already_merged_to_idx])))
+                        and contour_intersect(nodes[ida].contour,nodes[idb].contour)
+                        and (offset_list[nodes[ida].branch_id] > offset_list[nodes[idb].branch_id] or
+                        (nodes[ida].branch_id < nodes[idb].branch_id and offset_list[nodes[ida].branch_id] == offset_list[nodes[idb].branch_id]))):
+                            last_merged = True
+                            if already_merged_to_idx != None:
+                                merged_branch_list_idx = merged_branch_list.index(nodes[idb].branch_id)
+                                merged_to_branch_list.pop(merged_branch_list_idx)
+                                merged_branch_list.pop(merged_branch_list_idx)
+                            merged_branch_list.append(nodes[idb].branch_id)
+                            merged_to_branch_list.append(nodes[ida].branch_id)
+                            to_merge[ida].add(idb)
+                            if len(to_merge[idb]) > 0:
+                                to_merge[ida].update(to_merge[idb])
+                                to_merge[idb].clear()
+                            branch_to_force_merge = list()
+                            for i in range(len(merged_to_branch_list)):
+                                if(nodes[idb].branch_id == merged_to_branch_list[i]):
+                                    merged_to_branch_list[i] = nodes[ida].branch_id
+                                    branch_to_force_merge.append(merged_branch_list[i])
+                            for branch in branch_to_force_merge:
+                                local_branch_idb = next((i for i, item in enumerate(nodes) if item.branch_id == branch), None)
+                                if local_branch_idb is not None:
+                                    to_merge[ida].add(local_branch_idb)
+
+        for key, value in to_merge.items():
+            if len(value) == 0:
+                if nodes[key].branch_id not in merged_branch_list:
+                    result_network_manager.append_to_network(depth,nodes[key].branch_id,nodes[key].contour,nodes[key].predicted)
+            else:
+                contours_to_merge = [node.contour for index,node in enumerate(nodes) if index in value]
+                contours_to_merge.append(nodes[key].contour)
+                contour = merge_contours(network_engine.image[0],contours_to_merge)
+                result_network_manager.append_to_network(depth,nodes[key].branch_id,contour)
+    return result_network_manager
+
+# (branch id, contour, predicted) of the areas of each depth, in network order
+def network_areas(network_manager):
+    return [[(area.branch_id,area.contour.tobytes(),area.predicted) for area in areas] for areas in network_manager.network]
+
+# The reference merge is called until the network does not change anymore, returns the network and the number of calls
+def merge_reference_fixpoint(network_engine,network_manager,max_calls=20):
+    for calls in range(1,max_calls+1):
+        merged = merge_network_reference(network_engine,network_manager)
+        if network_areas(merged) == network_areas(network_manager):
+            return merged,calls
+        network_manager = merged
+    raise AssertionError("reference merge did not reach a fixpoint")
+
+@pytest.mark.parametrize("seed",range(20))
+def test_merge_network_reaches_the_reference_fixpoint_in_one_call(seed):
+    shape = (30,48,48)
+    network_manager = make_synthetic_network(shape,branch_count=6,radius_range=(3,8),seed=seed)
+    network_engine = NetworkEngine(np.zeros(shape,dtype=np.uint8),shape[0]-1)
+    reference,_ = merge_reference_fixpoint(network_engine,network_manager)
+    merged = network_engine.merge_network(network_manager)
+    assert network_areas(merged) == network_areas(reference)
+    assert merged.branch_list == reference.branch_list
+    # The result is a fixpoint, merging it again changes nothing
+    assert network_areas(network_engine.merge_network(merged)) == network_areas(merged)
+
+# Workers only explore ahead, the network has to be the one of the serial run, whether they read a memory map or a shared copy
+@pytest.mark.parametrize("memory_map",[False,True])
+def test_run_with_workers_matches_serial_run(tmp_path,memory_map):
+    image,truth = make_phantom((200,128,128),seed=1,out=tmp_path / "phantom.npy" if memory_map else None)
+    serial = make_phantom_engine(image,truth)
+    serial.run()
+    parallel = make_phantom_engine(image,truth,workers=2)
+    parallel.speculation_depth = 16
+    parallel.run()
+    assert parallel.scheduler is None
+    assert network_areas(parallel.network_manager) == network_areas(serial.network_manager)
+    assert parallel.network_manager.branch_list == serial.network_manager.branch_list
+
+# A run resumed from a checkpoint taken at depth 90 ends with the network of the uninterrupted run, with and without coarse to fine tracking
+@pytest.mark.parametrize("skip_step",[0,3])
+def test_resume_matches_uninterrupted_run(tmp_path,skip_step):
+    image,truth = make_phantom((200,128,128),seed=1)
+    path = tmp_path / "engine.pkl"
+    uninterrupted = make_phantom_engine(image,truth)
+    uninterrupted.skip_step = skip_step
+    uninterrupted.checkpoint_path = path
+    # Only one checkpoint is written, after depth 91 is explored
+    uninterrupted.checkpoint_interval = uninterrupted.current_depth-90
+    uninterrupted.run()
+
+    resumed = NetworkEngine.resume(path,image)
+    assert resumed.current_depth == 90 and len(resumed.stack) == 0
+    assert resumed.skip_step == skip_step
+    resumed.checkpoint_path = None
+    resumed.run()
+    assert network_areas(resumed.network_manager) == network_areas(uninterrupted.network_manager)
+    assert resumed.network_manager.branch_list == uninterrupted.network_manager.branch_list
+    assert resumed.network_manager.branch_length == uninterrupted.network_manager.branch_length
+    assert resumed.branch_depth == uninterrupted.branch_depth
+    assert ([nested_intensity.numbers for nested_intensity in resumed.network_manager.branch_nested_intensity]
+            == [nested_intensity.numbers for nested_intensity in uninterrupted.network_manager.branch_nested_intensity])
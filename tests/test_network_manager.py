@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from networkclass import NetworkManager
+
+CONTOUR = np.array([[[1,1]],[[1,4]],[[4,4]],[[4,1]]],dtype=np.int32)
+
+def test_remove_from_network_keeps_the_branch_index_in_sync():
+    network_manager = NetworkManager(10)
+    for depth in (9,8,7):
+        network_manager.append_to_network(depth,0,CONTOUR)
+    network_manager.append_to_network(8,0,CONTOUR,True)
+    area = network_manager.remove_from_network(8,0)
+    assert area.depth == 8 and not area.predicted
+    assert network_manager.get_area(8,0).predicted
+    assert [area.predicted for area in network_manager.network[8]] == [True]
+    network_manager.remove_from_network(8,0)
+    assert network_manager.network[8] == []
+    assert list(network_manager.get_branch_depths(0)) == [9]
+
+# An area missing from the index is an index desync, it raises as list.remove did on the network lists
+def test_remove_from_network_raises_on_missing_area():
+    network_manager = NetworkManager(10)
+    network_manager.append_to_network(9,0,CONTOUR)
+    with pytest.raises(ValueError):
+        network_manager.remove_from_network(8,0)
+    with pytest.raises(ValueError):
+        network_manager.remove_from_network(9,1)
+    assert len(network_manager.network[9]) == 1
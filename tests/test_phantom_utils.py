@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from functions.phantom_utils import make_centrelines
+
+SHAPE = (800,512,512)
+
+def bottom_arteries(centrelines):
+    return [centreline[-1] for centreline in centrelines.values() if centreline[-1,0] == 0]
+
+@pytest.mark.parametrize("bifurcation_levels",[0,1,2])
+def test_sparse_levels(bifurcation_levels):
+    centrelines,_,_,_ = make_centrelines(SHAPE,np.random.default_rng(0),30,bifurcation_levels)
+    assert len(bottom_arteries(centrelines)) == 2**bifurcation_levels
+
+# Above 2 levels, the 2**bifurcation_levels arteries of the last slice are apart and thick enough to be tracked as separate branches
+@pytest.mark.parametrize("bifurcation_levels",[3,4,5])
+def test_dense_levels(bifurcation_levels):
+    centrelines,parents,_,_ = make_centrelines(SHAPE,np.random.default_rng(0),30,bifurcation_levels)
+    rows = np.array(bottom_arteries(centrelines))
+    assert len(rows) == 2**bifurcation_levels
+    xs = np.sort(rows[:,1])
+    assert np.min(np.diff(xs)) > 2*rows[:,3].max()
+    assert rows[:,3].min() >= 4.5
+    # Every artery below the knee has a parent that ends where it starts
+    for branch_id,centreline in centrelines.items():
+        parent = parents[branch_id]
+        if parent not in (None,0):
+            assert centrelines[parent][-1,0] == centreline[0,0]+1
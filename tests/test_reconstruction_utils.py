@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from functions.benchmark_utils import make_phantom_engine
+from functions.mask_utils import SparseMasks
+from functions.phantom_utils import make_phantom
+from functions.reconstruction_utils import reconstruct_networks
+from tests.notebook_reference import load_notebook_functions
+
+@pytest.fixture(scope="module")
+def tracked_phantom(tmp_path_factory):
+    image,truth = make_phantom((200,128,128),seed=1)
+    network_engine = make_phantom_engine(image,truth)
+    network_engine.run()
+    path = tmp_path_factory.mktemp("masks") / "mask_list.npz"
+    network_engine.network_manager.export_sparse(path,image.shape,include_debug=False)
+    return image,network_engine.network_manager.generate3DImages(image.shape)[:-1],path
+
+def assert_same_networks(expected,result):
+    for expected_network,network in zip(expected[:4],result[:4]):
+        np.testing.assert_array_equal(network,expected_network)
+    assert len(result[4]) == len(expected[4])
+    for expected_df,df in zip(expected[4],result[4]):
+        pd.testing.assert_frame_equal(df,expected_df,check_dtype=False)
+
+@pytest.mark.parametrize("sparse",[False,True])
+def test_reconstruct_networks_matches_notebook(tracked_phantom,sparse):
+    image,mask_list,path = tracked_phantom
+    assert len(mask_list) > 1
+    expected = load_notebook_functions()["constructing_all_networks"](image,mask_list,0,len(mask_list),"z",True,True,True,True)
+    if sparse:
+        with SparseMasks(path) as sparse_masks:
+            result = reconstruct_networks(image,sparse_masks,0,len(mask_list),"z",True,True,True,True)
+    else:
+        result = reconstruct_networks(image,mask_list,0,len(mask_list),"z",True,True,True,True)
+    assert_same_networks(expected,result)
+
+def test_reconstruct_networks_matches_notebook_on_a_subrange(tracked_phantom):
+    image,mask_list,_ = tracked_phantom
+    expected = load_notebook_functions()["constructing_all_networks"](image,mask_list,1,len(mask_list),"proportion_calcification",True,True,True,True)
+    result = reconstruct_networks(image,mask_list,1,len(mask_list),"proportion_calcification",True,True,True,True)
+    assert_same_networks(expected,result)
+
+# With one mask the notebook builds every network whatever the flags, reconstruct_networks only builds the requested ones
+def test_reconstruct_networks_single_mask(tracked_phantom):
+    image,mask_list,_ = tracked_phantom
+    expected = load_notebook_functions()["constructing_all_networks"](image,mask_list,0,1)
+    assert_same_networks(expected,reconstruct_networks(image,mask_list,0,1,"z",True,True,True,True))
+    result = reconstruct_networks(image,mask_list,0,1)
+    assert result[:4] == (None,None,None,None)
+    assert len(result[4]) == 1
+    pd.testing.assert_frame_equal(result[4][0],expected[4][0],check_dtype=False)
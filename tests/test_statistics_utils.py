@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+from functions.statistics_utils import compute_slice_statistics, compute_stats_table
+from tests.notebook_reference import load_notebook_functions
+
+SHAPE = (12,48,48)
+
+# info_one_mask of construct_ellipses_network for a mask of slices rangemin to rangemax-1, empty_slices have an empty lumen
+def make_info(rng,rangemin,rangemax,empty_slices=()):
+    ellipses_3d = np.zeros(SHAPE,dtype=np.float64)
+    list_params = []
+    for depth in range(rangemin,rangemax):
+        params = ((float(rng.uniform(16,32)),float(rng.uniform(16,32))),(float(rng.uniform(3,8)),float(rng.uniform(3,8))),float(rng.uniform(0,180)))
+        list_params.append(params)
+        if depth not in empty_slices:
+            zslice = np.zeros(SHAPE[1:],dtype=np.uint8)
+            cv2.ellipse(zslice,(int(params[0][0]),int(params[0][1])),(int(params[1][0]),int(params[1][1])),int(params[2]),0,360,255,-1)
+            ellipses_3d[depth] = zslice
+    list_ab = [params[1][0]*params[1][1] for params in list_params]
+    return {'rangemin': rangemin,
+            'rangemax': rangemax,
+            'ellipses_3D': ellipses_3d,
+            'list_ab': list_ab,
+            'list_ab_predicted': [ab*rng.uniform(0.8,1.2) for ab in list_ab],
+            'list_params_ellipses': list_params}
+
+# Pixel values around the calcification threshold, 250 is neither kept nor counted as calcification
+def make_arteries(rng,info):
+    image = rng.integers(100,250,size=SHAPE).astype(np.int16)
+    threshold = rng.random(SHAPE) < 0.2
+    image[threshold] = rng.choice([249,250,251,300],size=int(np.count_nonzero(threshold)))
+    return np.where(info['ellipses_3D'] == 255,image,0)
+
+@pytest.mark.parametrize("seed",range(5))
+def test_compute_stats_table_matches_notebook(seed):
+    rng = np.random.default_rng(seed)
+    info = make_info(rng,2,10)
+    arteries = make_arteries(rng,info)
+    expected = load_notebook_functions()["compute_stats_table"](info,arteries)
+    pd.testing.assert_frame_equal(compute_stats_table(info,arteries),expected,check_dtype=False)
+
+# A slice with calcifications only has no mean nor sd, in the notebook and in the library
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_compute_stats_table_calcified_slice():
+    rng = np.random.default_rng(0)
+    info = make_info(rng,2,10)
+    arteries = make_arteries(rng,info)
+    arteries[5] = np.where(info['ellipses_3D'][5] == 255,300,0)
+    expected = load_notebook_functions()["compute_stats_table"](info,arteries)
+    df = compute_stats_table(info,arteries)
+    assert np.isnan(df['mean'][3]) and df['proportion_calcification'][3] == 1
+    pd.testing.assert_frame_equal(df,expected,check_dtype=False)
+
+# The notebook raises ZeroDivisionError on a slice without lumen pixel, the library gives NaN for this slice
+# Deviations and z use the mean of all slices and are NaN, as the notebook computes them
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_compute_stats_table_empty_slice():
+    rng = np.random.default_rng(1)
+    info = make_info(rng,2,10,empty_slices=(4,))
+    arteries = make_arteries(rng,info)
+    notebook = load_notebook_functions()
+    with pytest.raises(ZeroDivisionError):
+        notebook["compute_stats_table"](info,arteries)
+
+    df = compute_stats_table(info,arteries)
+    assert list(df['index']) == list(range(2,10))
+    for column in ('mean','sd','proportion_calcification'):
+        assert np.isnan(df[column][2])
+    for column in ('deviation_mean','deviation_sd','z'):
+        assert df[column].isna().all()
+    for row,depth in enumerate(range(2,10)):
+        if depth == 4:
+            continue
+        pixels = list(arteries[depth][info['ellipses_3D'][depth] == 255].astype(np.float64))
+        descriptor = notebook["Descriptor"](depth,pixels,info['list_ab'][row],info['list_ab_predicted'][row],info['list_params_ellipses'][row])
+        assert df['mean'][row] == pytest.approx(descriptor.get_mean())
+        assert df['sd'][row] == pytest.approx(descriptor.get_sd())
+        assert df['proportion_calcification'][row] == descriptor.get_proportion_calcification()
+
+def test_compute_slice_statistics_range():
+    rng = np.random.default_rng(2)
+    info = make_info(rng,0,12)
+    arteries = make_arteries(rng,info)
+    df = compute_slice_statistics(arteries,info['ellipses_3D'],3,7,info['list_ab'],info['list_ab_predicted'],info['list_params_ellipses'])
+    assert list(df['index']) == [3,4,5,6]
+    assert list(df['ab']) == info['list_ab'][:4]